@@ -0,0 +1,244 @@
+"""
+Builds synthetic node graphs of a given size and shape, either live in the
+stand-in nuke module or as .nk files for the offline script parser. Each
+live builder clears the script, builds about count nodes, runs the script
+load callbacks and returns the Write nodes.
+
+Shapes:
+    chain       Read -> count nodes in a line -> Write
+    fan         one Read feeding count parallel branches, merged into one Write
+    nested      chains inside Groups nested up to depth levels deep
+    cycles      a chain where every tenth node also reads from further down
+    many_writes count / 3 separate Read -> Grade -> Write branches
+    gizmos      a chain of gizmo instances
+
+Every shape also has a Viewer and a BackdropNode every hundred nodes, for
+clear_nodes_by_name.
+"""
+import os
+
+import nuke
+
+READ_FILE = '[file dirname [value root.name]]/plates/[value root.shot]/plate.%04d.exr'
+WRITE_FILE = '[file dirname [value root.name]]/renders/%s/%s.%%04d.exr'
+FILTERS = ('Grade', 'Blur', 'Transform', 'ColorCorrect', 'Saturation')
+
+def _read(name, parent=None):
+    return nuke.Node('Read', name, parent=parent, file=READ_FILE,
+                     first=1, last=100)
+
+def _write(name, inputs, parent=None):
+    return nuke.Node('Write', name, inputs, parent,
+                     file=WRITE_FILE % (name, name), views='left',
+                     beforeRender='', beforeFrameRender='',
+                     afterFrameRender='', afterRender='')
+
+def _clutter(count, parent=None):
+    for i in range(count // 100):
+        nuke.Node('Viewer', 'Viewer%d' % (i + 1,), parent=parent)
+        nuke.Node('BackdropNode', 'Backdrop%d' % (i + 1,), parent=parent)
+
+def _chain(count, head, parent=None, prefix='', cls=None):
+    node = head
+    nodes = []
+    for i in range(count):
+        node_class = cls or FILTERS[i % len(FILTERS)]
+        node = nuke.Node(node_class, '%s%s%d' % (prefix, node_class, i + 1),
+                         [node], parent)
+        nodes.append(node)
+    return nodes
+
+def _loaded(writes):
+    nuke.scriptLoaded()
+    return writes
+
+def chain(count):
+    nuke.scriptClear()
+    nuke.root()
+    _clutter(count)
+    nodes = _chain(count - 2, _read('Read1'))
+    return _loaded([_write('Write1', [nodes[-1]])])
+
+def fan(count):
+    nuke.scriptClear()
+    nuke.root()
+    _clutter(count)
+    read = _read('Read1')
+    branches = [nuke.Node('Grade', 'Grade%d' % (i + 1,), [read])
+                for i in range(count - 3)]
+    merge = nuke.Node('Merge2', 'Merge1', branches)
+    return _loaded([_write('Write1', [merge])])
+
+def _group(name, head, parent, size):
+    group = nuke.Node('Group', name, [head], parent)
+    nodes = _chain(size, nuke.Node('Input', 'Input1', parent=group), group)
+    return group, nodes[-1]
+
+def nested(count, depth=10):
+    """
+    Stacks of Groups nested depth levels deep, each Group holding a short
+    chain and the next Group down, with the stacks in a line.
+    """
+    nuke.scriptClear()
+    nuke.root()
+    _clutter(count)
+    size = max(1, count // (depth * 10) - 3)
+    head = _read('Read1')
+    made = 2
+    stacks = 0
+    while made < count:
+        stacks += 1
+        outer, last = _group('Group%d' % (stacks,), head, None, size)
+        parent = outer
+        for level in range(1, depth):
+            group, inner_last = _group('Group%d_%d' % (stacks, level), last,
+                                       parent, size)
+            nuke.Node('Output', 'Output1', [group], parent)
+            parent, last = group, inner_last
+        nuke.Node('Output', 'Output1', [last], parent)
+        made += depth * (size + 3)
+        head = outer
+    return _loaded([_write('Write1', [head])])
+
+def cycles(count, span=10):
+    nuke.scriptClear()
+    nuke.root()
+    _clutter(count)
+    nodes = _chain(count - 2, _read('Read1'))
+    for i in range(0, len(nodes) - span, span):
+        nodes[i].setInput(1, nodes[i + span])
+    return _loaded([_write('Write1', [nodes[-1]])])
+
+def many_writes(count):
+    nuke.scriptClear()
+    nuke.root()
+    _clutter(count)
+    writes = []
+    for i in range(max(1, count // 3)):
+        read = _read('Read%d' % (i + 1,))
+        grade = nuke.Node('Grade', 'Grade%d' % (i + 1,), [read])
+        writes.append(_write('Write%d' % (i + 1,), [grade]))
+    return _loaded(writes)
+
+def gizmos(count, cls='MyGlow'):
+    nuke.scriptClear()
+    nuke.root()
+    _clutter(count)
+    node = _read('Read1')
+    for i in range(count - 2):
+        node = nuke.Gizmo(cls, '%s%d' % (cls, i + 1), [node], size=i)
+    return _loaded([_write('Write1', [node])])
+
+SHAPES = dict(chain=chain, fan=fan, nested=nested, cycles=cycles,
+              many_writes=many_writes, gizmos=gizmos)
+
+#
+#   .nk files for the offline parser.
+#
+
+def _nk_node(lines, cls, knobs, indent=''):
+    lines.append('%s%s {\n' % (indent, cls))
+    for name, value in knobs:
+        lines.append('%s %s %s\n' % (indent, name, value))
+    lines.append('%s}\n' % (indent,))
+
+def _nk_escape(value):
+    return '"%s"' % (value.replace('[', '\\['),)
+
+def write_nk(path, count, shape='chain', gizmo='MyGlow'):
+    """
+    Writes a .nk file of about count nodes in the given shape: 'chain',
+    'fan', 'many_writes' or 'gizmos'. Returns the Write node names.
+    """
+    lines = ['#! /usr/local/Nuke8.0v5/libnuke-8.0.5.so -nx\n',
+             'version 8.0 v5\n']
+    _nk_node(lines, 'Root', [('inputs', '0'), ('name', path),
+                             ('first_frame', '1'), ('last_frame', '100'),
+                             ('shot', 'sh010')])
+    read = [('inputs', '0'), ('file', _nk_escape(READ_FILE)),
+            ('first', '1'), ('last', '100')]
+
+    def write(name):
+        _nk_node(lines, 'Write', [('file', _nk_escape(WRITE_FILE % (name, name))),
+                                  ('name', name)])
+
+    writes = []
+    if shape == 'many_writes':
+        for i in range(max(1, count // 3)):
+            _nk_node(lines, 'Read', read + [('name', 'Read%d' % (i + 1,))])
+            _nk_node(lines, 'Grade', [('white', '1.1'),
+                                      ('name', 'Grade%d' % (i + 1,))])
+            writes.append('Write%d' % (i + 1,))
+            write(writes[-1])
+    elif shape == 'fan':
+        _nk_node(lines, 'Read', read + [('name', 'Read1')])
+        lines.append('set Nread [stack 0]\n')
+        branches = count - 3
+        for i in range(branches):
+            if i:
+                lines.append('push $Nread\n')
+            _nk_node(lines, 'Grade', [('white', '1.1'),
+                                      ('name', 'Grade%d' % (i + 1,))])
+        _nk_node(lines, 'Merge2', [('inputs', '%d' % (branches,)),
+                                   ('name', 'Merge1')])
+        writes.append('Write1')
+        write('Write1')
+    elif shape in ('chain', 'gizmos'):
+        _nk_node(lines, 'Read', read + [('name', 'Read1')])
+        for i in range(count - 2):
+            if shape == 'gizmos':
+                _nk_node(lines, gizmo, [('size', '%d' % (i,)),
+                                        ('name', '%s%d' % (gizmo, i + 1))])
+            else:
+                cls = FILTERS[i % len(FILTERS)]
+                _nk_node(lines, cls, [('name', '%s%d' % (cls, i + 1))])
+        writes.append('Write1')
+        write('Write1')
+    else:
+        raise ValueError('Unknown shape: %s' % (shape,))
+
+    f = open(path, 'w')
+    try:
+        f.writelines(lines)
+    finally:
+        f.close()
+    return writes
+
+GIZMO = '''#! /usr/local/Nuke8.0v5/libnuke-8.0.5.so -nx
+version 8.0 v5
+Gizmo {
+ inputs 1
+ help "A benchmark gizmo"
+ addUserKnob {20 User}
+ addUserKnob {7 size}
+ size 5
+}
+ Input {
+  inputs 0
+  name Input1
+ }
+ Blur {
+  size {{parent.size}}
+  name Blur1
+ }
+ Glow2 {
+  size {{parent.size*2}}
+  name Glow1
+ }
+ Output {
+  name Output1
+ }
+end_group
+'''
+
+def write_gizmo(directory, cls='MyGlow'):
+    """
+    Writes a small .gizmo file for the given class and returns its path.
+    """
+    path = os.path.join(directory, '%s.gizmo' % (cls,))
+    f = open(path, 'w')
+    try:
+        f.write(GIZMO)
+    finally:
+        f.close()
+    return path
@@ -0,0 +1,360 @@
+"""
+Times zync_nuke's graph functions on synthetic scripts of 1k, 10k and 100k
+nodes, outside of Nuke. zync_nuke.py is copied into a temporary directory
+with a generated config_nuke.py, and imported against the stand-in nuke,
+nukescripts and zync modules in benchmarks/stubs.
+
+Usage:
+    python benchmarks/run.py                    # run everything
+    python benchmarks/run.py --sizes 1000,10000 --only select_deps
+    python benchmarks/run.py --check            # fail on regressions
+    python benchmarks/run.py --save-thresholds 5
+
+Each case reports the best time over --repeat runs and, on Python 3, the
+peak memory allocated during a separate run. --check compares them to
+benchmarks/thresholds.json and exits with 1 if any case is over.
+"""
+from __future__ import print_function
+
+import gc
+import json
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+STUBS_DIR = os.path.join(BENCH_DIR, 'stubs')
+THRESHOLDS_PATH = os.path.join(BENCH_DIR, 'thresholds.json')
+
+CONFIG = '''API_DIR = %r
+API_KEY = 'benchmark'
+CACHE_DIR = %r
+PROFILE_SUBMIT = False
+'''
+
+def load_plugin(work_dir):
+    """
+    Copies zync_nuke.py into work_dir with a config pointing at the stubs
+    and imports it. Returns (module, import seconds, connections made).
+    """
+    shutil.copy(os.path.join(REPO_DIR, 'zync_nuke.py'), work_dir)
+    f = open(os.path.join(work_dir, 'config_nuke.py'), 'w')
+    try:
+        f.write(CONFIG % (STUBS_DIR, os.path.join(work_dir, 'cache')))
+    finally:
+        f.close()
+    for path in (BENCH_DIR, STUBS_DIR, work_dir):
+        sys.path.insert(0, path)
+
+    import zync
+    start = time.time()
+    import zync_nuke
+    seconds = time.time() - start
+    return zync_nuke, seconds, len(zync.CONNECTIONS)
+
+class Case(object):
+    """
+    A benchmark: setup(shape, size) builds the input and returns the
+    arguments for func, which is what's timed.
+    """
+    def __init__(self, name, shapes, setup, func, sizes=None):
+        self.name = name
+        self.shapes = shapes
+        self.setup = setup
+        self.func = func
+        self.sizes = sizes
+
+def build_cases(zn, work_dir):
+    import graphs
+    import nuke
+
+    def live(shape, size):
+        return (graphs.SHAPES[shape](size),)
+
+    def live_nodes(classes):
+        def setup(shape, size):
+            graphs.SHAPES[shape](size)
+            return ([x for x in nuke.allNodes(recurseGroups=True)
+                     if x.Class() in classes],)
+        return setup
+
+    def registry_cleared(shape, size):
+        graphs.SHAPES[shape](size)
+        zn.WRITE_REGISTRY.clear()
+        return ()
+
+    def nk_path(shape, size):
+        path = os.path.join(work_dir, '%s_%d.nk' % (shape, size))
+        writes = graphs.write_nk(path, size, shape)
+        return path, writes
+
+    def parsed(shape, size):
+        path, writes = nk_path(shape, size)
+        return (zn.NukeScript(path), writes)
+
+    def prepare(script, writes, gizmos=None):
+        evaluator = zn.ScriptEvaluator(script)
+        out = os.path.join(work_dir, 'out.nk')
+        zn.prepare_script(script, writes, zn.ExpressionFreezer(evaluator.freeze),
+                          path=out, gizmos=gizmos)
+
+    def submit(prep_cache, path, writes, profiler=None):
+        # what the render panel does with a saved script
+        script = zn.NukeScript(path)
+        prepared = prep_cache.get(script, [writes])
+        if prepared.masks is None:
+            prepared.masks = script.graph().upstream_masks([writes])
+        evaluator = zn.ScriptEvaluator(script)
+        zn.prepare_script(script, writes,
+                          zn.ExpressionFreezer(evaluator.freeze),
+                          keep=set(prepared.masks), profiler=profiler,
+                          prepared=prepared)
+        prep_cache.save(prepared)
+        return prepared
+
+    def submitted(shape, size):
+        path, writes = nk_path(shape, size)
+        cache_path = os.path.join(work_dir, 'prep_cache.json')
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        prep_cache = zn.PrepCache(cache_path)
+        submit(prep_cache, path, writes)
+        return prep_cache, path, writes
+
+    def resubmit(prep_cache, path, writes):
+        profiler = zn.Profiler('resubmit')
+        prepared = submit(prep_cache, path, writes, profiler)
+        if prepared.evaluated or not profiler.counts.get('scripts_reused'):
+            raise AssertionError('resubmit evaluated %d expressions and '
+                                 'wrote the script again' % (
+                                     prepared.evaluated,))
+
+    gizmo_dir = os.path.join(work_dir, 'gizmos')
+    os.makedirs(gizmo_dir)
+    graphs.write_gizmo(gizmo_dir)
+
+    def gizmo_script(shape, size):
+        path, writes = nk_path(shape, size)
+        return (zn.NukeScript(path), writes, zn.GizmoLibrary([gizmo_dir]))
+
+    file_sets = dict()
+    def hashed_files(shape, size):
+        count = max(1, size // 10)
+        if count not in file_sets:
+            directory = os.path.join(work_dir, 'files_%d' % (count,))
+            os.makedirs(directory)
+            paths = []
+            for i in range(count):
+                path = os.path.join(directory, 'frame.%04d.exr' % (i,))
+                f = open(path, 'wb')
+                try:
+                    f.write(os.urandom(4096))
+                finally:
+                    f.close()
+                paths.append(path)
+            file_sets[count] = paths
+        manifest = zn.HashManifest(os.path.join(work_dir, 'hashes.json'))
+        for path in file_sets[count]:
+            manifest.digest(path)
+        return manifest, file_sets[count]
+
+    def repeat_digest(manifest, paths):
+        for path in paths:
+            manifest.digest(path)
+        if manifest.hashed != len(paths):
+            raise AssertionError('%d files hashed twice' %
+                                 (manifest.hashed - len(paths),))
+
+    sequence_sets = dict()
+    def read_sequences(shape, size):
+        # size Reads of 1000 frames each, in a directory per Read
+        if size not in sequence_sets:
+            frames = list(range(1, 1001))
+            sequences = []
+            for i in range(size):
+                directory = os.path.join(work_dir, 'plates_%d' % (size,),
+                                         'Read%d' % (i,))
+                os.makedirs(directory)
+                pattern = os.path.join(directory, 'plate.####.exr')
+                for frame in frames:
+                    f = open(zn.expand_path(pattern, frame), 'wb')
+                    try:
+                        f.write(b'exr')
+                    finally:
+                        f.close()
+                sequences.append(('Read%d' % (i,), pattern, frames, None))
+            sequence_sets[size] = sequences
+        return sequence_sets[size], shape == 'sizes'
+
+    def check_sequences(sequences, check_empty):
+        report = zn.check_sequences(sequences, check_empty=check_empty)
+        if not report.ok():
+            raise AssertionError(report.summary())
+
+    def freeze_all(nodes):
+        for node in nodes:
+            zn.freeze_node(node)
+
+    graph_shapes = ('chain', 'fan', 'nested', 'cycles', 'many_writes')
+    return [
+        Case('get_dependent_nodes', graph_shapes, live,
+             lambda writes: zn.get_dependent_nodes(writes[0])),
+        Case('select_deps', graph_shapes, live,
+             lambda writes: zn.select_deps(writes)),
+        Case('delete_unused_nodes', ('chain', 'many_writes'), live,
+             lambda writes: zn.delete_unused_nodes(writes[:10])),
+        Case('freeze_node', ('chain', 'many_writes'),
+             live_nodes(('Read', 'Write')), freeze_all),
+        Case('gizmos_to_groups', ('gizmos',), live_nodes(('MyGlow',)),
+             zn.gizmos_to_groups),
+        Case('clear_nodes_by_name', ('chain', 'many_writes'), live,
+             lambda writes: zn.clear_nodes_by_name(['Viewer', 'Backdrop'])),
+        Case('stereo_script', ('chain', 'many_writes'), registry_cleared,
+             zn.stereo_script),
+        Case('parse_script', ('chain', 'fan', 'many_writes'), nk_path,
+             lambda path, writes: zn.NukeScript(path)),
+        Case('prepare_script', ('chain', 'fan', 'many_writes'), parsed,
+             prepare),
+        Case('resubmit', ('chain', 'fan', 'many_writes'), submitted,
+             resubmit),
+        Case('expand_gizmos', ('gizmos',), gizmo_script, prepare,
+             sizes=[500]),
+        Case('hash_manifest_repeat', ('files',), hashed_files, repeat_digest),
+        # 'names' only checks the frames exist, 'sizes' that they aren't empty
+        Case('preflight', ('names', 'sizes'), read_sequences, check_sequences,
+             sizes=[100]),
+    ]
+
+def measure(case, shape, size, repeat):
+    """
+    Returns (best seconds, peak MB or None, error or None).
+    """
+    best = None
+    try:
+        for i in range(repeat):
+            args = case.setup(shape, size)
+            gc.collect()
+            start = time.time()
+            case.func(*args)
+            seconds = time.time() - start
+            if best is None or seconds < best:
+                best = seconds
+        peak = None
+        if tracemalloc is not None:
+            args = case.setup(shape, size)
+            gc.collect()
+            tracemalloc.start()
+            try:
+                case.func(*args)
+                peak = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        return best, None, '%s: %s' % (type(e).__name__, e)
+    return best, peak, None
+
+def load_thresholds():
+    if not os.path.exists(THRESHOLDS_PATH):
+        return dict()
+    f = open(THRESHOLDS_PATH)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+def main(argv):
+    parser = optparse.OptionParser(usage='python %prog [options]')
+    parser.add_option('--sizes', default='1000,10000,100000',
+                      help='comma separated node counts')
+    parser.add_option('--only', help='comma separated benchmark names')
+    parser.add_option('--repeat', type='int', default=3)
+    parser.add_option('--check', action='store_true', default=False,
+                      help='exit with 1 if any case is over its threshold')
+    parser.add_option('--save-thresholds', type='float', metavar='FACTOR',
+                      help='write this run\'s results times FACTOR as the '
+                      'new thresholds')
+    options, args = parser.parse_args(argv)
+    sizes = [int(x) for x in options.sizes.split(',')]
+    only = options.only.split(',') if options.only else None
+
+    work_dir = tempfile.mkdtemp(prefix='zync_bench_')
+    try:
+        zn, import_seconds, connections = load_plugin(work_dir)
+        thresholds = load_thresholds()
+        results = dict()
+        failures = []
+
+        print('%-22s %-12s %7s %10s %9s  %s' % (
+            'benchmark', 'shape', 'size', 'seconds', 'peak MB', 'status'))
+
+        def report(key, seconds, peak, error):
+            name, shape, size = key.split('/')
+            limit = thresholds.get(key, dict())
+            status = 'ok'
+            if error:
+                status = 'ERROR %s' % (error,)
+            elif seconds > limit.get('seconds', float('inf')):
+                status = 'SLOW (limit %.4fs)' % (limit['seconds'],)
+            elif peak is not None and peak > limit.get('peak_mb', float('inf')):
+                status = 'MEMORY (limit %.1f MB)' % (limit['peak_mb'],)
+            elif key not in thresholds:
+                status = 'ok (no threshold)'
+            if not status.startswith('ok'):
+                failures.append(key)
+            print('%-22s %-12s %7s %10.4f %9s  %s' % (
+                name, shape, size, seconds or 0.0,
+                '%.1f' % (peak,) if peak is not None else 'n/a', status))
+            results[key] = dict(seconds=seconds, peak_mb=peak)
+
+        if only is None or 'import' in only:
+            report('import/-/1', import_seconds, None,
+                   '%d connections made on import' % (connections,)
+                   if connections else None)
+
+        for case in build_cases(zn, work_dir):
+            if only is not None and case.name not in only:
+                continue
+            for shape in case.shapes:
+                for size in case.sizes or sizes:
+                    seconds, peak, error = measure(case, shape, size,
+                                                   options.repeat)
+                    report('%s/%s/%d' % (case.name, shape, size), seconds,
+                           peak, error)
+
+        if options.save_thresholds:
+            factor = options.save_thresholds
+            for key, result in results.items():
+                if result['seconds'] is None:
+                    continue
+                limit = dict(seconds=round(max(result['seconds'] * factor,
+                                               0.01), 4))
+                if result['peak_mb'] is not None:
+                    limit['peak_mb'] = round(max(result['peak_mb'] * factor,
+                                                 1.0), 1)
+                thresholds[key] = limit
+            f = open(THRESHOLDS_PATH, 'w')
+            try:
+                json.dump(thresholds, f, indent=1, sort_keys=True)
+                f.write('\n')
+            finally:
+                f.close()
+            print('wrote %s' % (THRESHOLDS_PATH,))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if options.check and failures:
+        print('%d benchmarks over threshold' % (len(failures),))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,384 @@
+"""
+A stand-in for Nuke's python module, so zync_nuke can be imported and
+benchmarked outside of Nuke. It holds one in-memory script of Node objects,
+which benchmarks/graphs.py fills with graphs of different shapes. Only the
+parts of the API zync_nuke uses are here, and expressions aren't really
+evaluated: evaluate() just replaces anything in [brackets]. dependencies()
+does follow {{Node.knob}} and [value Node.knob] links.
+"""
+import re
+
+NUKE_VERSION_MAJOR = 8
+NUKE_VERSION_MINOR = 0
+NUKE_VERSION_RELEASE = 5
+STARTLINE = 1
+
+_EXPRESSION_RE = re.compile(r'\[[^\[\]]*\]')
+
+class Knob(object):
+    def __init__(self, name, value=''):
+        self._name = name
+        self._value = value
+
+    def name(self):
+        return self._name
+
+    def value(self):
+        return self._value
+
+    def getValue(self):
+        return self._value
+
+    def setValue(self, value):
+        self._value = value
+
+    def evaluate(self):
+        value = self._value
+        while '[' in value:
+            new_value = _EXPRESSION_RE.sub('x', value)
+            if new_value == value:
+                break
+            value = new_value
+        return value
+
+class Format(object):
+    def __init__(self, width, height):
+        self._width = width
+        self._height = height
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+class Node(object):
+    """
+    A node in the stand-in script. Creating one adds it to the script, and
+    runs any onCreate callbacks registered for its class.
+    """
+    def __init__(self, cls, node_name, inputs=(), parent=None, **knobs):
+        self._class = cls
+        self._name = node_name
+        self._inputs = list(inputs)
+        self._parent = parent
+        self._selected = False
+        self._alive = True
+        self._knobs = dict(disable=Knob('disable', False))
+        self._knobs['name'] = Knob('name', node_name)
+        for knob_name, value in knobs.items():
+            self._knobs[knob_name] = Knob(knob_name, value)
+        self._format = None
+        _script.add(self)
+        _fire('create', self)
+
+    def Class(self):
+        return self._class
+
+    def name(self):
+        return self._name
+
+    def fullName(self):
+        if self._parent is None:
+            return self._name
+        return '%s.%s' % (self._parent.fullName(), self._name)
+
+    def setName(self, name):
+        _script.by_name.pop(self.fullName(), None)
+        self._name = name
+        self._knobs['name'].setValue(name)
+        _script.by_name[self.fullName()] = self
+
+    def knob(self, name):
+        return self._knobs.get(name)
+
+    def knobs(self):
+        return self._knobs
+
+    def addKnob(self, knob):
+        self._knobs[knob.name()] = knob
+
+    def __getitem__(self, name):
+        return self._knobs[name]
+
+    def input(self, index):
+        if index < len(self._inputs):
+            return self._inputs[index]
+        return None
+
+    def inputs(self):
+        return len(self._inputs)
+
+    def setInput(self, index, node):
+        while len(self._inputs) <= index:
+            self._inputs.append(None)
+        self._inputs[index] = node
+
+    def nodes(self):
+        return [x for x in _script.nodes if x._alive and x._parent is self]
+
+    def setSelected(self, selected):
+        self._selected = selected
+
+    def isSelected(self):
+        return self._selected
+
+    def format(self):
+        return self._format or _script.format
+
+    def width(self):
+        return self.format().width()
+
+    def height(self):
+        return self.format().height()
+
+class Gizmo(Node):
+    """
+    A gizmo instance, which makeGroup() turns into a Group holding a copy of
+    its contents.
+    """
+    def __init__(self, cls, node_name, inputs=(), parent=None, contents=3,
+                 **knobs):
+        self._contents = contents
+        Node.__init__(self, cls, node_name, inputs, parent, **knobs)
+
+    def makeGroup(self):
+        group = Node('Group', '%s_group' % (self._name,), self._inputs,
+                     self._parent)
+        previous = Node('Input', 'Input1', parent=group)
+        for i in range(self._contents):
+            previous = Node('Blur', 'Blur%d' % (i + 1,), [previous], group)
+        Node('Output', 'Output1', [previous], group)
+        return group
+
+class _Script(object):
+    def __init__(self):
+        self.nodes = []
+        self.deleted = 0
+        self.by_name = dict()
+        self.format = Format(2048, 1556)
+        self.views = ['left', 'right']
+
+    def add(self, node):
+        self.nodes.append(node)
+        self.by_name[node.fullName()] = node
+
+    def remove(self, node):
+        if not node._alive:
+            return
+        node._alive = False
+        self.by_name.pop(node.fullName(), None)
+        self.deleted += 1
+        # drop deleted nodes once they're half the list
+        if self.deleted * 2 > len(self.nodes):
+            self.nodes = [x for x in self.nodes if x._alive]
+            self.deleted = 0
+
+_script = _Script()
+_callbacks = dict()
+_this = [None, None]
+
+class _KnobName(object):
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+def _fire(kind, node=None, knob=None):
+    callbacks = _callbacks.get(kind)
+    if not callbacks:
+        return
+    _this[0] = node
+    _this[1] = _KnobName(knob) if knob else None
+    for func, node_class in list(callbacks):
+        if node_class is None or node is None or node_class == node.Class():
+            func()
+
+def _add_callback(kind, func, nodeClass=None):
+    _callbacks.setdefault(kind, []).append((func, nodeClass))
+
+def addOnScriptLoad(func, args=(), kwargs={}, nodeClass='Root'):
+    _add_callback('load', func)
+
+def addOnScriptClose(func, args=(), kwargs={}, nodeClass='Root'):
+    _add_callback('close', func)
+
+def addOnCreate(func, args=(), kwargs={}, nodeClass='*'):
+    _add_callback('create', func, None if nodeClass == '*' else nodeClass)
+
+def addOnDestroy(func, args=(), kwargs={}, nodeClass='*'):
+    _add_callback('destroy', func, None if nodeClass == '*' else nodeClass)
+
+def addKnobChanged(func, args=(), kwargs={}, nodeClass='*'):
+    _add_callback('knob', func, None if nodeClass == '*' else nodeClass)
+
+def thisNode():
+    return _this[0]
+
+def thisKnob():
+    return _this[1]
+
+def scriptClear():
+    """
+    Closes the script, leaving only a new root.
+    """
+    global _script, _root
+    _fire('close')
+    _script = _Script()
+    _root = None
+
+def scriptLoaded():
+    """
+    Not part of Nuke: runs the onScriptLoad callbacks once a graph has been
+    built, as Nuke does after reading a script.
+    """
+    _fire('load')
+
+def knobChanged(node, knob_name):
+    """
+    Not part of Nuke: runs the knobChanged callbacks, as Nuke does when a
+    knob is changed in the UI. Scripted setValue() and setName() calls
+    don't run them here.
+    """
+    _fire('knob', node, knob_name)
+
+_root = None
+
+def root():
+    global _root
+    if _root is None or not _root._alive:
+        _root = Node('Root', 'Root', name='/tmp/benchmark.nk',
+                     first_frame=1, last_frame=100)
+    return _root
+
+def allNodes(filter=None, group=None, recurseGroups=False):
+    return [x for x in _script.nodes if x._alive and
+            (recurseGroups or x._parent is group) and
+            (filter is None or x._class == filter) and x._class != 'Root']
+
+def selectedNodes():
+    return [x for x in _script.nodes if x._alive and x._selected and
+            x._parent is None]
+
+def toNode(name):
+    return _script.by_name.get(name)
+
+_LINK_RE = re.compile(r'\[value\s+([\w.]+)\.\w+\]|\{\{\s*([\w.]+)\.\w+')
+
+def _expression_links(node):
+    """
+    Returns the nodes linked to by expressions in the node's knobs, looked
+    up in the node's Group first, as Nuke does.
+    """
+    links = []
+    for knob in node._knobs.values():
+        value = knob._value
+        if not isinstance(value, str) or \
+           ('[value' not in value and '{{' not in value):
+            continue
+        for match in _LINK_RE.finditer(value):
+            name = match.group(1) or match.group(2)
+            dep = None
+            if node._parent is not None:
+                dep = _script.by_name.get('%s.%s' % (node._parent.fullName(),
+                                                     name))
+            if dep is None:
+                dep = _script.by_name.get(name)
+            if dep is not None and dep is not node:
+                links.append(dep)
+    return links
+
+def dependencies(nodes):
+    deps = []
+    seen = set()
+    for node in nodes:
+        for dep in node._inputs + _expression_links(node):
+            if dep is not None and id(dep) not in seen:
+                seen.add(id(dep))
+                deps.append(dep)
+    return deps
+
+def delete(node):
+    _fire('destroy', node)
+    _script.remove(node)
+    if node._class == 'Group':
+        for child in [x for x in _script.nodes if x._parent is node]:
+            delete(child)
+
+def nodeDelete():
+    for node in selectedNodes():
+        delete(node)
+
+def filename(node):
+    return node.knob('file').evaluate()
+
+def views():
+    return list(_script.views)
+
+def pluginAddPath(path):
+    pass
+
+def pluginPath():
+    return []
+
+def scriptSave(path=None):
+    pass
+
+def nodeCopy(path):
+    pass
+
+def modified():
+    return False
+
+messages = []
+
+def message(msg):
+    messages.append(msg)
+
+def ask(msg):
+    messages.append(msg)
+    return True
+
+def executeInMainThread(func, args=(), kwargs={}):
+    return func(*args, **kwargs)
+
+class ProgressTask(object):
+    def __init__(self, title):
+        self.title = title
+
+    def isCancelled(self):
+        return False
+
+    def setMessage(self, msg):
+        pass
+
+    def setProgress(self, progress):
+        pass
+
+class Undo(object):
+    _disabled = False
+
+    @classmethod
+    def disabled(cls):
+        return cls._disabled
+
+    @classmethod
+    def enable(cls):
+        cls._disabled = False
+
+    @classmethod
+    def disable(cls):
+        cls._disabled = True
+
+    @classmethod
+    def begin(cls):
+        pass
+
+    @classmethod
+    def end(cls):
+        pass
+
+    @classmethod
+    def undo(cls):
+        pass
@@ -0,0 +1,27 @@
+"""
+A stand-in for Nuke's nukescripts module, with just enough of the panels
+API for zync_nuke to be imported.
+"""
+
+class _Panels(object):
+    class PythonPanel(object):
+        def __init__(self, title='', id=''):
+            self.title = title
+            self.knobs = []
+
+        def addKnob(self, knob):
+            self.knobs.append(knob)
+
+        def setMinimumSize(self, width, height):
+            pass
+
+        def showModalDialog(self):
+            return False
+
+        def addToPane(self):
+            pass
+
+panels = _Panels()
+
+def registerPanel(id, command):
+    pass
@@ -0,0 +1,38 @@
+"""
+A stand-in for the ZYNC python API that never touches the network. Every
+connection made is counted in CONNECTIONS, so benchmarks can check that
+importing zync_nuke doesn't connect.
+"""
+import threading
+
+DEFAULT_INSTANCE_TYPE = 'ZYNC16'
+
+CONNECTIONS = []
+_lock = threading.Lock()
+
+class ZyncAuthenticationError(Exception):
+    pass
+
+class ZyncPreflightError(Exception):
+    pass
+
+class Zync(object):
+    INSTANCE_TYPES = {
+        'ZYNC4': {'description': '4 core, 15GB RAM'},
+        'ZYNC8': {'description': '8 core, 30GB RAM'},
+        'ZYNC16': {'description': '16 core, 60GB RAM'},
+    }
+    FEATURES = {}
+
+    def __init__(self, app, api_key):
+        with _lock:
+            CONNECTIONS.append((app, api_key))
+
+    def login(self, username=None, password=None):
+        pass
+
+    def get_project_list(self):
+        return {'code': 0, 'response': ['benchmark']}
+
+    def submit_job(self, plugin, script_path, write_names, params):
+        return {'code': 0, 'response': 1}
@@ -0,0 +1,34 @@
+"""
+Loads zync_nuke for the tests against the stand-in nuke, nukescripts and
+zync modules in benchmarks/stubs, the same way the benchmarks do. The
+plugin is imported once, from a temporary directory with its own
+config_nuke.py and cache directory.
+"""
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'benchmarks')
+
+_plugin = []
+
+def plugin():
+    """
+    Returns the zync_nuke module, importing it the first time.
+    """
+    if not _plugin:
+        if BENCH_DIR not in sys.path:
+            sys.path.insert(0, BENCH_DIR)
+        import run
+        work_dir = tempfile.mkdtemp(prefix='zync_nuke_tests_')
+        _plugin.append(run.load_plugin(work_dir)[0])
+    return _plugin[0]
+
+def new_script():
+    """
+    Clears the stand-in nuke module's script and returns the module.
+    """
+    import nuke
+    nuke.scriptClear()
+    return nuke
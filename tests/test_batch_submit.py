@@ -0,0 +1,226 @@
+"""
+Tests for batch submission from the command line, against a stand-in for
+the zync.Zync client.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import support
+
+zn = support.plugin()
+
+SCRIPT = '''#! /usr/local/Nuke8.0v5/libnuke-8.0.v5.so -nx
+version 8.0 v5
+define_user_knobs
+Root {
+ inputs 0
+ name %(path)s
+ first_frame 1
+ last_frame 20
+ addUserKnob {20 User}
+ addUserKnob {1 shot}
+ shot %(shot)s
+}
+Read {
+ inputs 0
+ file "/plates/\\[value root.shot]/plate.%%04d.exr"
+ name Read1
+}
+Grade {
+ white 1.1
+ name Grade1
+}
+Write {
+ file "\\[file dirname \\[value root.name]]/renders/\\[value root.shot].%%04d.exr"
+ name Write1
+}
+Read {
+ inputs 0
+ file /plates/unused.%%04d.exr
+ name Read2
+}
+Blur {
+ name Blur1
+}
+'''
+
+class StandInZync(object):
+    """
+    Stands in for zync.Zync. Submits of a script whose shot is in failures
+    raise its errors in turn before succeeding; logins with any password
+    but 'secret' are turned down.
+    """
+    lock = threading.Lock()
+    logins = []
+    submits = []
+    failures = dict()
+
+    def __init__(self, app, api_key):
+        pass
+
+    def login(self, username=None, password=None):
+        with self.lock:
+            self.logins.append(username)
+        if password != 'secret':
+            raise zn.zync.ZyncAuthenticationError('Bad password.')
+
+    def submit_job(self, plugin, script_path, write_names, params):
+        with self.lock:
+            self.submits.append((script_path, write_names, dict(params)))
+            for shot, errors in self.failures.items():
+                if shot in os.path.basename(script_path) and errors:
+                    raise errors.pop(0)
+        return {'code': 0, 'response': len(self.submits)}
+
+class BatchSubmitTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.zync_class = zn.zync.Zync
+        zn.zync.Zync = StandInZync
+        StandInZync.logins = []
+        StandInZync.submits = []
+        StandInZync.failures = dict()
+        self.sleep = zn.time.sleep
+        self.paths = [self.script(x) for x in ('sh010', 'sh020', 'sh030')]
+
+    def tearDown(self):
+        zn.zync.Zync = self.zync_class
+        zn.time.sleep = self.sleep
+        shutil.rmtree(self.dir)
+
+    def script(self, shot):
+        path = os.path.join(self.dir, '%s_comp.nk' % (shot,))
+        f = open(path, 'w')
+        try:
+            f.write(SCRIPT % dict(path=path, shot=shot))
+        finally:
+            f.close()
+        return path
+
+    def submit(self, password='secret', **kwargs):
+        params = dict(proj_name='test', chunk_size=10)
+        kwargs.setdefault('backoff', 0.001)
+        return zn.batch_submit(self.paths, params, 'artist', password,
+                               **kwargs)
+
+    def test_prunes_freezes_and_submits_each_script(self):
+        jobs = self.submit(workers=2)
+        self.assertEqual([x.error for x in jobs], [None, None, None])
+        self.assertEqual(len(StandInZync.submits), 3)
+        for job in jobs:
+            self.assertEqual(job.write_names, ['Write1'])
+            self.assertEqual(job.attempts, 1)
+            f = open(job.new_script)
+            try:
+                text = f.read()
+            finally:
+                f.close()
+            # pruned to what Write1 needs, with its expressions frozen
+            self.assertTrue('Read1' in text and 'Read2' not in text)
+            shot = os.path.basename(job.script_path)[:5]
+            self.assertTrue('%s/renders/%s.%%04d.exr' % (self.dir, shot)
+                            in text, text)
+        # one connection per worker, not per script
+        self.assertTrue(len(StandInZync.logins) <= 2)
+        frange = set(x[2]['frange'] for x in StandInZync.submits)
+        self.assertEqual(frange, set(['1-20']))
+
+    def test_retries_with_backoff(self):
+        sleeps = []
+        zn.time.sleep = sleeps.append
+        StandInZync.failures['sh020'] = [IOError('timed out'),
+                                         IOError('timed out')]
+        jobs = self.submit(workers=1, backoff=1.0)
+        self.assertEqual([x.error for x in jobs], [None, None, None])
+        self.assertEqual([x.attempts for x in jobs], [1, 3, 1])
+        self.assertEqual(sleeps, [1.0, 2.0])
+
+    def test_gives_up_after_retries(self):
+        zn.time.sleep = lambda seconds: None
+        StandInZync.failures['sh010'] = [IOError('timed out')] * 5
+        jobs = self.submit(workers=1, retries=2)
+        self.assertEqual(jobs[0].error, 'timed out')
+        self.assertEqual(len([x for x in StandInZync.submits
+                              if 'sh010' in x[0]]), 3)
+        self.assertEqual([x.error for x in jobs[1:]], [None, None])
+
+    def test_preflight_errors_are_fatal(self):
+        StandInZync.failures['sh030'] = [
+            zn.zync.ZyncPreflightError('Missing plates.')]
+        jobs = self.submit(workers=1)
+        self.assertEqual(jobs[2].error, 'Missing plates.')
+        # not retried
+        self.assertEqual(len([x for x in StandInZync.submits
+                              if 'sh030' in x[0]]), 1)
+        self.assertEqual([x.error for x in jobs[:2]], [None, None])
+
+    def test_auth_errors_are_fatal(self):
+        jobs = self.submit(password='wrong', workers=1)
+        self.assertEqual([x.error for x in jobs], ['Bad password.'] * 3)
+        # one login attempt per script, none retried
+        self.assertEqual(len(StandInZync.logins), 3)
+        self.assertEqual(StandInZync.submits, [])
+
+    def test_dry_run_doesnt_connect(self):
+        jobs = self.submit(dry_run=True)
+        self.assertEqual([x.error for x in jobs], [None, None, None])
+        self.assertTrue(all(os.path.exists(x.new_script) for x in jobs))
+        self.assertEqual(StandInZync.logins, [])
+        self.assertEqual(StandInZync.submits, [])
+
+    def test_feedback_order_submits_probes_first(self):
+        self.paths = self.paths[:1]
+        self.submit(chunk_order='feedback')
+        self.assertEqual([(x[2]['frange'], x[2]['chunk_size'])
+                          for x in StandInZync.submits],
+                         [('1,11,20', 1), ('2-10,12-19', 10)])
+
+    def test_frame_expressions_left_live(self):
+        text = SCRIPT.replace('renders/\\[value root.shot].%%04d.exr',
+                              'renders/\\[value root.shot]_\\[frame].exr')
+        self.assertNotEqual(text, SCRIPT)
+        path = os.path.join(self.dir, 'sh040_comp.nk')
+        f = open(path, 'w')
+        try:
+            f.write(text % dict(path=path, shot='sh040'))
+        finally:
+            f.close()
+        self.paths = [path]
+        job = self.submit(dry_run=True)[0]
+        self.assertEqual(len(job.warnings), 1)
+        self.assertTrue(job.warnings[0].startswith('Write1.file: '))
+        f = open(job.new_script)
+        try:
+            written = f.read()
+        finally:
+            f.close()
+        # not frozen to the first frame
+        self.assertTrue('_\\[frame].exr' in written, written)
+        self.assertTrue('sh040_1.exr' not in written)
+        # but the Read still is
+        self.assertTrue('/plates/sh040/plate.%04d.exr' in written)
+        self.assertTrue('    not frozen: Write1.file: ' in
+                        zn.format_batch_summary([job]))
+
+    def test_summary(self):
+        StandInZync.failures['sh020'] = [
+            zn.zync.ZyncPreflightError('Missing plates.')]
+        log = []
+        jobs = self.submit(workers=1, log=log.append)
+        self.assertEqual(len(log), 3)
+        self.assertTrue('Failed %s: Missing plates.' % (self.paths[1],)
+                        in log)
+        lines = zn.format_batch_summary(jobs).splitlines()
+        self.assertTrue(lines[0].split()[0] == 'script')
+        rows = [x for x in lines if x.startswith(self.dir[:20]) or
+                x.startswith('...')]
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(rows[0].endswith('ok'))
+        self.assertTrue(rows[1].endswith('FAILED: Missing plates.'))
+        self.assertTrue(lines[-1].startswith('3 scripts, 1 failed'))
+
+if __name__ == '__main__':
+    unittest.main()
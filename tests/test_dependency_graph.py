@@ -0,0 +1,110 @@
+"""
+Tests for DependencyGraph and get_dependent_nodes against the stand-in
+nuke module.
+"""
+import unittest
+
+import support
+
+zn = support.plugin()
+
+def names(nodes):
+    return sorted(zn._node_key(x) for x in nodes)
+
+class DependencyGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.nuke = nuke = support.new_script()
+        #  Read1 - Grade1 - Merge1 - Write1
+        #  Read2 --------/       \- Write2 <- Grade2 <- Read3
+        #  Read4 - Unused1
+        self.read1 = nuke.Node('Read', 'Read1')
+        self.read2 = nuke.Node('Read', 'Read2')
+        self.grade1 = nuke.Node('Grade', 'Grade1', [self.read1])
+        self.merge = nuke.Node('Merge2', 'Merge1', [self.grade1, self.read2])
+        self.write1 = nuke.Node('Write', 'Write1', [self.merge])
+        self.read3 = nuke.Node('Read', 'Read3')
+        self.grade2 = nuke.Node('Grade', 'Grade2', [self.read3])
+        self.write2 = nuke.Node('Write', 'Write2', [self.merge, self.grade2])
+        self.read4 = nuke.Node('Read', 'Read4')
+        nuke.Node('Blur', 'Unused1', [self.read4])
+
+    def test_upstream_names(self):
+        graph = zn.DependencyGraph()
+        self.assertEqual(sorted(graph.upstream_names([self.write1])),
+                         ['Grade1', 'Merge1', 'Read1', 'Read2', 'Write1'])
+        # names work as roots too
+        self.assertEqual(graph.upstream_names(['Write1']),
+                         graph.upstream_names([self.write1]))
+        self.assertEqual(sorted(graph.upstream_names([self.write1,
+                                                      self.write2])),
+                         ['Grade1', 'Grade2', 'Merge1', 'Read1', 'Read2',
+                          'Read3', 'Write1', 'Write2'])
+
+    def test_cycles(self):
+        # Merge1 feeds back into Read1
+        self.read1.setInput(0, self.merge)
+        graph = zn.DependencyGraph()
+        self.assertEqual(sorted(graph.upstream_names([self.write1])),
+                         ['Grade1', 'Merge1', 'Read1', 'Read2', 'Write1'])
+        masks = graph.upstream_masks([[self.write1], [self.write2]])
+        self.assertEqual(masks['Read1'], 3)
+        self.assertEqual(names(zn.get_dependent_nodes(self.write1)),
+                         ['Grade1', 'Merge1', 'Read1', 'Read2', 'Write1'])
+
+    def test_groups(self):
+        nuke = self.nuke
+        group = nuke.Node('Group', 'Group1', [self.read4])
+        inner_input = nuke.Node('Input', 'Input1', parent=group)
+        inner_blur = nuke.Node('Blur', 'Blur1', [inner_input], group)
+        nuke.Node('Output', 'Output1', [inner_blur], group)
+        write3 = nuke.Node('Write', 'Write3', [group])
+        graph = zn.DependencyGraph()
+        expected = ['Group1', 'Group1.Blur1', 'Group1.Input1',
+                    'Group1.Output1', 'Read4', 'Write3']
+        self.assertEqual(sorted(graph.upstream_names([write3])), expected)
+        self.assertEqual(names(zn.get_dependent_nodes(write3)), expected)
+        self.assertEqual(names(graph.upstream([write3])), expected)
+
+    def test_expression_links(self):
+        nuke = self.nuke
+        # linked by expression only, no pipe
+        nuke.Node('Transform', 'Transform1', [self.read4])
+        self.grade1.addKnob(nuke.Knob('white', '{{Transform1.scale}}'))
+        group = nuke.Node('Group', 'Group1', [self.read2])
+        inner = nuke.Node('Blur', 'Blur1', parent=group,
+                          size='[value Transform1.scale]')
+        nuke.Node('Output', 'Output1', [inner], group)
+        write3 = nuke.Node('Write', 'Write3', [group])
+        graph = zn.DependencyGraph()
+        self.assertTrue(set(['Transform1', 'Read4']) <=
+                        graph.upstream_names([self.write1]))
+        # a Group's contents link outside of it
+        self.assertTrue('Transform1' in graph.upstream_names([write3]))
+        self.assertTrue('Transform1' in
+                        names(zn.get_dependent_nodes(write3)))
+
+    def test_upstream_masks(self):
+        graph = zn.DependencyGraph()
+        masks = graph.upstream_masks([[self.write1], [self.write2]])
+        self.assertEqual(masks, {'Write1': 1, 'Write2': 2, 'Merge1': 3,
+                                 'Grade1': 3, 'Read1': 3, 'Read2': 3,
+                                 'Grade2': 2, 'Read3': 2})
+        # the same as one traversal per group
+        for i, roots in enumerate([[self.write1], [self.write2]]):
+            self.assertEqual(set(x for x, y in masks.items()
+                                 if y & (1 << i)),
+                             graph.upstream_names(roots))
+
+    def test_get_dependent_nodes_matches_graph(self):
+        graph = zn.DependencyGraph()
+        for node in zn._node_list():
+            self.assertEqual(names(zn.get_dependent_nodes(node)),
+                             sorted(graph.upstream_names([node])))
+
+    def test_delete_unused_nodes(self):
+        zn.delete_unused_nodes([self.write1])
+        self.assertEqual(names(self.nuke.allNodes()),
+                         ['Grade1', 'Merge1', 'Read1', 'Read2', 'Write1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Tests for which expressions ExpressionFreezer shares between nodes.
+"""
+import unittest
+
+import support
+
+zn = support.plugin()
+
+class ScriptNode(object):
+    """
+    Just enough of a parsed script node for ExpressionFreezer.key().
+    """
+    def __init__(self, full_name, cls='Write', parent=None):
+        self.full_name = full_name
+        self.cls = cls
+        self.parent = parent
+
+class ExpressionFreezerTest(unittest.TestCase):
+    def test_node_relative(self):
+        for expression in ('[value input.label]/x.%04d.exr',
+                           '[value input0.file]', '[value input1.file]',
+                           '[metadata input/filename]', '[topnode]',
+                           '[value [topnode].file]', '[value label]',
+                           '[value this.name]', '[value parent.name]',
+                           '[knob name]', '[python nuke.thisNode().name()]',
+                           '[node name]'):
+            self.assertTrue(zn._node_relative(expression), expression)
+        for expression in ('/plain/path.%04d.exr',
+                           '[file dirname [value root.name]]/renders/a',
+                           '[value root.shot]_[frame].exr',
+                           '[value Read1.file]', '[getenv SHOW]/x.exr',
+                           '[string tolower [value root.shot]]'):
+            self.assertFalse(zn._node_relative(expression), expression)
+
+    def test_input_expressions_evaluated_per_node(self):
+        labels = dict(WriteA='a', WriteB='b')
+        freezer = zn.ExpressionFreezer(
+            lambda node, knob, value: '/out/%s/x.%%04d.exr' % (
+                labels[node.full_name],))
+        value = '[value input.label]/x.%04d.exr'
+        paths = [freezer(ScriptNode(x), 'file', value)
+                 for x in ('WriteA', 'WriteB')]
+        self.assertEqual(paths, ['/out/a/x.%04d.exr', '/out/b/x.%04d.exr'])
+        self.assertEqual(freezer.evaluations, 2)
+
+    def test_root_expressions_shared(self):
+        freezer = zn.ExpressionFreezer(
+            lambda node, knob, value: '/shows/omg/sh010/plates/p.%04d.exr')
+        value = '/shows/omg/[value root.shot]/plates/p.%04d.exr'
+        for name in ('Read1', 'Read2', 'Read3'):
+            freezer(ScriptNode(name, 'Read'), 'file', value)
+        self.assertEqual(freezer.evaluations, 1)
+        self.assertEqual(freezer.skipped(), 2)
+
+if __name__ == '__main__':
+    unittest.main()
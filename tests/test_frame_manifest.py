@@ -0,0 +1,89 @@
+"""
+Tests for recording frame fingerprints at submit time and confirming them
+once the frames are rendered.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import support
+
+zn = support.plugin()
+
+class FrameManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.manifest = zn.FRAME_MANIFEST
+        zn.FRAME_MANIFEST = zn.FrameManifest(
+            os.path.join(self.dir, 'cache', 'nuke_frames.json'))
+        self.renders = os.path.join(self.dir, 'renders')
+        os.makedirs(self.renders)
+        self.pattern = os.path.join(self.renders, 'comp.%04d.exr')
+
+    def tearDown(self):
+        zn.FRAME_MANIFEST = self.manifest
+        shutil.rmtree(self.dir)
+
+    def render(self, frames, mtime=None):
+        for frame in frames:
+            path = self.pattern % (frame,)
+            f = open(path, 'w')
+            try:
+                f.write('pixels')
+            finally:
+                f.close()
+            if mtime is not None:
+                os.utime(path, (mtime, mtime))
+
+    def outputs(self, fingerprint, frames=range(1, 6)):
+        return [(self.pattern, dict((x, fingerprint) for x in frames))]
+
+    def test_frames_count_once_rendered(self):
+        outputs = self.outputs('a')
+        self.assertEqual(zn.changed_frames(outputs), [1, 2, 3, 4, 5])
+        zn.record_frames(101, outputs, [1, 2, 3, 4, 5])
+        # submitted but not rendered yet
+        self.assertEqual(zn.changed_frames(outputs), [1, 2, 3, 4, 5])
+        self.render([1, 2, 3])
+        self.assertEqual(zn.changed_frames(outputs), [4, 5])
+        self.render([4, 5])
+        self.assertEqual(zn.changed_frames(outputs), [])
+        # the job has nothing left to confirm
+        self.assertEqual(zn.FRAME_MANIFEST._load()['jobs'], dict())
+        # nothing is written next to the renders
+        self.assertEqual(sorted(os.listdir(self.renders)),
+                         ['comp.%04d.exr' % (x,) for x in range(1, 6)])
+
+    def test_older_files_are_not_confirmed(self):
+        self.render([1, 2], mtime=time.time() - 3600)
+        outputs = self.outputs('a', [1, 2])
+        zn.record_frames(102, outputs, [1, 2])
+        self.assertEqual(zn.changed_frames(outputs), [1, 2])
+
+    def test_changed_fingerprints_render_again(self):
+        zn.record_frames(103, self.outputs('a'), [1, 2, 3, 4, 5])
+        self.render([1, 2, 3, 4, 5])
+        self.assertEqual(zn.changed_frames(self.outputs('a')), [])
+        changed = self.outputs('a')
+        changed[0][1][3] = 'b'
+        self.assertEqual(zn.changed_frames(changed), [3])
+
+    def test_later_job_wins(self):
+        zn.record_frames(104, self.outputs('a', [1]), [1])
+        zn.record_frames(105, self.outputs('b', [1]), [1])
+        self.render([1])
+        self.assertEqual(zn.changed_frames(self.outputs('b', [1])), [])
+        self.assertEqual(zn.changed_frames(self.outputs('a', [1])), [1])
+
+    def test_old_jobs_are_forgotten(self):
+        zn.record_frames(106, self.outputs('a'), [1, 2])
+        jobs = zn.FRAME_MANIFEST._load()['jobs']
+        jobs['106']['time'] -= 31 * 24 * 60 * 60
+        zn.FRAME_MANIFEST._save()
+        zn.FRAME_MANIFEST.confirm()
+        self.assertEqual(zn.FRAME_MANIFEST._load()['jobs'], dict())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Tests for FramePathTable: the file each Read uses on each render frame.
+"""
+import re
+import unittest
+
+import support
+
+zn = support.plugin()
+
+_VERSION_EXPR = '[if {[frame] > 50} {return v2} {return v1}]'
+
+class Knob(object):
+    """
+    A file knob that evaluates like Nuke's: the version switch expression
+    above is worked out for the time asked for, and frame tokens are
+    filled with that time.
+    """
+    def __init__(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+    def evaluate(self, time=None):
+        if time is None:
+            time = 1
+        value = self._value.replace(_VERSION_EXPR,
+                                    'v2' if time > 50 else 'v1')
+        return re.sub(r'%(\d*)d', lambda x: '%0*d' % (int(x.group(1) or 0),
+                                                      time), value)
+
+class Node(object):
+    def __init__(self, name, cls, inputs=(), **knobs):
+        self._name = name
+        self._class = cls
+        self._inputs = list(inputs)
+        self._knobs = dict((x, Knob(y)) for x, y in knobs.items())
+        self._knobs.setdefault('disable', Knob(False))
+
+    def Class(self):
+        return self._class
+
+    def knob(self, name):
+        return self._knobs.get(name)
+
+    def fullName(self):
+        return self._name
+
+    def input(self, index):
+        return self._inputs[index]
+
+    def inputs(self):
+        return len(self._inputs)
+
+class FramePathTableTest(unittest.TestCase):
+    def build(self, read, frames, *time_nodes):
+        node = read
+        for i, (cls, knobs) in enumerate(time_nodes):
+            node = Node('%s%d' % (cls, i + 1), cls, [node], **knobs)
+        write = Node('Write1', 'Write', [node], file='/out/o.%04d.exr')
+        return zn.FramePathTable.build([write], frames)
+
+    def paths(self, table, name='Read1'):
+        return [x[1] for x in sorted(table.frames(name))]
+
+    def test_frame_mode_with_frame_expression(self):
+        read = Node('Read1', 'Read',
+                    file='/p/%s/b.%%04d.exr' % (_VERSION_EXPR,),
+                    first=1, last=200, frame_mode='offset', frame='10',
+                    before='black', after='hold')
+        table = self.build(read, [5, 11, 60])
+        # the expression follows the time asked for, the frame number
+        # follows the Read's offset; frame 5 is before the first frame
+        self.assertEqual(self.paths(table),
+                         ['/p/v1/b.0001.exr', '/p/v2/b.0050.exr'])
+
+    def test_loop_with_frame_expression(self):
+        read = Node('Read1', 'Read',
+                    file='/p/%s/c.%%04d.exr' % (_VERSION_EXPR,),
+                    first=1, last=10, after='loop')
+        table = self.build(read, [12, 55])
+        self.assertEqual(self.paths(table),
+                         ['/p/v1/c.0002.exr', '/p/v2/c.0005.exr'])
+
+    def test_frame_hold_increment(self):
+        read = Node('Read1', 'Read', file='/p/a.%04d.exr', first=1, last=100)
+        table = self.build(read, list(range(1, 11)),
+                           ('FrameHold', dict(first_frame=2, increment=4)))
+        self.assertEqual(self.paths(table), ['/p/a.0001.exr',
+                                             '/p/a.0002.exr',
+                                             '/p/a.0006.exr',
+                                             '/p/a.0010.exr'])
+        self.assertEqual(table.render_files(5), set(['/p/a.0002.exr']))
+        self.assertEqual(table.render_files(6), set(['/p/a.0006.exr']))
+
+    def test_time_offset_around_frame_hold_increment(self):
+        read = Node('Read1', 'Read', file='/p/a.%04d.exr', first=1, last=100)
+        table = self.build(read, [1, 2, 3],
+                           ('TimeOffset', dict(time_offset=5)),
+                           ('FrameHold', dict(first_frame=0, increment=10)),
+                           ('TimeOffset', dict(time_offset=-20)))
+        # render frames 21-23 held at 20, then 5 frames earlier
+        self.assertEqual(table.render_files(2), set(['/p/a.0015.exr']))
+
+    def test_frame_hold_without_increment(self):
+        read = Node('Read1', 'Read', file='/p/a.%04d.exr', first=1, last=100)
+        table = self.build(read, [1, 2, 3],
+                           ('FrameHold', dict(first_frame=7, increment=0)))
+        self.assertEqual(self.paths(table), ['/p/a.0007.exr'])
+
+    def test_frame_pattern(self):
+        self.assertEqual(zn._frame_pattern('/p/[value root.shot]_%04d.exr',
+                                           '/p/sh010_0042.exr'),
+                         '/p/sh010_%04d.exr')
+        self.assertEqual(zn._frame_pattern('/p/[value v]/####.dpx',
+                                           '/p/v3/0042.dpx'),
+                         '/p/v3/####.dpx')
+        # left alone if it can't be matched up
+        self.assertEqual(zn._frame_pattern('/p/[value v]/a.%04d.exr',
+                                           '/q/v3/a.0042.exr'),
+                         '/q/v3/a.0042.exr')
+
+if __name__ == '__main__':
+    unittest.main()
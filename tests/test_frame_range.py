@@ -0,0 +1,138 @@
+"""
+Tests for parsing Nuke frame ranges and planning them into chunks.
+"""
+import unittest
+
+import support
+
+zn = support.plugin()
+
+class FrameRangeTest(unittest.TestCase):
+    def frames(self, frange, step=1):
+        return zn.expand_frames(frange, step)
+
+    def test_parts(self):
+        self.assertEqual(self.frames('5'), [5])
+        self.assertEqual(self.frames('1-5'), [1, 2, 3, 4, 5])
+        self.assertEqual(self.frames('5-1'), [1, 2, 3, 4, 5])
+        self.assertEqual(self.frames('-3--1'), [-3, -2, -1])
+        self.assertEqual(self.frames('-2-2'), [-2, -1, 0, 1, 2])
+        self.assertEqual(self.frames('1-10,20 30-31'),
+                         [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 20, 30, 31])
+
+    def test_steps(self):
+        self.assertEqual(self.frames('1-10x3'), [1, 4, 7, 10])
+        self.assertEqual(self.frames('10-1x3'), [1, 4, 7, 10])
+        self.assertEqual(self.frames('2-11x3'), [2, 5, 8, 11])
+        # the step applies to parts without their own
+        self.assertEqual(self.frames('1-10,20-30x5', step=2),
+                         [1, 3, 5, 7, 9, 20, 25, 30])
+
+    def test_every_frame_but(self):
+        self.assertEqual(self.frames('1-10y3'), [2, 3, 5, 6, 8, 9])
+        self.assertEqual(self.frames('10-50y10'),
+                         [x for x in range(11, 50) if x % 10])
+        self.assertEqual(self.frames('10-1y3'), [2, 3, 5, 6, 8, 9])
+        self.assertEqual(self.frames('1-5y1'), [])
+
+    def test_merges_overlaps(self):
+        frange = zn.FrameRange('1-10,5-15,15,12')
+        self.assertEqual(list(frange), list(range(1, 16)))
+        self.assertEqual(str(frange), '1-15')
+        self.assertEqual(str(zn.FrameRange('1-9x2,20-30x5,40')),
+                         '1-9x2,20-30x5,40')
+
+    def test_invalid(self):
+        for frange in ('1-', 'a-b', '1-10x', '1-10z2', '1..10', '1-10x2y3'):
+            self.assertRaises(ValueError, zn.FrameRange, frange)
+
+class ChunkPlanTest(unittest.TestCase):
+    def test_linear(self):
+        plan = zn.ChunkPlan(range(1, 26), 'linear', 10)
+        self.assertEqual(plan.chunks, [list(range(1, 11)),
+                                       list(range(11, 21)),
+                                       list(range(21, 26))])
+        self.assertEqual(plan.jobs(), [(list(range(1, 26)), 10)])
+
+    def test_sized_to_slots(self):
+        # 20 frames in chunks of 10 would leave 3 of 5 slots idle
+        plan = zn.ChunkPlan(range(1, 21), 'linear', 10, slots=5)
+        self.assertEqual(plan.chunk_size, 4)
+        self.assertEqual(len(plan.chunks), 5)
+        # never bigger than asked for
+        plan = zn.ChunkPlan(range(1, 101), 'linear', 10, slots=2)
+        self.assertEqual(plan.chunk_size, 10)
+        # more slots than frames
+        plan = zn.ChunkPlan(range(1, 4), 'linear', 10, slots=8)
+        self.assertEqual(plan.chunks, [[1], [2], [3]])
+        # no chunk size means a chunk per slot
+        plan = zn.ChunkPlan(range(1, 101), 'linear', None, slots=4)
+        self.assertEqual(plan.chunk_size, 25)
+
+    def test_feedback(self):
+        plan = zn.ChunkPlan(range(1, 101), 'feedback', 10, slots=5)
+        self.assertEqual(plan.chunks[:3], [[1], [100], [51]])
+        self.assertEqual(plan.chunks[3], list(range(2, 12)))
+        self.assertEqual(plan.chunks[-1], list(range(93, 100)))
+        # every frame once
+        self.assertEqual(sorted(x for chunk in plan.chunks for x in chunk),
+                         list(range(1, 101)))
+        rest = [x for x in range(2, 100) if x != 51]
+        self.assertEqual(plan.jobs(), [([1, 51, 100], 1), (rest, 10)])
+
+    def test_feedback_short_ranges(self):
+        self.assertEqual(zn.ChunkPlan([1, 2, 3], 'feedback', 10).chunks,
+                         [[1, 2, 3]])
+        plan = zn.ChunkPlan([1, 2, 3, 4], 'feedback', 10)
+        self.assertEqual(plan.chunks, [[1], [4], [3], [2]])
+        self.assertEqual(plan.jobs(), [([1, 2, 3, 4], 1)])
+
+    def test_jobs_render_exactly_the_chunks(self):
+        for frames, order, size, slots in (
+                (range(1, 101), 'feedback', 10, 1),
+                (range(1, 101), 'feedback', 7, 30),
+                (list(range(1, 50)) + list(range(60, 90, 3)), 'feedback', 4, 3),
+                (range(-20, 21), 'linear', 6, 2),
+                (range(1, 2), 'feedback', 10, 1)):
+            plan = zn.ChunkPlan(frames, order, size, slots)
+            chunked = []
+            for job_frames, job_size in plan.jobs():
+                chunked.extend(job_frames[i:i + job_size]
+                               for i in range(0, len(job_frames), job_size))
+            self.assertEqual(sorted(chunked), sorted(plan.chunks))
+
+    def test_unknown_order(self):
+        self.assertRaises(ValueError, zn.ChunkPlan, [1], 'bisect')
+
+class PlanFramesTest(unittest.TestCase):
+    def params(self, **kwargs):
+        params = dict(frange='1-100', step=1, chunk_size=10, num_instances=1,
+                      proj_name='test')
+        params.update(kwargs)
+        return params
+
+    def test_linear_keeps_the_range(self):
+        params = self.params(frange='1-100x2', num_instances=2)
+        self.assertEqual(zn.plan_frames(params, 'linear'), [params])
+
+    def test_linear_sized_to_slots(self):
+        planned = zn.plan_frames(self.params(num_instances=20), 'linear')
+        self.assertEqual(planned, [self.params(num_instances=20,
+                                               chunk_size=5)])
+
+    def test_feedback(self):
+        planned = zn.plan_frames(self.params(frange='1-20', num_instances=2),
+                                 'feedback')
+        self.assertEqual([(x['frange'], x['step'], x['chunk_size'])
+                          for x in planned],
+                         [('1,11,20', 1, 1), ('2-10,12-19', 1, 9)])
+        self.assertTrue(all(x['proj_name'] == 'test' for x in planned))
+
+    def test_empty_or_invalid(self):
+        self.assertRaises(ValueError, zn.plan_frames,
+                          self.params(frange='1-10y1'), 'linear')
+        self.assertRaises(ValueError, zn.plan_frames,
+                          self.params(frange='1-10q'), 'linear')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+"""
+Tests for writing gizmo instances into a script as Groups with a
+GizmoLibrary.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import support
+
+zn = support.plugin()
+
+GIZMO = '''#! /usr/local/Nuke8.0v5/libnuke-8.0.5.so -nx
+version 8.0 v5
+Gizmo {
+ inputs 1
+ help "A test gizmo"
+ addUserKnob {20 User}
+ addUserKnob {7 size}
+ size 5
+ name MyGlow_def
+}
+ Input {
+  inputs 0
+  name Input1
+ }
+ Blur {
+  size {{parent.size}}
+  name Blur1
+ }
+ Output {
+  name Output1
+ }
+end_group
+'''
+
+SCRIPT = '''#! /usr/local/Nuke8.0v5/libnuke-8.0.5.so -nx
+version 8.0 v5
+Root {
+ inputs 0
+ name /shows/omg/comp/comp_v001.nk
+}
+Read {
+ inputs 0
+ file /plates/plate.%04d.exr
+ name Read1
+}
+MyGlow {
+ size 12
+ name MyGlow1
+ selected true
+}
+MyGlow {
+ name MyGlow3
+}
+set C1 [stack 0]
+clone $C1 {
+ xpos 10
+ name MyGlow4
+}
+Group {
+ name Group1
+}
+ Input {
+  inputs 0
+  name Input1
+ }
+ MyGlow {
+  name MyGlow2
+ }
+ Output {
+  name Output1
+ }
+end_group
+Write {
+ file /renders/comp.%04d.exr
+ name Write1
+}
+'''
+
+class GizmoTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.gizmo_dir = os.path.join(self.dir, 'gizmos')
+        os.makedirs(self.gizmo_dir)
+        self.gizmo_path = self.write_text(os.path.join('gizmos',
+                                                       'MyGlow.gizmo'), GIZMO)
+        self.path = self.write_text('comp_v001.nk', SCRIPT)
+        self.library = zn.GizmoLibrary([os.path.join(self.dir, 'missing'),
+                                        self.gizmo_dir])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_text(self, name, text):
+        path = os.path.join(self.dir, name)
+        f = open(path, 'w')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+        return path
+
+    def expand(self):
+        out = os.path.join(self.dir, 'out.nk')
+        zn.NukeScript(self.path).write(out, gizmos=self.library)
+        return zn.NukeScript(out)
+
+    def test_definition(self):
+        definition = self.library.definition('MyGlow')
+        self.assertEqual([x.strip() for x in definition.knob_lines],
+                         [b'help "A test gizmo"', b'addUserKnob {20 User}',
+                          b'addUserKnob {7 size}', b'size 5'])
+        self.assertEqual(definition.body_lines[0].strip(), b'Input {')
+        self.assertEqual(definition.body_lines[-1].strip(), b'}')
+        self.assertTrue(self.library.definition('Blur') is None)
+
+    def test_definition_cached(self):
+        definition = self.library.definition('MyGlow')
+        self.assertTrue(self.library.definition('MyGlow') is definition)
+        self.write_text(os.path.join('gizmos', 'MyGlow.gizmo'),
+                        GIZMO.replace('size 5', 'size 6'))
+        mtime = os.path.getmtime(self.gizmo_path) + 10
+        os.utime(self.gizmo_path, (mtime, mtime))
+        changed = self.library.definition('MyGlow')
+        self.assertFalse(changed is definition)
+        self.assertTrue(b' size 6\n' in changed.knob_lines)
+
+    def test_expanded(self):
+        script = self.expand()
+        group = script.by_name['MyGlow1']
+        self.assertEqual(group.cls, 'Group')
+        self.assertEqual([script.nodes[x].name for x in group.inputs],
+                         ['Read1'])
+        # the instance's own knobs come after the gizmo's defaults
+        self.assertEqual(group.value('name'), 'MyGlow1')
+        children = sorted(x.full_name for x in script.nodes
+                          if x.parent == group.index)
+        self.assertEqual(children, ['MyGlow1.Blur1', 'MyGlow1.Input1',
+                                    'MyGlow1.Output1'])
+        self.assertEqual(script.by_name['MyGlow1.Blur1'].refs, None)
+        upstream = script.graph().upstream_names(['Write1'])
+        for name in ('MyGlow1', 'MyGlow1.Blur1', 'MyGlow4', 'Read1'):
+            self.assertTrue(name in upstream, name)
+
+        f = open(os.path.join(self.dir, 'out.nk'))
+        try:
+            text = f.read()
+        finally:
+            f.close()
+        group_text = text[text.index('Group {'):text.index('end_group')]
+        self.assertTrue(group_text.index(' size 5') <
+                        group_text.index(' size 12'))
+        self.assertTrue('addUserKnob {7 size}' in group_text)
+        self.assertFalse('MyGlow_def' in text)
+
+    def test_clones_and_nested_gizmos_kept(self):
+        script = self.expand()
+        self.assertEqual(script.by_name['Group1.MyGlow2'].cls, 'MyGlow')
+        self.assertEqual(script.by_name['MyGlow3'].cls, 'MyGlow')
+        self.assertEqual(script.by_name['MyGlow4'].cls, 'MyGlow')
+        self.assertEqual(script.by_name['MyGlow4'].clone_of,
+                         script.by_name['MyGlow3'].index)
+        self.assertEqual(script.by_name['Write1'].cls, 'Write')
+
+    def test_without_library(self):
+        out = os.path.join(self.dir, 'out.nk')
+        zn.NukeScript(self.path).write(out)
+        self.assertEqual(zn.NukeScript(out).by_name['MyGlow1'].cls, 'MyGlow')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+Tests for JobMonitor against a stand-in ZYNC client following hundreds of
+jobs.
+"""
+import sys
+import threading
+import time
+import unittest
+
+import support
+
+zn = support.plugin()
+
+class StatusAPI(object):
+    """
+    A stand-in ZYNC client whose jobs move from queued to running to done
+    (or error) over a few status calls. Every call to get_job_status is
+    kept, so tests can check they were batched.
+    """
+    def __init__(self, job_count, fail_every=0):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.polls = dict()
+        self.outcomes = dict()
+        for job_id in range(1, job_count + 1):
+            failed = fail_every and job_id % fail_every == 0
+            self.outcomes[job_id] = 'error' if failed else 'done'
+        self.errors = 0
+
+    def login(self, username=None, password=None):
+        pass
+
+    def get_job_status(self, job_ids):
+        with self.lock:
+            if self.errors:
+                self.errors -= 1
+                raise IOError('connection reset')
+            self.calls.append(list(job_ids))
+            statuses = dict()
+            for job_id in job_ids:
+                # jobs further down the list take longer
+                polls = self.polls.get(job_id, 0) + 1
+                self.polls[job_id] = polls
+                stage = polls - job_id % 3
+                if stage < 1:
+                    status = 'queued'
+                elif stage < 3:
+                    status = 'running'
+                else:
+                    status = self.outcomes[job_id]
+                statuses[job_id] = {'status': status,
+                                    'render_seconds': 10 * job_id}
+            return {'code': 0, 'response': statuses}
+
+class OldAPI(object):
+    """
+    A client from before job statuses could be fetched.
+    """
+    def login(self, username=None, password=None):
+        pass
+
+class JobMonitorTest(unittest.TestCase):
+    def setUp(self):
+        self.session = zn.ZYNC_SESSION
+        self.stderr = sys.stderr
+
+    def tearDown(self):
+        zn.ZYNC_SESSION = self.session
+        sys.stderr = self.stderr
+
+    def log_in(self, client):
+        zn.ZYNC_SESSION = zn.ZyncSession(connect=lambda: client, ttl=60)
+        zn.ZYNC_SESSION.login('artist', 'secret')
+
+    def join(self, monitor):
+        # with a wait that doesn't block, the thread may be done already
+        thread = monitor.thread
+        if thread is not None:
+            thread.join(5)
+        self.assertTrue(monitor.thread is None)
+
+    def wait(self, monitor, seconds=10):
+        end = time.time() + seconds
+        while monitor.active() and time.time() < end:
+            time.sleep(0.01)
+        self.assertEqual(monitor.active(), [])
+
+    def test_batches_hundreds_of_jobs(self):
+        api = StatusAPI(300, fail_every=50)
+        self.log_in(api)
+        monitor = zn.JobMonitor(interval=0.01, max_interval=0.02)
+        changes = []
+        monitor.add_listener(changes.append)
+        finished = []
+        for job_id in range(1, 301):
+            job = monitor.add(job_id, 'job %d' % (job_id,), 'artist',
+                              on_done=finished.append)
+            self.assertTrue(job is not None)
+        self.wait(monitor)
+
+        jobs = dict((x.job_id, x) for x in monitor.jobs)
+        self.assertEqual(len([x for x in jobs.values() if x.failed()]), 6)
+        self.assertEqual(len([x for x in jobs.values() if x.done()]), 294)
+        self.assertEqual(sorted(x.job_id for x in finished),
+                         sorted(x for x, y in jobs.items() if y.done()))
+        self.assertEqual(jobs[7].render_seconds(), 70.0)
+        # a handful of requests for all 300 jobs, not one each
+        self.assertTrue(len(api.calls) < 10, len(api.calls))
+        self.assertEqual(monitor.requests, len(api.calls))
+        self.assertEqual(len(api.calls[0]), 300)
+        # finished jobs aren't asked about again
+        for before, after in zip(api.calls, api.calls[1:]):
+            self.assertTrue(set(after) <= set(before))
+        # added, then at least queued or running, then finished
+        self.assertTrue(len(changes) >= 900, len(changes))
+
+    def test_backs_off_while_nothing_changes(self):
+        # the job starts running on the 8th round and finishes on the 10th
+        statuses = [{}] * 7 + [{1: {'status': 'running'}}, {},
+                               {1: {'status': 'done'}}]
+        now = [1000.0]
+        waits = []
+        def wait(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+        def fetch(username, job_ids):
+            return statuses.pop(0)
+        monitor = zn.JobMonitor(fetch=fetch, interval=15, max_interval=300,
+                                clock=lambda: now[0], wait=wait)
+        job = monitor.add(1, 'job', 'artist')
+        self.join(monitor)
+        self.assertEqual(waits, [15, 30, 60, 120, 240, 300, 300, 300,
+                                 15, 30])
+        self.assertEqual(statuses, [])
+        self.assertTrue(job.done())
+        self.assertEqual(job.submitted, 1000.0)
+        self.assertEqual(job.started, 1000.0 + sum(waits[:8]))
+        self.assertEqual(job.finished, 1000.0 + sum(waits))
+        self.assertEqual(job.render_seconds(), 45.0)
+
+    def test_wake_resets_the_interval(self):
+        rounds = []
+        def wait(seconds):
+            rounds.append(seconds)
+            if len(rounds) == 4:
+                monitor.wake()
+            if len(rounds) == 6:
+                monitor.jobs[0].status = 'done'
+        monitor = zn.JobMonitor(fetch=lambda username, job_ids: {},
+                                interval=10, max_interval=1000, wait=wait)
+        monitor.add(1, 'job', 'artist')
+        self.join(monitor)
+        # waking brings the next round's gap back down
+        self.assertEqual(rounds, [10, 20, 40, 80, 20, 40])
+
+    def test_not_started_without_batched_status(self):
+        self.log_in(OldAPI())
+        sys.stderr = _Discard()
+        monitor = zn.JobMonitor(interval=0.01)
+        self.assertTrue(monitor.add(1, 'job', 'artist') is None)
+        self.assertTrue(monitor.unsupported)
+        self.assertTrue(monitor.thread is None)
+        self.assertEqual(monitor.jobs, [])
+
+    def test_fetch_errors_are_reported(self):
+        api = StatusAPI(3)
+        api.errors = 2
+        self.log_in(api)
+        sys.stderr = output = _Discard()
+        monitor = zn.JobMonitor(interval=0.01, max_interval=0.02)
+        for job_id in range(1, 4):
+            monitor.add(job_id, 'job', 'artist')
+        self.wait(monitor)
+        self.assertTrue('connection reset' in ''.join(output.lines))
+        self.assertTrue(monitor.error is None)
+        self.assertTrue(all(x.done() for x in monitor.jobs))
+
+class _Discard(object):
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+    def flush(self):
+        pass
+
+if __name__ == '__main__':
+    unittest.main()
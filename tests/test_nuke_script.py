@@ -0,0 +1,184 @@
+"""
+Tests for reading and writing .nk scripts with NukeScript: a script written
+back out reads the same as the original, pruned and with knobs replaced.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+zn = support.plugin()
+
+SCRIPT = r'''#! /usr/local/Nuke8.0v5/libnuke-8.0.5.so -nx
+version 8.0 v5
+Root {
+ inputs 0
+ name /shows/omg/comp/comp_v001.nk
+ first_frame 1
+ last_frame 100
+}
+Read {
+ inputs 0
+ file "/plates/[value root.first_frame]/plate.%04d.exr"
+ name Read1
+}
+set N1 [stack 0]
+Blur {
+ size 4
+ name Blur1
+}
+push $N1
+Grade {
+ white {1.1 1 1 1}
+ label "two\nlines"
+ name Grade1
+}
+Merge2 {
+ inputs 2
+ name Merge1
+}
+Group {
+ name Group1
+}
+ Input {
+  inputs 0
+  name Input1
+ }
+ Blur {
+  size {{parent.Blur1.size}}
+  name Blur2
+ }
+ Output {
+  name Output1
+ }
+end_group
+clone $C1a2b3c4d {
+ xpos 10
+}
+Write {
+ file /renders/comp.%04d.exr
+ name Write1
+}
+Dot { name Dot1 }
+push $N1
+Write {
+ file /renders/plate.%04d.exr
+ disable true
+ name Write2
+}
+'''
+
+def describe(script):
+    """
+    Returns what matters about each node of a script, by name: its class,
+    parent, inputs and tracked knob values.
+    """
+    nodes = dict()
+    for node in script.nodes:
+        inputs = [script.nodes[x].full_name if x is not None else None
+                  for x in node.inputs]
+        parent = script.nodes[node.parent].full_name \
+            if node.parent is not None else None
+        knobs = dict((x, node.value(x)) for x in node.knobs)
+        nodes[node.full_name] = (node.cls, parent, inputs, knobs)
+    return nodes
+
+class NukeScriptTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = self.write_text('comp_v001.nk', SCRIPT)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_text(self, name, text):
+        path = os.path.join(self.dir, name)
+        f = open(path, 'wb')
+        try:
+            f.write(text.encode('utf-8'))
+        finally:
+            f.close()
+        return path
+
+    def read(self, path):
+        f = open(path, 'rb')
+        try:
+            return f.read().decode('utf-8')
+        finally:
+            f.close()
+
+    def test_parse(self):
+        script = zn.NukeScript(self.path)
+        nodes = describe(script)
+        self.assertEqual(nodes['Merge1'][2], ['Grade1', 'Blur1'])
+        self.assertEqual(nodes['Group1.Blur2'][1], 'Group1')
+        self.assertEqual(nodes['Group1'][2], ['Merge1'])
+        self.assertEqual(nodes['Dot1'][2], ['Write1'])
+        self.assertEqual(nodes['Write2'][2], ['Read1'])
+        self.assertEqual([x.name for x in script.writes()], ['Write1'])
+        self.assertEqual(sorted(script.by_name['Group1.Blur2'].refs),
+                         ['Blur1'])
+        self.assertEqual(script.root.value('last_frame'), '100')
+
+    def test_round_trip(self):
+        script = zn.NukeScript(self.path)
+        out = os.path.join(self.dir, 'out.nk')
+        script.write(out)
+        written = zn.NukeScript(out)
+        self.assertEqual(describe(written), describe(script))
+
+        # and writing what was written changes nothing more
+        again = os.path.join(self.dir, 'again.nk')
+        written.write(again)
+        self.assertEqual(self.read(again), self.read(out))
+
+    def test_pruned(self):
+        script = zn.NukeScript(self.path)
+        keep = script.graph().upstream_names(['Write2'])
+        self.assertEqual(sorted(keep), ['Read1', 'Write2'])
+        out = os.path.join(self.dir, 'out.nk')
+        script.write(out, keep=keep)
+        written = zn.NukeScript(out)
+        self.assertEqual(sorted(written.by_name),
+                         sorted(['Read1', 'Write2', written.root.full_name]))
+        nodes = describe(script)
+        for name, node in describe(written).items():
+            if name != written.root.full_name:
+                self.assertEqual(node, nodes[name])
+        self.assertTrue('version 8.0 v5' in self.read(out))
+
+    def test_values(self):
+        script = zn.NukeScript(self.path)
+        values = script.freeze(lambda node, knob_name, value:
+                               value.replace('[value root.first_frame]', '1'))
+        self.assertEqual(values, {('Read1', 'file'):
+                                  '/plates/1/plate.%04d.exr'})
+        values[('Write1', 'file')] = '/renders/my comp/"v1".%04d.exr'
+        out = os.path.join(self.dir, 'out.nk')
+        script.write(out, values=values)
+        written = zn.NukeScript(out)
+        self.assertEqual(written.by_name['Read1'].value('file'),
+                         '/plates/1/plate.%04d.exr')
+        self.assertEqual(written.by_name['Write1'].value('file'),
+                         '/renders/my comp/"v1".%04d.exr')
+        self.assertEqual(list(written.expressions()), [])
+
+    def test_quoting(self):
+        for value in ('plain', 'with space', 'a"quote', 'back\\slash',
+                      '[not an expression]', '$dollar', 'two\nlines', ''):
+            self.assertEqual(zn.tcl_unquote(zn.tcl_quote(value)), value)
+
+    def test_truncated(self):
+        path = self.write_text('truncated.nk',
+                               SCRIPT[:SCRIPT.index(' Output {')])
+        script = zn.NukeScript(path)
+        self.assertTrue('Group1.Blur2' in script.by_name)
+        out = os.path.join(self.dir, 'out.nk')
+        script.write(out)
+        self.assertEqual(sorted(describe(zn.NukeScript(out))),
+                         sorted(describe(script)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Tests for checking where Write nodes render to with check_outputs(), and
+making their directories with create_directories().
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+zn = support.plugin()
+
+class CheckOutputsTest(unittest.TestCase):
+    def test_separate_outputs(self):
+        report = zn.check_outputs([
+            ('Write1', '/renders/a/a.%04d.exr', [1, 2], None),
+            ('Write2', '/renders/b/b.####.exr', [1, 2], None)])
+        self.assertTrue(report.ok())
+        self.assertEqual(report.directories, set(['/renders/a', '/renders/b']))
+
+    def test_collisions(self):
+        report = zn.check_outputs([
+            ('Write1', '/renders/a.%04d.exr', [1, 2, 3], None),
+            ('Write2', '/renders/a.####.exr', [3, 4], None),
+            ('Write3', '/renders//a.%04d.exr', [3], None)])
+        self.assertFalse(report.ok())
+        self.assertEqual(report.collisions, {
+            (('Write1', 'Write2', 'Write3'), '/renders/a.%04d.exr'): [3]})
+        self.assertEqual(report.summary(),
+                         'Write1 and Write2 and Write3 all render '
+                         '/renders/a.%04d.exr (frames 3)')
+
+    def test_views(self):
+        # one file per view, so the views don't collide with each other
+        report = zn.check_outputs([
+            ('Write1', '/renders/%V/a.%04d.exr', [1], ['left', 'right']),
+            ('Write2', '/renders/right/a.%04d.exr', [1], None)])
+        self.assertEqual(list(report.collisions),
+                         [(('Write1', 'Write2'), '/renders/%V/a.%04d.exr')])
+        self.assertEqual(report.directories,
+                         set(['/renders/left', '/renders/right']))
+
+    def test_clobbers(self):
+        report = zn.check_outputs(
+            [('Write1', '/renders/a.%04d.exr', [1, 2, 3], None),
+             ('Write2', '/renders/still.exr', None, None)],
+            [('Read1', '/renders/a.####.exr', [2, 3, 4], None),
+             ('Read2', '/renders/still.exr', None, None)])
+        self.assertEqual(report.collisions, {})
+        self.assertEqual(report.clobbers, {
+            (('Write1', 'Read1'), '/renders/a.%04d.exr'): [2, 3],
+            (('Write2', 'Read2'), '/renders/still.exr'): [None]})
+        self.assertEqual(report.summary().splitlines(), [
+            'Write1 overwrites /renders/a.%04d.exr, which Read1 reads '
+            '(frames 2-3)',
+            'Write2 overwrites /renders/still.exr, which Read2 reads'])
+
+    def test_write_sequences(self):
+        nuke = support.new_script()
+        nuke.Node('Write', 'Write1', file='/renders/a.%04d.exr')
+        nuke.Node('Write', 'Write2', file='/renders/b.%04d.exr',
+                  use_limit=True, first=3, last=4)
+        nuke.Node('Write', 'Write3', file='/renders/%V/c.exr', views='left')
+        off = nuke.Node('Write', 'Write4', file='/renders/a.%04d.exr')
+        off.knob('disable').setValue(True)
+        nuke.Node('Read', 'Read1', file='/renders/a.%04d.exr')
+        sequences = zn.write_sequences(nuke.allNodes(), [1, 2, 3, 4, 5],
+                                       ['left', 'right'])
+        self.assertEqual(sequences, [
+            ('Write1', '/renders/a.%04d.exr', [1, 2, 3, 4, 5], None),
+            ('Write2', '/renders/b.%04d.exr', [3, 4], None),
+            ('Write3', '/renders/%V/c.exr', None, ['left'])])
+        self.assertTrue(zn.check_outputs(sequences).ok())
+
+class CreateDirectoriesTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, *names):
+        return os.path.join(self.dir, *names)
+
+    def test_creates_missing(self):
+        os.makedirs(self.path('exists'))
+        created = zn.create_directories([
+            self.path('exists'), self.path('a', 'b', 'c'), self.path('a', 'b'),
+            self.path('a', 'bc'), self.path('d'), self.path('d'), ''],
+            workers=4)
+        self.assertEqual(sorted(created), [self.path('a', 'b', 'c'),
+                                           self.path('a', 'bc'),
+                                           self.path('d')])
+        for name in ('exists', 'a/b/c', 'a/b', 'a/bc', 'd'):
+            self.assertTrue(os.path.isdir(self.path(*name.split('/'))))
+
+    def test_nothing_to_do(self):
+        self.assertEqual(zn.create_directories([self.dir]), [])
+        self.assertEqual(zn.create_directories([]), [])
+
+    def test_error(self):
+        f = open(self.path('file'), 'w')
+        f.close()
+        self.assertRaises(OSError, zn.create_directories,
+                          [self.path('file', 'sub'), self.path('ok')])
+        # the others are still made
+        self.assertTrue(os.path.isdir(self.path('ok')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Tests for check_sequences(): finding the missing and empty frames of the
+files Read nodes use.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+zn = support.plugin()
+
+class CheckSequencesTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def touch(self, name, data=b'exr'):
+        path = os.path.join(self.dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        f = open(path, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+
+    def pattern(self, name):
+        return os.path.join(self.dir, name)
+
+    def frames(self, problems):
+        # frames come back in no particular order
+        return dict((x, sorted(y)) for x, y in problems.items())
+
+    def test_complete(self):
+        for frame in range(1, 11):
+            self.touch('plate.%04d.exr' % (frame,))
+        report = zn.check_sequences([('Read1', self.pattern('plate.####.exr'),
+                                      list(range(1, 11)), None)])
+        self.assertTrue(report.ok())
+        self.assertEqual(report.files_checked, 10)
+
+    def test_missing_and_empty(self):
+        for frame in (1, 2, 4, 5):
+            self.touch('plate.%04d.exr' % (frame,))
+        self.touch('plate.0003.exr', b'')
+        report = zn.check_sequences([('Read1', self.pattern('plate.%04d.exr'),
+                                      list(range(1, 8)), None)])
+        self.assertFalse(report.ok())
+        self.assertEqual(self.frames(report.missing), {'Read1': [6, 7]})
+        self.assertEqual(report.empty, {'Read1': [3]})
+        self.assertEqual(report.summary().splitlines(),
+                         ['Read1: missing frames 6-7', 'Read1: empty frames 3'])
+
+    def test_without_empty_check(self):
+        self.touch('plate.0001.exr', b'')
+        sequences = [('Read1', self.pattern('plate.####.exr'), [1, 2], None)]
+        report = zn.check_sequences(sequences, check_empty=False)
+        self.assertEqual(report.missing, {'Read1': [2]})
+        self.assertEqual(report.empty, {})
+
+    def test_views(self):
+        for view in ('l', 'r'):
+            for frame in (1, 2):
+                self.touch('%s/plate_%s.%d.exr' % (view.upper(), view, frame))
+        self.touch('R/plate_r.3.exr')
+        pattern = self.pattern('%V/plate_%v.%d.exr')
+        report = zn.check_sequences([('Read1', pattern, [1, 2, 3],
+                                      ['L', 'R'])])
+        self.assertEqual(report.missing, {'Read1': [3]})
+        self.assertEqual(report.files_checked, 6)
+
+    def test_missing_directory(self):
+        self.touch('still.exr')
+        report = zn.check_sequences([
+            ('Read1', self.pattern('gone/plate.####.exr'), [1, 2], None),
+            ('Read2', self.pattern('still.exr'), None, None),
+            ('Read3', self.pattern('gone.exr'), None, None)])
+        self.assertEqual(self.frames(report.missing),
+                         {'Read1': [1, 2], 'Read3': [None]})
+        self.assertEqual(report.summary().splitlines(),
+                         ['Read1: missing frames 1-2', 'Read3: missing file'])
+
+    def test_shared_files(self):
+        self.touch('plate.0001.exr')
+        pattern = self.pattern('plate.####.exr')
+        report = zn.check_sequences([('Read1', pattern, [1, 2], None),
+                                     ('Read2', pattern, [2], None)], workers=1)
+        self.assertEqual(report.missing, {'Read1': [2], 'Read2': [2]})
+
+class ExpandPathTest(unittest.TestCase):
+    def test_frame_tokens(self):
+        self.assertEqual(zn.expand_path('a.####.exr', 7), 'a.0007.exr')
+        self.assertEqual(zn.expand_path('a.#.exr', 123), 'a.123.exr')
+        self.assertEqual(zn.expand_path('a.%04d.exr', 7), 'a.0007.exr')
+        self.assertEqual(zn.expand_path('a.%d.exr', 7), 'a.7.exr')
+        self.assertEqual(zn.expand_path('a.####.exr'), 'a.####.exr')
+
+    def test_view_tokens(self):
+        self.assertEqual(zn.expand_path('%V/a_%v.####.exr', 1, 'left'),
+                         'left/a_l.0001.exr')
+        self.assertEqual(zn.expand_path('%V/a_%v.exr', None, 'Right'),
+                         'Right/a_r.exr')
+        self.assertEqual(zn.expand_path('%V/a.exr'), '%V/a.exr')
+
+if __name__ == '__main__':
+    unittest.main()
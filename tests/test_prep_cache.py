@@ -0,0 +1,186 @@
+"""
+Tests for resubmitting a script through PrepCache: what's reused when
+nothing changed, and what's worked out again when a knob, an input or the
+set of Write nodes changes.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+zn = support.plugin()
+
+SCRIPT = '''#! /usr/local/Nuke8.0v5/libnuke-8.0.5.so -nx
+version 8.0 v5
+Root {
+ inputs 0
+ name %(path)s
+ first_frame 1
+ last_frame 10
+ shot sh010
+}
+Read {
+ inputs 0
+ file "/plates/[value root.shot]/plate.%%04d.exr"
+ name Read1
+}
+Grade {
+ white %(white)s
+ name Grade1
+}
+Write {
+ file "/renders/[value root.shot]/Write1.%%04d.exr"
+ name Write1
+}
+%(mark)sRead {
+ inputs 0
+ file "/plates/[value root.shot]/bg.%%04d.exr"
+ name Read2
+}
+%(push)sWrite {
+ file "/renders/[value root.shot]/Write2.%%04d.exr"
+ name Write2
+}
+'''
+
+class PrepCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'comp_v001.nk')
+        self.cache = zn.PrepCache(os.path.join(self.dir, 'cache',
+                                               'nuke_prep_cache.json'))
+        self.evaluated = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_script(self, white='1.1', rewire=False):
+        """
+        Writes the test script. If rewire is set, Write2 reads from Write1
+        instead of Read2.
+        """
+        mark = push = ''
+        if rewire:
+            mark, push = 'set N1 [stack 0]\n', 'push $N1\n'
+        f = open(self.path, 'w')
+        try:
+            f.write(SCRIPT % dict(path=self.path, white=white, mark=mark,
+                                  push=push))
+        finally:
+            f.close()
+
+    def read(self, path):
+        f = open(path)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def evaluate(self, node, knob_name, value):
+        self.evaluated.append(node.full_name)
+        return value.replace('[value root.shot]', 'sh010')
+
+    def submit(self, groups=(('Write1',),)):
+        """
+        Prepares the script the way the render panel does, returning the
+        PreparedScript and the path written.
+        """
+        del self.evaluated[:]
+        groups = [list(x) for x in groups]
+        script = zn.NukeScript(self.path)
+        prepared = self.cache.get(script, groups)
+        self.cached_masks = prepared.masks is not None
+        if prepared.masks is None:
+            prepared.masks = script.graph().upstream_masks(groups)
+        write_names = [x for group in groups for x in group]
+        path = zn.prepare_script(script, write_names, self.evaluate,
+                                 keep=set(prepared.masks), prepared=prepared)
+        self.cache.save(prepared)
+        return prepared, path
+
+    def test_unchanged_script_is_reused(self):
+        self.write_script()
+        first, path = self.submit()
+        self.assertFalse(self.cached_masks)
+        self.assertEqual(sorted(self.evaluated), ['Read1', 'Write1'])
+        mtime = os.path.getmtime(path)
+
+        second, again = self.submit()
+        self.assertTrue(self.cached_masks)
+        self.assertEqual(self.evaluated, [])
+        self.assertEqual(second.reused, 2)
+        # so the cache isn't written again either
+        self.assertTrue(first.changed())
+        self.assertFalse(second.changed())
+        self.assertEqual(again, path)
+        self.assertEqual(os.path.getmtime(again), mtime)
+        self.assertTrue('/plates/sh010/plate.%04d.exr' in self.read(again))
+
+    def test_changed_knob(self):
+        self.write_script()
+        first, path = self.submit()
+        self.write_script(white='1.5')
+        second, again = self.submit()
+        # the graph is the same, and no expression depends on Grade1
+        self.assertTrue(self.cached_masks)
+        self.assertEqual(self.evaluated, [])
+        # but the script written is new
+        self.assertNotEqual(again, path)
+        self.assertTrue('white 1.5' in self.read(again))
+
+    def test_changed_expression_is_evaluated_again(self):
+        self.write_script()
+        self.submit()
+        text = self.read(self.path)
+        f = open(self.path, 'w')
+        try:
+            f.write(text.replace('plate.%04d', 'plate_v2.%04d'))
+        finally:
+            f.close()
+        self.submit()
+        self.assertEqual(self.evaluated, ['Read1'])
+
+    def test_changed_input(self):
+        self.write_script()
+        self.submit(groups=[['Write2']])
+        self.write_script(rewire=True)
+        prepared, path = self.submit(groups=[['Write2']])
+        self.assertFalse(self.cached_masks)
+        self.assertEqual(sorted(prepared.masks),
+                         ['Grade1', 'Read1', 'Write1', 'Write2'])
+        self.assertTrue('name Read2' not in self.read(path))
+
+    def test_changed_write_set(self):
+        self.write_script()
+        self.submit(groups=[['Write1']])
+        prepared, path = self.submit(groups=[['Write1', 'Write2']])
+        # nothing is shared with the Write1 entry
+        self.assertFalse(self.cached_masks)
+        self.assertEqual(prepared.reused, 0)
+        self.assertEqual(sorted(self.evaluated),
+                         ['Read1', 'Read2', 'Write1', 'Write2'])
+        # and both entries are kept
+        self.submit(groups=[['Write1']])
+        self.assertTrue(self.cached_masks)
+        self.assertEqual(self.evaluated, [])
+
+    def test_removed_output_is_written_again(self):
+        self.write_script()
+        first, path = self.submit()
+        os.remove(path)
+        second, again = self.submit()
+        self.assertEqual(again, path)
+        self.assertTrue(os.path.exists(again))
+
+    def test_turned_off(self):
+        self.cache.max_entries = 0
+        self.write_script()
+        self.submit()
+        self.submit()
+        self.assertFalse(self.cached_masks)
+        self.assertEqual(sorted(self.evaluated), ['Read1', 'Write1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Tests for Profiler traces and the rolling log behind profile_percentiles.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import support
+
+zn = support.plugin()
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.dir, 'profile.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def profiler(self, name='comp', spans=()):
+        profiler = zn.Profiler(name)
+        start = profiler.start
+        for span, begin, end in spans:
+            profiler.add(span, start + begin, start + end)
+        return profiler
+
+    def save(self, profiler, **kwargs):
+        kwargs.setdefault('log_size', 10)
+        return profiler.save(trace_dir=os.path.join(self.dir, 'traces'),
+                             log_path=self.log_path, keep_traces=3, **kwargs)
+
+    def log_lines(self):
+        f = open(self.log_path)
+        try:
+            return f.readlines()
+        finally:
+            f.close()
+
+    def test_trace(self):
+        profiler = self.profiler(spans=[('parse', 0, 0.5),
+                                        ('write', 0.5, 0.75)])
+        profiler.count('nodes', 10)
+        profiler.count('nodes', 5)
+        def worker():
+            profiler.add('upload', profiler.start, profiler.start + 1)
+        thread = threading.Thread(target=worker, name='uploader')
+        thread.start()
+        thread.join()
+
+        trace = profiler.trace()
+        events = trace['traceEvents']
+        names = [x['args']['name'] for x in events if x['ph'] == 'M']
+        self.assertEqual(names, [threading.current_thread().name,
+                                 'uploader'])
+        spans = dict((x['name'], x) for x in events if x['ph'] == 'X')
+        self.assertEqual(spans['parse']['ts'], 0)
+        self.assertEqual(spans['parse']['dur'], 500000)
+        self.assertEqual(spans['write']['ts'], 500000)
+        self.assertEqual(spans['write']['dur'], 250000)
+        self.assertNotEqual(spans['upload']['tid'], spans['parse']['tid'])
+        self.assertEqual(trace['otherData']['counts'], {'nodes': 15})
+
+    def test_nested_spans(self):
+        profiler = zn.Profiler('comp')
+        with profiler.span('outer') as outer:
+            with profiler.span('inner'):
+                pass
+            outer.set(nodes=3)
+        self.assertEqual([x[0] for x in profiler.spans], ['inner', 'outer'])
+        self.assertEqual(profiler.spans[1][4], {'nodes': 3})
+
+    def test_disabled_records_nothing(self):
+        profiler = zn.Profiler('comp', enabled=False)
+        with profiler.span('parse'):
+            profiler.count('nodes')
+        self.assertEqual(profiler.spans, [])
+        self.assertEqual(profiler.counts, {})
+        self.assertTrue(self.save(profiler) is None)
+        self.assertFalse(os.path.exists(self.log_path))
+
+    def test_off_by_default(self):
+        self.assertFalse(zn.PROFILE_SUBMIT)
+
+    def test_save(self):
+        profiler = self.profiler(spans=[('parse', 0, 2.0)])
+        trace_path = self.save(profiler)
+        f = open(trace_path)
+        try:
+            self.assertEqual(json.load(f), profiler.trace())
+        finally:
+            f.close()
+        entry = json.loads(self.log_lines()[0])
+        self.assertEqual(entry['name'], 'comp')
+        self.assertEqual(entry['spans'], {'parse': 2.0, 'total': 2.0})
+
+    def test_log_is_appended_and_trimmed(self):
+        for i in range(40):
+            self.save(self.profiler('comp%d' % (i,), [('parse', 0, 1.0)]))
+            lines = self.log_lines()
+            # never far over log_size, and never cut below it
+            self.assertTrue(len(lines) <= 21, len(lines))
+            self.assertTrue(len(lines) >= min(i + 1, 10), len(lines))
+            self.assertEqual(json.loads(lines[-1])['name'], 'comp%d' % (i,))
+        self.assertEqual(len(os.listdir(os.path.join(self.dir, 'traces'))),
+                         3)
+
+    def test_percentiles(self):
+        for seconds in range(1, 11):
+            self.save(self.profiler(spans=[('parse', 0, float(seconds)),
+                                           ('write', seconds,
+                                            seconds + 0.5)]),
+                      log_size=100)
+        percentiles = zn.profile_percentiles(self.log_path)
+        self.assertEqual(percentiles['parse'], {50: 5.0, 90: 9.0, 99: 10.0})
+        self.assertEqual(percentiles['write'], {50: 0.5, 90: 0.5, 99: 0.5})
+        self.assertEqual(percentiles['total'][99], 10.5)
+        table = zn.format_profile(percentiles).splitlines()
+        # slowest first
+        self.assertEqual([x.split()[0] for x in table[1:]],
+                         ['total', 'parse', 'write'])
+
+    def test_percentiles_skip_bad_lines(self):
+        self.save(self.profiler(spans=[('parse', 0, 1.0)]))
+        f = open(self.log_path, 'a')
+        try:
+            f.write('{not json\n')
+        finally:
+            f.close()
+        self.assertEqual(zn.profile_percentiles(self.log_path)['parse'][50],
+                         1.0)
+        self.assertEqual(zn.profile_percentiles(
+            os.path.join(self.dir, 'missing.jsonl')), {})
+        self.assertEqual(zn.format_profile({}), 'No submissions profiled yet.')
+
+if __name__ == '__main__':
+    unittest.main()
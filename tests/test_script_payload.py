@@ -0,0 +1,138 @@
+"""
+Tests that read_script_payload() rebuilds exactly the script a payload was
+written from, gzipped whole or as a delta against an earlier version.
+"""
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import support
+
+zn = support.plugin()
+
+def script_lines(count, seed=0):
+    """
+    Returns the lines of a script of count nodes, with the repeated lines
+    real scripts have.
+    """
+    rand = random.Random(seed)
+    lines = [b'#! /usr/local/Nuke8.0v5/libnuke-8.0.5.so -nx\n',
+             b'version 8.0 v5\n']
+    for i in range(count):
+        cls = rand.choice([b'Grade', b'Blur', b'Transform'])
+        lines.extend([cls + b' {\n',
+                      b' white 1.1\n',
+                      (' name %s%d\n' % (cls.decode('ascii'), i)).encode('ascii'),
+                      b'}\n'])
+    return lines
+
+class ScriptPayloadTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, lines):
+        path = os.path.join(self.dir, name)
+        f = open(path, 'wb')
+        try:
+            f.writelines(lines)
+        finally:
+            f.close()
+        return path
+
+    def round_trip(self, lines, base_lines=None):
+        """
+        Writes a payload for lines, against base_lines if given, and checks
+        it rebuilds them from the base as a path and as a list of lines.
+        Returns the payload's details.
+        """
+        path = self.write('comp_v002.nk', lines)
+        base_path = None
+        if base_lines is not None:
+            base_path = self.write('comp_v001.nk', base_lines)
+        payload_path = path + '.gz'
+        info = zn.write_script_payload(path, payload_path, base_path)
+        self.assertEqual(list(zn.read_script_payload(payload_path,
+                                                     base_path)), lines)
+        if base_lines is not None:
+            self.assertEqual(list(zn.read_script_payload(payload_path,
+                                                         base_lines)), lines)
+        self.assertEqual(info['script_sha1'], zn.hash_file(path))
+        self.assertEqual(info['script_size'], os.path.getsize(path))
+        return info
+
+    def test_whole_script(self):
+        info = self.round_trip(script_lines(200))
+        self.assertEqual(info['encoding'], 'gzip')
+        self.assertTrue(info['base_sha1'] is None)
+
+    def test_edits(self):
+        base = script_lines(500)
+        rand = random.Random(1)
+        edits = [
+            # a knob changed
+            lambda x: x[:101] + [b' white 1.5\n'] + x[102:],
+            # nodes added and removed
+            lambda x: x[:40] + script_lines(5, seed=2)[2:] + x[40:300] +
+                      x[340:],
+            # a block moved to the front
+            lambda x: x[:2] + x[1000:1100] + x[2:1000] + x[1100:],
+            # a change right at either end
+            lambda x: [b'#! /usr/local/Nuke9.0v1/libnuke-9.0.1.so -nx\n'] +
+                      x[1:-1] + [b'}\n', b'\n'],
+            # shuffled
+            lambda x: rand.sample(x, len(x)),
+            # nothing left in common
+            lambda x: [b'Root {\n', b'}\n'],
+            # empty
+            lambda x: [],
+        ]
+        for edit in edits:
+            lines = edit(list(base))
+            info = self.round_trip(lines, base)
+            self.assertEqual(info['encoding'], 'delta')
+            self.assertEqual(info['base_sha1'], zn.hash_file(
+                os.path.join(self.dir, 'comp_v001.nk')))
+
+    def test_delta_is_small(self):
+        base = script_lines(2000)
+        lines = list(base)
+        lines[4001] = b' white 1.5\n'
+        self.round_trip(lines, base)
+        delta_size = os.path.getsize(os.path.join(self.dir, 'comp_v002.nk.gz'))
+        zn.write_script_payload(os.path.join(self.dir, 'comp_v002.nk'),
+                                os.path.join(self.dir, 'whole.gz'))
+        self.assertTrue(delta_size * 10 < os.path.getsize(
+            os.path.join(self.dir, 'whole.gz')))
+
+    def test_lines_without_newlines(self):
+        base = script_lines(20)
+        lines = base[:-1] + [b'}']
+        self.round_trip(lines, base)
+        self.round_trip([b'Root {\n', b'C 1 2\n', b'I 3'], base)
+
+    def test_payload_is_reproducible(self):
+        lines = script_lines(50)
+        path = self.write('comp_v001.nk', lines)
+        zn.write_script_payload(path, path + '.gz')
+        first = zn.hash_file(path + '.gz')
+        zn.write_script_payload(path, path + '.gz')
+        self.assertEqual(zn.hash_file(path + '.gz'), first)
+
+    def test_bad_operation(self):
+        path = os.path.join(self.dir, 'bad.gz')
+        f = gzip.open(path, 'wb')
+        try:
+            f.write(zn.DELTA_HEADER + b'X 1 2\n')
+        finally:
+            f.close()
+        self.assertRaises(ValueError, list,
+                          zn.read_script_payload(path, [b'a\n']))
+
+if __name__ == '__main__':
+    unittest.main()
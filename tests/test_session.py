@@ -0,0 +1,343 @@
+"""
+Tests for ZyncSession and for sending submissions through SubmitQueue,
+against a local stand-in for the ZYNC API reached over HTTP by a minimal
+client.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+
+try:
+    import httplib
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    import http.client as httplib
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+import support
+from test_uploader import UploadServer
+
+zn = support.plugin()
+
+class ZyncServer(ThreadingMixIn, HTTPServer):
+    """
+    Hands out a token for each login with the right password, and accepts
+    submits made with a token it hasn't revoked.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), ZyncHandler)
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.logins = 0
+        self.submits = []
+        self.parents = 0
+        self.connections = set()
+
+    def revoke(self):
+        with self.lock:
+            self.tokens.clear()
+
+class ZyncHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers['Content-Length'] or 0)
+        body = json.loads(self.rfile.read(length).decode('utf-8'))
+        with server.lock:
+            server.connections.add(self.client_address)
+        if self.path == '/login':
+            if body.get('password') != 'secret':
+                return self.reply(401, {'error': 'Bad password.'})
+            token = uuid.uuid4().hex
+            with server.lock:
+                server.logins += 1
+                server.tokens.add(token)
+            return self.reply(200, {'token': token})
+        with server.lock:
+            authorized = self.headers['X-Zync-Token'] in server.tokens
+            if authorized and self.path == '/create_parent_job':
+                server.parents += 1
+                job_id = 1000 + server.parents
+            elif authorized:
+                server.submits.append(body)
+                job_id = len(server.submits)
+        if not authorized:
+            return self.reply(401, {'error': 'Session expired.'})
+        self.reply(200, {'code': 0, 'response': job_id})
+
+class HTTPZync(object):
+    """
+    A minimal ZYNC client for the stand-in server, keeping one connection
+    open like the real client.
+    """
+    def __init__(self, port):
+        self.conn = httplib.HTTPConnection('127.0.0.1', port, timeout=5)
+        self.token = None
+
+    def _post(self, path, body):
+        self.conn.request('POST', path, json.dumps(body).encode('utf-8'),
+                          {'Content-Type': 'application/json',
+                           'X-Zync-Token': self.token or ''})
+        response = self.conn.getresponse()
+        data = json.loads(response.read().decode('utf-8'))
+        if response.status == 401:
+            raise zn.zync.ZyncAuthenticationError(data['error'])
+        return data
+
+    def login(self, username=None, password=None):
+        self.token = self._post('/login', dict(username=username,
+                                               password=password))['token']
+
+    def submit_job(self, plugin, script_path, write_names, params):
+        return self._post('/submit_job', dict(script=script_path,
+                                              writes=write_names,
+                                              params=params))
+
+class ParentingZync(HTTPZync):
+    """
+    A client from a version of the API that can create parent jobs.
+    """
+    def create_parent_job(self, project):
+        return self._post('/create_parent_job', dict(project=project))
+
+class ZyncSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ZyncServer()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.session = zn.ZYNC_SESSION
+        self.stderr = sys.stderr
+        # jobs aren't followed with this client, which says so once
+        sys.stderr = _Discard()
+        import nuke
+        self.nuke = nuke
+        del nuke.messages[:]
+
+    def tearDown(self):
+        zn.ZYNC_SESSION = self.session
+        zn.UPLOAD_URL = None
+        sys.stderr = self.stderr
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve_uploads(self):
+        """
+        Starts a local upload server as UPLOAD_URL, and returns it with a
+        directory for cloud scripts.
+        """
+        uploads = UploadServer()
+        thread = threading.Thread(target=uploads.serve_forever)
+        thread.daemon = True
+        thread.start()
+        work_dir = tempfile.mkdtemp()
+        def stop():
+            uploads.shutdown()
+            uploads.server_close()
+            shutil.rmtree(work_dir)
+        self.addCleanup(stop)
+        zn.UPLOAD_URL = uploads.url()
+        return uploads, work_dir
+
+    def cloud_script(self, directory, name, lines):
+        path = os.path.join(directory, name)
+        f = open(path, 'w')
+        try:
+            f.writelines(lines)
+        finally:
+            f.close()
+        return path
+
+    def use_session(self, ttl=60, client=HTTPZync):
+        port = self.server.server_address[1]
+        zn.ZYNC_SESSION = zn.ZyncSession(connect=lambda: client(port),
+                                         ttl=ttl)
+        return zn.ZYNC_SESSION
+
+    def send(self, password=None, views=None, **params):
+        params = dict(params, proj_name='test', frange='1-10', step=1)
+        jobs = [(['Write1'], x, '/shots/sh010/comp_%s.nk' % (x,), params)
+                for x in views or ()]
+        submission = zn.Submission('/shots/sh010/comp.nk', ['Write1'],
+                                   params, 'artist', password, jobs=jobs)
+        zn.SubmitQueue()._send(submission)
+        return submission
+
+    def parents(self):
+        return [x['params'].get('parent_id') for x in self.server.submits]
+
+    def test_views_go_under_the_given_parent(self):
+        self.use_session()
+        self.send('secret', ['left', 'right'], parent_id=7)
+        self.assertEqual(self.parents(), [7, 7])
+        self.assertFalse('create_parent_job' in self.nuke.messages[-1])
+
+    def test_views_go_under_a_new_parent(self):
+        self.use_session(client=ParentingZync)
+        self.send('secret', ['left', 'right'])
+        self.assertEqual(self.parents(), [1001, 1001])
+        self.assertFalse('create_parent_job' in self.nuke.messages[-1])
+        # a single job doesn't need one
+        self.send(None, ['left'])
+        self.assertEqual(self.parents()[2:], [None])
+        self.assertEqual(self.server.parents, 1)
+
+    def test_views_without_parent_jobs(self):
+        # neither eye goes in as a child of the other
+        self.use_session()
+        self.send('secret', ['left', 'right'])
+        self.assertEqual(self.parents(), [None, None])
+        self.assertTrue(self.nuke.messages[-1].startswith('2 jobs submitted'))
+        self.assertTrue('create_parent_job' in self.nuke.messages[-1])
+
+    def test_uploaded_script_is_referenced(self):
+        uploads, work_dir = self.serve_uploads()
+        self.use_session()
+        path = self.cloud_script(work_dir, 'comp_abc123.nk',
+                                 ['Write {\n name Write%d\n}\n' % (x,)
+                                  for x in range(100)])
+        params = dict(proj_name='test', frange='1-10', step=1)
+        for password in ('secret', None):
+            zn.SubmitQueue()._send(zn.Submission(path, ['Write1'], params,
+                                                 'artist', password))
+        self.assertEqual(self.nuke.messages, ['Job submitted to ZYNC.'] * 2)
+        # ZYNC is pointed at what was uploaded instead of the local script
+        digest = zn.HASH_MANIFEST.digest(path + '.gz')
+        for body in self.server.submits:
+            self.assertEqual(body['script'], '%s/%s' % (uploads.url(),
+                                                        digest))
+            self.assertEqual(body['params']['files_uploaded'], 1)
+        self.assertEqual(list(uploads.completed), [digest])
+        # and the unchanged script only went up once
+        self.assertEqual(len(uploads.puts), 1)
+
+    def test_delta_reaches_zync(self):
+        uploads, work_dir = self.serve_uploads()
+        self.use_session()
+        lines = ['Write {\n name Write%d\n}\n' % (x,) for x in range(100)]
+        first = self.cloud_script(work_dir, 'comp_abc123.nk', lines)
+        lines[50] = 'Blur {\n'
+        second = self.cloud_script(work_dir, 'comp_def456.nk', lines)
+        params = dict(proj_name='test', frange='1-10', step=1)
+        for path, password in ((first, 'secret'), (second, None)):
+            zn.SubmitQueue()._send(zn.Submission(path, ['Write1'], params,
+                                                 'artist', password))
+        payloads = [x['params']['script_payload'] for x in self.server.submits]
+        self.assertEqual(payloads[0]['encoding'], 'gzip')
+        self.assertEqual(payloads[1]['encoding'], 'delta')
+        self.assertEqual(payloads[1]['base_sha1'], payloads[0]['script_sha1'])
+        # what ZYNC is pointed at rebuilds the second script from the first
+        digest = self.server.submits[1]['script'].rsplit('/', 1)[1]
+        payload_path = os.path.join(work_dir, 'received.gz')
+        f = open(payload_path, 'wb')
+        try:
+            f.write(uploads.data(digest))
+        finally:
+            f.close()
+        rebuilt = b''.join(zn.read_script_payload(payload_path, first))
+        self.assertEqual(rebuilt, ''.join(lines).encode('utf-8'))
+        self.assertEqual(zn.hash_file(second), payloads[1]['script_sha1'])
+
+    def test_without_upload_url(self):
+        self.use_session()
+        self.send('secret')
+        body = self.server.submits[0]
+        self.assertEqual(body['script'], '/shots/sh010/comp.nk')
+        self.assertFalse('files_uploaded' in body['params'])
+
+    def test_logs_in_once_across_submits(self):
+        session = self.use_session()
+        self.send('secret')
+        self.send()
+        self.send()
+        self.assertEqual(self.nuke.messages, ['Job submitted to ZYNC.'] * 3)
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual(len(self.server.submits), 3)
+        self.assertEqual(session.logins, 1)
+        # the login and every submit share one kept-alive connection
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_password_isnt_kept(self):
+        self.use_session()
+        submission = self.send('secret')
+        self.assertTrue(submission.password is None)
+
+    def test_logs_in_again_after_ttl(self):
+        session = self.use_session(ttl=0.1)
+        self.send('secret')
+        time.sleep(0.2)
+        self.assertFalse(session.valid('artist'))
+        # without the password again it can't go on
+        self.send()
+        self.assertTrue(self.nuke.messages[-1].startswith(
+            'ZYNC Login Failed'))
+        self.assertEqual(len(self.server.submits), 1)
+        self.send('secret')
+        self.assertEqual(self.nuke.messages[-1], 'Job submitted to ZYNC.')
+        self.assertEqual(self.server.logins, 2)
+        self.assertEqual(len(self.server.submits), 2)
+
+    def test_drops_login_rejected_by_zync(self):
+        session = self.use_session()
+        session.login('artist', 'secret')
+        self.server.revoke()
+        self.assertRaises(zn.zync.ZyncAuthenticationError, session.call,
+                          'artist', 'submit_job', 'nuke', '/a.nk', 'Write1',
+                          dict())
+        self.assertFalse(session.valid())
+        self.assertTrue(session.client is None)
+        session.login('artist', 'secret')
+        session.call('artist', 'submit_job', 'nuke', '/a.nk', 'Write1',
+                     dict())
+        self.assertEqual(self.server.logins, 2)
+        self.assertEqual(len(self.server.submits), 1)
+
+    def test_wrong_password(self):
+        session = self.use_session()
+        self.assertRaises(zn.zync.ZyncAuthenticationError, session.login,
+                          'artist', 'wrong')
+        self.assertFalse(session.valid())
+        self.assertEqual(session.logins, 0)
+
+    def test_other_user_logs_in_again(self):
+        session = self.use_session()
+        session.login('artist', 'secret')
+        self.assertTrue(session.valid('artist'))
+        self.assertFalse(session.valid('wrangler'))
+        self.assertRaises(zn.zync.ZyncAuthenticationError, session.login,
+                          'wrangler')
+        session.login('wrangler', 'secret')
+        self.assertEqual(session.username, 'wrangler')
+        self.assertEqual(self.server.logins, 2)
+
+class _Discard(object):
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+if __name__ == '__main__':
+    unittest.main()
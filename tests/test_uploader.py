@@ -0,0 +1,217 @@
+"""
+Tests for ChunkedUploader against a local stand-in upload server that adds
+latency and drops or refuses some of the chunks.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+import support
+
+zn = support.plugin()
+
+class UploadServer(ThreadingMixIn, HTTPServer):
+    """
+    Keeps the chunks of each file by sha1. The first PUT of every refuse_every
+    chunk gets a 503, and the first PUT of every drop_every chunk has its
+    connection closed without a response.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, refuse_every=0, drop_every=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), UploadHandler)
+        self.latency = latency
+        self.refuse_every = refuse_every
+        self.drop_every = drop_every
+        self.lock = threading.Lock()
+        self.chunks = dict()
+        self.completed = dict()
+        self.puts = []
+        self.refused = 0
+        self.dropped = 0
+        self.active = 0
+        self.peak = 0
+        self.connections = set()
+
+    def url(self):
+        return 'http://127.0.0.1:%d/upload' % (self.server_address[1],)
+
+    def data(self, digest):
+        chunks = self.chunks.get(digest, dict())
+        return b''.join(chunks[x] for x in sorted(chunks))
+
+class UploadHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def body(self):
+        return self.rfile.read(int(self.headers['Content-Length'] or 0))
+
+    def handle_one_request(self):
+        server = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            time.sleep(server.latency)
+            BaseHTTPRequestHandler.handle_one_request(self)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def do_GET(self):
+        digest = self.path.split('/')[-1]
+        with self.server.lock:
+            chunks = self.server.chunks.get(digest)
+        if chunks is None:
+            return self.reply(404)
+        self.reply(200, json.dumps({'chunks': sorted(chunks)}).encode('utf-8'))
+
+    def do_PUT(self):
+        server = self.server
+        digest, index = self.path.split('/')[-2:]
+        index = int(index)
+        data = self.body()
+        with server.lock:
+            first = (digest, index) not in server.puts
+            server.puts.append((digest, index))
+            if first and server.drop_every and \
+               index % server.drop_every == server.drop_every - 1:
+                server.dropped += 1
+                self.close_connection = True
+                return
+            if first and server.refuse_every and \
+               index % server.refuse_every == 0:
+                server.refused += 1
+                refuse = True
+            else:
+                server.chunks.setdefault(digest, dict())[index] = data
+                refuse = False
+        self.reply(503 if refuse else 201)
+
+    def do_POST(self):
+        digest = self.path.split('/')[-2]
+        body = json.loads(self.body().decode('utf-8'))
+        with self.server.lock:
+            self.server.completed[digest] = body
+        self.reply(200)
+
+class ChunkedUploaderTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(self.dir)
+
+    def serve(self, **kwargs):
+        server = UploadServer(**kwargs)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.servers.append(server)
+        return server
+
+    def make_file(self, name, size):
+        path = os.path.join(self.dir, name)
+        f = open(path, 'wb')
+        try:
+            f.write(os.urandom(size))
+        finally:
+            f.close()
+        return path
+
+    def read(self, path):
+        f = open(path, 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def uploader(self, server, **kwargs):
+        kwargs.setdefault('chunk_size', 1024)
+        kwargs.setdefault('workers', 4)
+        kwargs.setdefault('backoff', 0.001)
+        kwargs.setdefault('timeout', 5)
+        return zn.ChunkedUploader(server.url(), **kwargs)
+
+    def test_uploads_through_latency_and_drops(self):
+        server = self.serve(latency=0.005, refuse_every=5, drop_every=7)
+        paths = [self.make_file('plate.%04d.exr' % (x,), 10 * 1024 + x)
+                 for x in range(1, 4)]
+        progress = []
+        digests = self.uploader(server).upload(
+            paths, lambda sent, total: progress.append((sent, total)))
+        self.assertTrue(server.refused > 0 and server.dropped > 0)
+        for path in paths:
+            digest = digests[path]
+            self.assertEqual(server.data(digest), self.read(path))
+            self.assertEqual(server.completed[digest]['size'],
+                             os.path.getsize(path))
+        total = sum(os.path.getsize(x) for x in paths)
+        self.assertEqual(progress[-1], (total, total))
+        # chunks went up concurrently, over kept-alive connections
+        self.assertTrue(server.peak > 1)
+        self.assertTrue(len(server.connections) < len(server.puts))
+
+    def test_resumes_from_acknowledged_chunks(self):
+        server = self.serve()
+        path = self.make_file('plate.exr', 8 * 1024)
+        digest = zn.HASH_MANIFEST.digest(path)
+        data = self.read(path)
+        # an earlier upload got the first half up
+        server.chunks[digest] = dict((x, data[x * 1024:(x + 1) * 1024])
+                                     for x in range(4))
+        self.uploader(server).upload([path])
+        self.assertEqual(sorted(x[1] for x in server.puts), [4, 5, 6, 7])
+        self.assertEqual(server.data(digest), data)
+
+    def test_identical_files_are_sent_once(self):
+        server = self.serve()
+        path = self.make_file('a.exr', 3000)
+        copy = os.path.join(self.dir, 'b.exr')
+        shutil.copy(path, copy)
+        digests = self.uploader(server).upload([path, copy])
+        self.assertEqual(digests[path], digests[copy])
+        self.assertEqual(len(server.puts), 3)
+
+    def test_gives_up_after_retries(self):
+        server = self.serve(refuse_every=1)
+        path = self.make_file('a.exr', 1000)
+        # every chunk is refused once, and there's no retry left
+        self.assertRaises(IOError, self.uploader(server, retries=0).upload,
+                          [path])
+        self.assertEqual(server.completed, dict())
+
+    def test_cancel(self):
+        server = self.serve()
+        path = self.make_file('a.exr', 4000)
+        self.assertRaises(zn.UploadCancelled, self.uploader(server).upload,
+                          [path], None, lambda: True)
+        self.assertEqual(server.puts, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Tests for WriteRegistry: the Write nodes it tracks through Nuke's callbacks,
+and checking them against the live nodes before they're submitted.
+"""
+import unittest
+
+import support
+
+zn = support.plugin()
+
+class WriteRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.nuke = support.new_script()
+        self.registry = zn.WRITE_REGISTRY
+        self.changes = []
+        self.registry.add_listener(self.listener)
+
+    def tearDown(self):
+        self.registry.remove_listener(self.listener)
+
+    def listener(self):
+        # the entries as they are, without loading the registry
+        self.changes.append(sorted(self.registry.entries))
+
+    def write(self, name, path=None):
+        return self.nuke.Node('Write', name,
+                              file=path or '/renders/%s.%%04d.exr' % (name,))
+
+    def loaded(self):
+        self.write('Write1')
+        self.write('Write2')
+        self.nuke.scriptLoaded()
+        del self.changes[:]
+
+    def test_rebuilt_on_load_and_cleared_on_close(self):
+        self.assertFalse(self.registry.loaded)
+        self.loaded()
+        self.assertTrue(self.registry.loaded)
+        self.assertEqual(self.registry.enabled_names(), ['Write1', 'Write2'])
+        self.nuke.scriptClear()
+        self.assertFalse(self.registry.loaded)
+        self.assertEqual(self.changes, [[]])
+
+    def test_built_when_first_used(self):
+        self.write('Write1')
+        self.assertEqual(self.registry.enabled_names(), ['Write1'])
+        self.assertEqual(self.registry.file('Write1'),
+                         '/renders/Write1.%04d.exr')
+
+    def test_created_and_destroyed(self):
+        self.loaded()
+        node = self.write('Write3')
+        group = self.nuke.Node('Group', 'Group1')
+        self.nuke.Node('Write', 'Write4', parent=group, file='/tmp/x.exr')
+        self.assertEqual(self.changes, [['Write1', 'Write2', 'Write3']])
+        self.assertTrue(self.registry.get('Write3') is node)
+        self.assertTrue(self.registry.get('Write4') is None)
+
+        self.nuke.delete(node)
+        self.assertEqual(self.registry.enabled_names(), ['Write1', 'Write2'])
+        self.assertEqual(len(self.changes), 2)
+
+    def test_knob_changed(self):
+        self.loaded()
+        node = self.registry.get('Write1')
+        node.knob('disable').setValue(True)
+        self.nuke.knobChanged(node, 'disable')
+        self.assertEqual(self.registry.enabled_names(), ['Write2'])
+        self.assertEqual(sorted(x.name() for x in self.registry.nodes()),
+                         ['Write1', 'Write2'])
+
+        node.knob('file').setValue('/renders/new.%04d.exr')
+        self.nuke.knobChanged(node, 'file')
+        self.assertEqual(self.registry.file('Write1'), '/renders/new.%04d.exr')
+
+        node.setName('Comp')
+        self.nuke.knobChanged(node, 'name')
+        self.assertEqual(sorted(self.registry.entries), ['Comp', 'Write2'])
+
+        # other knobs are ignored
+        self.nuke.knobChanged(node, 'xpos')
+        self.assertEqual(len(self.changes), 3)
+
+    def test_verify_current(self):
+        self.loaded()
+        self.assertEqual(self.registry.verify(['Write1', 'Write2']), [])
+        self.assertEqual(self.changes, [])
+
+    def test_verify_scripted_changes(self):
+        self.loaded()
+        write1 = self.registry.get('Write1')
+        write2 = self.registry.get('Write2')
+        # none of these run knobChanged
+        write1.setName('Comp')
+        write2.knob('file').setValue('/renders/new.%04d.exr')
+        self.assertEqual(self.registry.enabled_names(), ['Write1', 'Write2'])
+
+        self.assertEqual(self.registry.verify(['Write1', 'Write2']),
+                         ['Write1'])
+        self.assertEqual(self.registry.enabled_names(), ['Comp', 'Write2'])
+        self.assertEqual(self.registry.file('Write2'), '/renders/new.%04d.exr')
+
+        write2.knob('disable').setValue(True)
+        self.assertEqual(self.registry.verify(['Write2']), ['Write2'])
+        self.assertEqual(self.registry.verify(['Missing']), ['Missing'])
+
+if __name__ == '__main__':
+    unittest.main()
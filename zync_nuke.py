@@ -16,22 +16,119 @@ Usage as a menu item:
     menu.addCommand('ZYNC Render', 'zync_nuke.submit_dialog()')
 """
 
+import array
+import bisect
+import getpass
+import glob
+import gzip
 import hashlib
+import json
+import math
 import nuke
 import nukescripts
+import optparse
 import platform
 import os
 import re
+import shutil
 import socket
 import sys
+import threading
 import time
 import traceback
 import urllib
 
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    import httplib
+    import urlparse
+except ImportError:
+    import http.client as httplib
+    import urllib.parse as urlparse
+
+try:
+    basestring
+except NameError:
+    basestring = str
+
 __author__ = 'Alex Schworer'
 __copyright__ = 'Copyright 2011, Atomic Fiction, Inc.'
 
-config_path = '%s/config_nuke.py' % (os.path.dirname(__file__),)
+# defaults for optional settings, which can be overridden in config_nuke.py
+
+# seconds submit_dialog() waits for the connection to ZYNC
+CONNECT_TIMEOUT = 30
+
+# where the plugin keeps its local caches
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.zync')
+
+# seconds before the cached project list, instance types and features are
+# refreshed in the background
+CACHE_TTL = 3600
+
+# directories listed at once when checking for missing frames
+PREFLIGHT_THREADS = 16
+
+# whether the preflight check also looks for empty frames, which takes a
+# stat() per file on top of one listing per directory
+PREFLIGHT_CHECK_EMPTY = True
+
+# days before unused entries are dropped from the file hash manifest, and
+# the most entries it keeps
+HASH_MANIFEST_DAYS = 30
+HASH_MANIFEST_SIZE = 200000
+
+# where scripts and assets are uploaded to ahead of submission, in chunks
+# of UPLOAD_CHUNK_SIZE bytes over UPLOAD_THREADS connections, using the
+# protocol described on ChunkedUploader rather than ZYNC's own. When no
+# UPLOAD_URL is set, files are left for ZYNC.submit_job to send.
+UPLOAD_URL = None
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_THREADS = 4
+
+# send cloud scripts to UPLOAD_URL gzipped, and as a line delta against the
+# last version of the same script sent in the last DELTA_BASE_DAYS days.
+# The job is submitted with the payload's encoding and the sha1s of the
+# script and its base, for rebuilding the script with read_script_payload().
+COMPRESS_SCRIPTS = True
+DELTA_BASE_DAYS = 7
+
+# minutes a ZYNC login is reused for before asking for the password again
+SESSION_MINUTES = 60
+
+# how many scripts and sets of Write nodes to remember the prepared cloud
+# script of, so resubmitting only redoes what changed. 0 turns this off.
+PREP_CACHE_SIZE = 20
+
+# seconds between checks on the status of submitted jobs, doubling up to
+# MONITOR_MAX_INTERVAL while nothing changes
+MONITOR_INTERVAL = 15
+MONITOR_MAX_INTERVAL = 300
+
+# write top-level gizmos into the cloud script as Groups, so the gizmo files
+# don't need to be available to ZYNC. Clones and gizmos inside Groups are
+# written as they are.
+EXPAND_GIZMOS = False
+
+# what the render panel's Suggest button aims for: chunks that take about
+# TARGET_CHUNK_MINUTES and jobs that finish in about TARGET_JOB_MINUTES,
+# using at most MAX_SUGGESTED_SLOTS slots
+TARGET_CHUNK_MINUTES = 10
+TARGET_JOB_MINUTES = 60
+MAX_SUGGESTED_SLOTS = 20
+
+# record how long each phase of a submission takes, as a Chrome trace per
+# submission in CACHE_DIR/traces (keeping the newest PROFILE_TRACES) and a
+# log of about the newest PROFILE_LOG_SIZE submissions for percentiles
+PROFILE_SUBMIT = False
+PROFILE_TRACES = 50
+PROFILE_LOG_SIZE = 1000
+
+config_path = '%s/config_nuke.py' % (os.path.dirname(os.path.abspath(__file__)),)
 if not os.path.exists(config_path):
     raise Exception('Could not locate config_nuke.py, please create.')
 from config_nuke import *
@@ -45,19 +142,311 @@ for key in required_config:
 nuke.pluginAddPath(API_DIR)
 import zync
 
-# Try to connect to ZYNC. If we can't that's fine for now, we'll try
-# again later when the user tries to launch a job.
-try:
-    ZYNC = zync.Zync('nuke_plugin', API_KEY)
-except:
-    ZYNC = None
+# The connection to ZYNC is made on a background thread the first time a
+# script is loaded, so importing this module never waits on the network. If
+# we can't connect that's fine for now, we'll try again later when the user
+# tries to launch a job.
+ZYNC = None
+_zync_error = None
+_zync_thread = None
+_zync_lock = threading.Lock()
+
+def _connect_zync():
+    global ZYNC, _zync_error
+    try:
+        client = zync.Zync('nuke_plugin', API_KEY)
+    except Exception as e:
+        _zync_error = e
+    else:
+        ZYNC = client
+        _zync_error = None
+
+def warm_zync():
+    """
+    Starts connecting to ZYNC on a background thread, unless there's already
+    a connection or an attempt in progress. Returns the thread, if any.
+    """
+    global _zync_thread
+    with _zync_lock:
+        if ZYNC is not None:
+            return None
+        if _zync_thread is None or not _zync_thread.is_alive():
+            _zync_thread = threading.Thread(target=_connect_zync,
+                                            name='zync-connect')
+            _zync_thread.daemon = True
+            _zync_thread.start()
+        return _zync_thread
+
+def get_zync(timeout=None):
+    """
+    Returns the connection to ZYNC, connecting or waiting up to timeout
+    seconds for a connection in progress if needed.
+    """
+    if ZYNC is None:
+        thread = warm_zync()
+        if thread is not None:
+            thread.join(timeout)
+    if ZYNC is None:
+        if _zync_error is not None:
+            raise _zync_error
+        raise Exception('Timed out connecting to ZYNC.')
+    return ZYNC
+
+def _warm_on_script_load():
+    warm_zync()
+
+nuke.addOnScriptLoad(_warm_on_script_load)
+
+class ZyncSession(object):
+    """
+    Keeps the ZYNC client logged in between submissions, so a submit is a
+    single submit_job() call on the existing connection instead of a login
+    each time. The login is reused for SESSION_MINUTES, or until ZYNC turns
+    it down, after which the user is asked for their password again. The
+    password itself is never kept.
+    """
+    def __init__(self, connect=None, ttl=None):
+        self.connect = connect
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.client = None
+        self.username = None
+        self.expires = 0
+        self.logins = 0
+
+    def valid(self, username=None):
+        """
+        Returns True if there's an unexpired login, for the given user if
+        one is given.
+        """
+        return self.client is not None and time.time() < self.expires and \
+            (username is None or username == self.username)
+
+    def login(self, username, password=None):
+        """
+        Returns a client logged in as the given user, reusing the current
+        login if it's still valid. A password is only needed when it isn't;
+        without one, raises ZyncAuthenticationError.
+        """
+        with self.lock:
+            if self.valid(username):
+                return self.client
+            if not password:
+                raise zync.ZyncAuthenticationError('Your ZYNC login has '
+                                                   'expired, please log in again.')
+            connect = self.connect or (lambda: get_zync(CONNECT_TIMEOUT))
+            client = connect()
+            client.login(username=username, password=password)
+            ttl = self.ttl if self.ttl is not None else SESSION_MINUTES * 60
+            self.client = client
+            self.username = username
+            self.expires = time.time() + ttl
+            self.logins += 1
+            return client
+
+    def logout(self):
+        with self.lock:
+            self.client = None
+            self.username = None
+            self.expires = 0
+
+    def call(self, username, method, *args, **kwargs):
+        """
+        Calls a method of the logged in client, forgetting the login if ZYNC
+        rejects it.
+        """
+        client = self.login(username)
+        try:
+            return getattr(client, method)(*args, **kwargs)
+        except zync.ZyncAuthenticationError:
+            self.logout()
+            raise
+
+ZYNC_SESSION = ZyncSession()
+
+def _read_json(path, default):
+    """
+    Returns the JSON stored at path, or default if it's missing or can't be
+    read.
+    """
+    try:
+        f = open(path)
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        return default
+
+def _write_json_atomic(path, data):
+    """
+    Writes data to path as JSON by way of a temporary file, so other
+    sessions never read it half written.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    f = open(tmp_path, 'w')
+    try:
+        json.dump(data, f)
+    finally:
+        f.close()
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+class ResponseCache(object):
+    """
+    A small on-disk cache of ZYNC responses that rarely change, so they can
+    be shown straight away and refreshed in the background. Entries older
+    than ttl seconds are still returned, but flagged as stale.
+    """
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def _load(self):
+        if self.entries is None:
+            self.entries = _read_json(self.path, dict())
+        return self.entries
+
+    def _save(self):
+        _write_json_atomic(self.path, self.entries)
+
+    def get(self, key):
+        """
+        Returns (value, fresh) for the given key, or (None, False) if it
+        isn't cached.
+        """
+        with self.lock:
+            entry = self._load().get(key)
+        if entry is None:
+            return None, False
+        return entry['value'], time.time() - entry['time'] < self.ttl
 
-def generate_script_path(extra_name=None):
+    def set(self, key, value):
+        with self.lock:
+            self._load()[key] = dict(value=value, time=time.time())
+            try:
+                self._save()
+            except (IOError, OSError):
+                pass
+
+    def invalidate(self, key=None):
+        """
+        Drops the given key from the cache, or every key if none is given.
+        """
+        with self.lock:
+            entries = self._load()
+            if key is None:
+                entries.clear()
+            else:
+                entries.pop(key, None)
+            try:
+                self._save()
+            except (IOError, OSError):
+                pass
+
+METADATA_CACHE = ResponseCache(os.path.join(CACHE_DIR, 'nuke_metadata.json'),
+                               CACHE_TTL)
+METADATA_KEYS = ('projects', 'instance_types', 'features')
+
+# the last cloud script of each script family acknowledged by the upload
+# server, for sending the next version as a delta against
+SCRIPT_BASES = ResponseCache(os.path.join(CACHE_DIR, 'nuke_script_bases.json'),
+                             DELTA_BASE_DAYS * 86400)
+
+def fetch_metadata(client):
+    """
+    Fetches the project list, instance types and features from ZYNC and
+    stores them in the cache.
+    """
+    proj_response = client.get_project_list()
+    if proj_response['code'] != 0:
+        raise Exception(proj_response['response'])
+    metadata = dict(projects=proj_response['response'],
+                    instance_types=client.INSTANCE_TYPES,
+                    features=client.FEATURES)
+    for key in METADATA_KEYS:
+        METADATA_CACHE.set(key, metadata[key])
+    return metadata
+
+def _metadata_client():
+    """
+    Returns the logged in session's client if there is one, so metadata
+    calls go over its connection, or else a new client.
+    """
+    if ZYNC_SESSION.valid():
+        return ZYNC_SESSION.client
+    return get_zync(CONNECT_TIMEOUT)
+
+def _refresh_metadata(callback):
+    try:
+        metadata = fetch_metadata(_metadata_client())
+    except Exception:
+        return
+    if callback is not None:
+        callback(metadata)
+
+def get_metadata(callback=None):
+    """
+    Returns the project list, instance types and features, from the cache
+    if they're there. If any of them are stale, they're refreshed on a
+    background thread and callback is called with the fresh values.
+    """
+    metadata = dict()
+    fresh = True
+    for key in METADATA_KEYS:
+        metadata[key], key_fresh = METADATA_CACHE.get(key)
+        fresh = fresh and key_fresh
+    if None in metadata.values():
+        try:
+            client = _metadata_client()
+        except Exception:
+            raise Exception('Couldn\'t connect to ZYNC. Are you connected to the internet?')
+        return fetch_metadata(client)
+    if not fresh:
+        thread = threading.Thread(target=_refresh_metadata, args=(callback,),
+                                  name='zync-metadata')
+        thread.daemon = True
+        thread.start()
+    return metadata
+
+def invalidate_cache(key=None):
+    """
+    Forgets the cached project list, instance types and features (or just
+    the given one) so they're fetched again the next time they're needed.
+    """
+    METADATA_CACHE.invalidate(key)
+
+def instance_type_labels(instance_types):
+    """
+    Returns the labels for the instance type menu, default type first.
+    """
+    type_list = []
+    non_default = []
+    for inst_type in instance_types:
+        if inst_type == zync.DEFAULT_INSTANCE_TYPE:
+            type_list.append( '%s (%s)' % ( inst_type, instance_types[inst_type]["description"] ) )
+        else:
+            non_default.append( '%s (%s)' % ( inst_type, instance_types[inst_type]["description"] ) )
+    for label in non_default:
+        type_list.append( label ) 
+    return type_list
+
+def generate_script_path(extra_name=None, script_path=None, content_hash=None):
     """
     Returns a hash-embedded script path with /cloud_submit/ at the end
-    of the path, for separation from user nuke scripts.
+    of the path, for separation from user nuke scripts. Uses the open
+    script unless a script_path is given. If the hash of the new script's
+    contents is given it's used in the name, so identical scripts get the
+    same path; otherwise the hash is time-based.
     """
-    script_path = nuke.root().knob('name').getValue()
+    if script_path is None:
+        script_path = nuke.root().knob('name').getValue()
     script_dir = os.path.dirname(script_path)
     cloud_dir = "/".join([script_dir, 'cloud_submit'])
 
@@ -76,265 +465,4080 @@ def generate_script_path(extra_name=None):
     if extra_name:
         old_filename = '_'.join([old_filename, extra_name])
     to_hash = '_'.join([old_filename, timecode])
-    hash = hashlib.md5(to_hash).hexdigest()[-6:]
+    if content_hash:
+        hash = content_hash[-6:]
+    else:
+        if not isinstance(to_hash, bytes):
+            to_hash = to_hash.encode('utf-8')
+        hash = hashlib.md5(to_hash).hexdigest()[-6:]
 
     # filename will be something like: shotName_comp_v094_37aa20.nk
     new_filename = '_'.join([old_filename, hash]) + '.nk'
 
     return "/".join([cloud_dir, new_filename])
 
+def hash_file(path, algorithm='sha1', block_size=1024 * 1024):
+    """
+    Returns the hex digest of a file's contents, read in blocks.
+    """
+    digest = hashlib.new(algorithm)
+    f = open(path, 'rb')
+    try:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+class HashManifest(object):
+    """
+    A persistent record of file content hashes keyed by path, size and
+    mtime, so unchanged files are never read twice. Also remembers the
+    hash each file had when it was last sent to ZYNC, to tell which files
+    are new or changed since.
+    """
+    def __init__(self, path, max_age=None, max_entries=None):
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = None
+        self.hashed = 0
+        self.reused = 0
+
+    def _load(self):
+        if self.entries is None:
+            self.entries = _read_json(self.path, dict())
+        return self.entries
+
+    def digest(self, path):
+        """
+        Returns the sha1 of the file at path, hashing it only if it's new or
+        its size or mtime changed.
+        """
+        stat = os.stat(path)
+        with self.lock:
+            entry = self._load().get(path)
+        if entry is not None and entry['size'] == stat.st_size and \
+           entry['mtime'] == stat.st_mtime:
+            self.reused += 1
+        else:
+            entry = dict(size=stat.st_size, mtime=stat.st_mtime,
+                         sha1=hash_file(path), sent=None)
+            self.hashed += 1
+        entry['used'] = time.time()
+        with self.lock:
+            self.entries[path] = entry
+        return entry['sha1']
+
+    def changed(self, paths):
+        """
+        Returns the paths whose contents haven't been sent to ZYNC yet.
+        """
+        changed = []
+        for path in paths:
+            digest = self.digest(path)
+            if self.entries[path].get('sent') != digest:
+                changed.append(path)
+        return changed
+
+    def mark_sent(self, paths):
+        """
+        Records that the current contents of the given paths were sent.
+        """
+        with self.lock:
+            entries = self._load()
+            for path in paths:
+                if path in entries:
+                    entries[path]['sent'] = entries[path]['sha1']
+
+    def evict(self):
+        """
+        Drops entries unused for max_age days, then the least recently used
+        entries beyond max_entries.
+        """
+        with self.lock:
+            entries = self._load()
+            if self.max_age is not None:
+                oldest = time.time() - self.max_age * 86400
+                for path in [x for x in entries if entries[x]['used'] < oldest]:
+                    del entries[path]
+            if self.max_entries is not None and len(entries) > self.max_entries:
+                by_use = sorted(entries, key=lambda x: entries[x]['used'])
+                for path in by_use[:len(entries) - self.max_entries]:
+                    del entries[path]
+
+    def save(self):
+        """
+        Evicts old entries and writes the manifest to disk.
+        """
+        self.evict()
+        with self.lock:
+            _write_json_atomic(self.path, self.entries)
+
+HASH_MANIFEST = HashManifest(os.path.join(CACHE_DIR, 'nuke_hashes.json'),
+                             HASH_MANIFEST_DAYS, HASH_MANIFEST_SIZE)
+
+def _node_list(recurse=True):
+    """
+    Returns every node in the script, recursing into Groups when asked. Catch
+    errors for Nuke versions that don't support the recurseGroups option.
+    """
+    if recurse:
+        try:
+            return nuke.allNodes(recurseGroups=True)
+        except:
+            pass
+    return nuke.allNodes()
+
+def _node_key(node):
+    """
+    Returns a stable, hashable key for a nuke node. Python wrappers returned
+    by nuke aren't guaranteed to compare equal, so key on the full name.
+    """
+    try:
+        return node.fullName()
+    except AttributeError:
+        return node.name()
+
+class DependencyGraph(object):
+    """
+    An index of the node graph that reads every node's inputs exactly once,
+    then answers upstream queries for any number of roots without going back
+    to nuke. For example:
+
+    graph = DependencyGraph()
+    keep = graph.upstream(write_nodes)
+
+    Groups depend on all of their children, so anything a Group's contents
+    link to by expression is kept along with the Group.
+    """
+    def __init__(self, nodes=None):
+        """
+        Builds the index from the given nodes, or from every node in the
+        script (including Group contents) if no nodes are given.
+        """
+        self.nodes = dict()
+        self.edges = dict()
+        if nodes is None:
+            nodes = _node_list()
+        for node in nodes:
+            self.nodes[_node_key(node)] = node
+        for key, node in self.nodes.items():
+            self.edges.setdefault(key, []).extend(
+                _node_key(x) for x in nuke.dependencies([node]))
+            # nodes inside a Group are keyed Group.Node, make the Group
+            # depend on each of them.
+            if '.' in key:
+                parent = key.rsplit('.', 1)[0]
+                self.edges.setdefault(parent, []).append(key)
+
+    @classmethod
+    def from_edges(cls, edges, nodes=None):
+        """
+        Returns a DependencyGraph over an existing {name: [dep names]} map,
+        e.g. one built from a parsed .nk file rather than a live session.
+        """
+        graph = cls.__new__(cls)
+        graph.edges = edges
+        graph.nodes = nodes if nodes is not None else dict()
+        return graph
+
+    def upstream_names(self, roots):
+        """
+        Returns the set of names of the given roots and everything upstream
+        of them, in a single traversal shared by all of the roots. Works with
+        cyclical dependencies.
+        """
+        seen = set()
+        stack = [x if isinstance(x, basestring) else _node_key(x) for x in roots]
+        edges = self.edges
+        while stack:
+            key = stack.pop()
+            if key in seen:
+                continue
+            seen.add(key)
+            for dep in edges.get(key, ()):
+                if dep not in seen:
+                    stack.append(dep)
+        return seen
+
+    def upstream_masks(self, root_groups):
+        """
+        Returns a {name: mask} map of everything upstream of any of the given
+        groups of roots, where bit i of the mask is set if the node is needed
+        by group i. Masks are pushed upstream together, so a subgraph shared
+        by several groups is walked once rather than once per group. Works
+        with cyclical dependencies.
+        """
+        masks = dict()
+        pending = dict()
+        for i, roots in enumerate(root_groups):
+            for root in roots:
+                key = root if isinstance(root, basestring) else _node_key(root)
+                pending[key] = pending.get(key, 0) | (1 << i)
+        edges = self.edges
+        stack = list(pending)
+        while stack:
+            key = stack.pop()
+            new = pending.pop(key, 0) & ~masks.get(key, 0)
+            if not new:
+                continue
+            masks[key] = masks.get(key, 0) | new
+            for dep in edges.get(key, ()):
+                if new & ~masks.get(dep, 0):
+                    if dep not in pending:
+                        stack.append(dep)
+                    pending[dep] = pending.get(dep, 0) | new
+        return masks
+
+    def upstream(self, roots):
+        """
+        Returns a list of the given roots and all of their dependencies.
+        """
+        return [self.nodes[x] for x in self.upstream_names(roots)
+                if x in self.nodes]
+
 def get_dependent_nodes(root):
     """
     Returns a list of all of the root node's dependencies.
-    Uses `nuke.dependencies()`. This will work with cyclical dependencies.
+    Uses `nuke.dependencies()` on a level at a time, so only the part of the
+    script upstream of root is read. This will work with cyclical
+    dependencies. For many roots, build one DependencyGraph instead.
     """
-    all_deps = set([root])
-    all_deps.update(nuke.dependencies(list(all_deps)))
+    found = {_node_key(root): root}
+    frontier = [root]
+    while frontier:
+        deps = list(nuke.dependencies(frontier))
+        # Groups depend on all of their children, as in DependencyGraph
+        for node in frontier:
+            if node.Class() in GROUP_CLASSES and hasattr(node, 'nodes'):
+                deps.extend(node.nodes())
+        frontier = []
+        for dep in deps:
+            key = _node_key(dep)
+            if key not in found:
+                found[key] = dep
+                frontier.append(dep)
+    return list(found.values())
 
-    seen = set()
-    while True:
-        diff = all_deps - seen
-        to_add = nuke.dependencies(list(diff))
-        all_deps.update(to_add)
-        seen.update(diff)
-        if len(diff) == 0:
-            break
+def select_deps(nodes, graph=None):
+    """
+    Selects all of the dependent nodes for the given list of nodes.
+    """
+    if graph is None:
+        graph = DependencyGraph()
+    for node in graph.upstream(nodes):
+        node.setSelected(True)
+
+def delete_unused_nodes(write_nodes, graph=None):
+    """
+    Removes all top-level nodes that aren't upstream of the given Write
+    nodes, using a single deletion.
+    """
+    if graph is None:
+        graph = DependencyGraph()
+    keep = graph.upstream_names(write_nodes)
+    for node in nuke.allNodes():
+        node.setSelected(_node_key(node) not in keep)
+    nuke.nodeDelete()
+
+FREEZE_KNOBS = ('file', 'font')
+
+def frozen_value(node, knob_name):
+    """
+    Returns the value the given knob should be frozen to, or None if it
+    doesn't hold an expression. Also accounts for and retains frame number
+    expressions. Doesn't modify the node.
+    """
+    file_knob = node.knob(knob_name)
+    if file_knob == None:
+        return None
+    knob_value = file_knob.value()
+
+    # if the file param has an open bracket, let's assume that it's an
+    # expression:
+    if '[' not in knob_value:
+        return None
+    if node.Class() == 'Write':
+        return nuke.filename(node)
+
+    frozen_path = file_knob.evaluate()
+    frozen_dir = os.path.split(frozen_path)[0]
+    file_expr = os.path.split(knob_value)[-1]
+    return os.path.join(frozen_dir, file_expr)
+
+def freeze_node(node, view=None):
+    """
+    If the node has an expression, evaluate it so that the ZYNC can
+    parse it. Also accounts for and retains frame number expressions.
+    Should be idempotent.
+    """
+    for knob_name in FREEZE_KNOBS:
+        file_knob = node.knob(knob_name)
+        if file_knob == None:
+            continue
+        knob_value = file_knob.value()
+
+        frozen = frozen_value(node, knob_name)
+        if frozen is not None:
+            file_knob.setValue(frozen)
+
+        if view:
+            knob_value = knob_value.replace('%v', view.lower())
+            knob_value = knob_value.replace('%V', view.upper())
+
+            node.knob(knob_name).setValue(knob_value)
+
+def gizmos_to_groups(nodes):
+    """
+    If the node is a Gizmo, use makeGroup() to turn it into a Group.
+
+    This works on the live session, a node at a time. Submitting doesn't use
+    it: with EXPAND_GIZMOS, NukeScript.write() expands top-level gizmos from
+    GIZMO_LIBRARY instead.
+    """
+    # deselect all nodes. only the selected ones need visiting.
+    for node in nuke.selectedNodes():
+        node.setSelected(False)
+    for node in nodes:
+        if hasattr(node, 'makeGroup') and callable(getattr(node, 'makeGroup')):
+            node.setSelected(True)
+            node.makeGroup()
+            nuke.delete(node)
+
+def clear_nodes_by_name(names):
+    """
+    Removes nodes that match any of the names given.
+    """
+    nodes = (x for x in nuke.allNodes())
+    for node in nodes:
+        for name in names:
+            if name in node.name():
+                nuke.delete(node)
+
+def clear_callbacks(node):
+    """
+    Call and clear the callbacks on the given node
+
+    WARNING: only supports the create_write_dirs callback
+    """
+    names = ('beforeRender', 'beforeFrameRender', 'afterFrameRender', 'afterRender')
+    knobs = (node.knob(x) for x in names)
+    for knob in knobs:
+        knob_val = knob.value()
+        if 'create_write_dirs' in knob_val:
+            try:
+                create_write_dirs(node)
+            except NameError:
+                nuke.callbacks.create_write_dirs(node)
+            knob.setValue('')
+
+def clear_view(node, view='left'):
+    """
+    Sets the node's 'views' knob to a single view, left by default for
+    maximum ZYNC compatibility.
+    """
+    if 'views' in node.knobs():
+        node.knob('views').setValue(view)
+
+def is_stereo(node):
+    """
+    If the node is stereo (i.e. has %v or %V in the path)
+    """
+    path = node.knob('file').value()
+    return '%v' in path or '%V' in path
+
+def is_valid(node):
+    """
+    Checks if the readnode is valid: if it has spaces or apostrophes in the
+    name, it's invalid.
+    """
+    path = node.knob('file').value()
+    return ' ' in path or "'" in path
+
+class WriteRegistry(object):
+    """
+    Keeps track of the top-level Write nodes in the script along with their
+    enabled state and file path, kept current by onCreate, onDestroy and
+    knobChanged callbacks instead of rescanning the script. Listeners are
+    called whenever the set of Writes or their state changes.
+    """
+    WATCHED_KNOBS = ('name', 'disable', 'file')
+
+    def __init__(self):
+        self.entries = dict()
+        self.listeners = []
+        self.loaded = False
+        self._names = None
+
+    def install(self):
+        """
+        Registers the nuke callbacks that keep the registry current.
+        """
+        nuke.addOnCreate(self._created, nodeClass='Write')
+        nuke.addOnDestroy(self._destroyed, nodeClass='Write')
+        nuke.addKnobChanged(self._knob_changed, nodeClass='Write')
+        nuke.addOnScriptLoad(self.rebuild)
+        nuke.addOnScriptClose(self.clear)
+
+    def add_listener(self, listener):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _changed(self):
+        self._names = None
+        for listener in list(self.listeners):
+            listener()
+
+    def _add(self, node):
+        self.entries[node.name()] = [node, not node.knob('disable').value(),
+                                     node.knob('file').value()]
+
+    def rebuild(self):
+        """
+        Scans the script for Write nodes. Only needed when a script is
+        loaded, or when the registry is first used.
+        """
+        self.entries = dict()
+        for node in nuke.allNodes('Write'):
+            self._add(node)
+        self.loaded = True
+        self._changed()
+
+    def clear(self):
+        self.entries = dict()
+        self.loaded = False
+        self._changed()
+
+    def _created(self):
+        node = nuke.thisNode()
+        if self.loaded and '.' not in _node_key(node):
+            self._add(node)
+            self._changed()
+
+    def _destroyed(self):
+        if self.entries.pop(nuke.thisNode().name(), None) is not None:
+            self._changed()
+
+    def _knob_changed(self):
+        knob = nuke.thisKnob()
+        if knob is None or knob.name() not in self.WATCHED_KNOBS:
+            return
+        node = nuke.thisNode()
+        name = node.name()
+        if knob.name() == 'name':
+            for old_name in [x for x in self.entries if x != name and
+                             self.entries[x][0].name() == name]:
+                del self.entries[old_name]
+        if name in self.entries or (self.loaded and '.' not in _node_key(node)):
+            self._add(node)
+            self._changed()
+
+    def _ensure(self):
+        if not self.loaded:
+            self.rebuild()
 
-    return list(all_deps)
+    def verify(self, names):
+        """
+        Checks the entries of the named Writes against the live nodes, since
+        knobChanged doesn't run for every scripted setValue() or setName().
+        Rebuilds the registry if any is out of date. Returns the names that
+        are no longer enabled Write nodes.
+        """
+        self._ensure()
+        for name in names:
+            entry = self.entries.get(name)
+            if entry is None:
+                current = False
+            else:
+                node, enabled, path = entry
+                try:
+                    current = node.name() == name and \
+                        enabled == (not node.knob('disable').value()) and \
+                        path == node.knob('file').value()
+                except ValueError:
+                    # the node has been deleted
+                    current = False
+            if not current:
+                self.rebuild()
+                break
+        return [x for x in names
+                if x not in self.entries or not self.entries[x][1]]
+
+    def get(self, name):
+        """
+        Returns the Write node with the given name, or None.
+        """
+        self._ensure()
+        entry = self.entries.get(name)
+        return entry[0] if entry else None
+
+    def nodes(self):
+        """
+        Returns every Write node, enabled or not.
+        """
+        self._ensure()
+        return [x[0] for x in self.entries.values()]
+
+    def enabled(self):
+        """
+        Returns a {name: node} map of the enabled Write nodes.
+        """
+        self._ensure()
+        return dict((x, y[0]) for x, y in self.entries.items() if y[1])
+
+    def enabled_names(self):
+        """
+        Returns the sorted names of the enabled Write nodes.
+        """
+        self._ensure()
+        if self._names is None:
+            self._names = sorted(x for x, y in self.entries.items() if y[1])
+        return self._names
+
+    def file(self, name):
+        """
+        Returns the file path of the named Write node.
+        """
+        self._ensure()
+        return self.entries[name][2]
+
+WRITE_REGISTRY = WriteRegistry()
+WRITE_REGISTRY.install()
+
+def stereo_script(nodes=None):
+    """
+    Returns True if any Read or Write node has a per-view path, or any Write
+    renders more than one view. Only the given nodes are checked, if any,
+    e.g. those upstream of the Writes being rendered.
+    """
+    if nodes is None:
+        nodes = nuke.allNodes('Read') + WRITE_REGISTRY.nodes()
+    for node in nodes:
+        cls = node.Class()
+        if cls not in ('Read', 'Write'):
+            continue
+        if is_stereo(node):
+            return True
+        if cls == 'Write' and len(node.knob('views').value().split()) > 1:
+            return True
+
+    return False
+
+# user knobs on a Write node that set the job params for its output when
+# Writes are sent as separate jobs. Writes with the same zync_job value are
+# sent together.
+WRITE_PARAM_KNOBS = (('zync_chunk_size', 'chunk_size'),
+                     ('zync_priority', 'priority'),
+                     ('zync_num_slots', 'num_instances'))
+WRITE_JOB_KNOB = 'zync_job'
+
+def split_writes(write_nodes):
+    """
+    Groups Write nodes into separate jobs, one per Write unless they share
+    a zync_job knob value. Returns a list of (write names, params), where
+    params are the overrides set by the first Write's user knobs.
+    """
+    jobs = []
+    by_label = dict()
+    for node in write_nodes:
+        label_knob = node.knob(WRITE_JOB_KNOB)
+        label = label_knob.value().strip() if label_knob is not None else ''
+        if label and label in by_label:
+            by_label[label][0].append(node.name())
+            continue
+        params = dict()
+        for knob_name, param in WRITE_PARAM_KNOBS:
+            knob = node.knob(knob_name)
+            if knob is not None and knob.value():
+                params[param] = int(knob.value())
+        jobs.append(([node.name()], params))
+        if label:
+            by_label[label] = jobs[-1]
+    return jobs
+
+class FrameRange(object):
+    """
+    The frames in a Nuke frame range such as '1-100x2,150 200-210'. Parts
+    are separated by commas or spaces and may be single frames, ranges or
+    reversed ranges. A range may end in 'xN' for every Nth frame from its
+    first, or 'yN' for every frame but those. Frames are deduplicated and
+    sorted, and str() gives the shortest equivalent range.
+    """
+    _PART_RE = re.compile(r'^(-?\d+)(?:-(-?\d+))?(?:([xy])(\d+))?$')
+
+    def __init__(self, frange, step=1):
+        frames = set()
+        for part in re.split(r'[\s,]+', frange.strip()):
+            if not part:
+                continue
+            match = self._PART_RE.match(part)
+            if match is None:
+                raise ValueError('Invalid frame range: %s' % (frange,))
+            first = int(match.group(1))
+            last = int(match.group(2)) if match.group(2) is not None else first
+            modifier = match.group(3)
+            part_step = max(1, int(match.group(4) or step))
+            if last < first:
+                part_frames = range(first, last - 1, -1)
+            else:
+                part_frames = range(first, last + 1)
+            if modifier == 'y':
+                frames.update(x for x in part_frames
+                              if (x - first) % part_step)
+            else:
+                frames.update(x for x in part_frames
+                              if (x - first) % part_step == 0)
+        self.frames = sorted(frames)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def __str__(self):
+        return compact_frames(self.frames)
+
+def expand_frames(frange, step=1):
+    """
+    Returns the sorted list of frames in a range like '1-100', '1-100x2' or
+    '1-10,20,30-40', taking every step'th frame of each part.
+    """
+    return FrameRange(frange, step).frames
+
+def compact_frames(frames):
+    """
+    Returns a sorted list of frames written as ranges, e.g. '1-10,12,15-19x2'.
+    """
+    parts = []
+    frames = sorted(set(frames))
+    i = 0
+    while i < len(frames):
+        j = i
+        if i + 1 < len(frames):
+            step = frames[i + 1] - frames[i]
+            while j + 1 < len(frames) and frames[j + 1] - frames[j] == step:
+                j += 1
+            # a stepped range needs three frames to be shorter than a list
+            if step > 1 and j - i < 2:
+                j = i
+        if i == j:
+            parts.append('%d' % (frames[i],))
+        elif step == 1:
+            parts.append('%d-%d' % (frames[i], frames[j]))
+        else:
+            parts.append('%d-%dx%d' % (frames[i], frames[j], step))
+        i = j + 1
+    return ','.join(parts)
+
+CHUNK_ORDERS = ('linear', 'feedback')
+
+class ChunkPlan(object):
+    """
+    The chunks a job's frames are rendered in, in the order they should
+    start. Chunks hold up to chunk_size frames, or fewer where that's what
+    it takes for each of the slots to get one. 'linear' chunks the frames
+    in order. 'feedback' starts with the first, last and middle frames as
+    chunks of a frame each, then fills in the rest, so a broken frame
+    anywhere in the range turns up within minutes instead of at the end of
+    the job. For example, 1-100 in chunks of 10 on 5 slots:
+
+    ChunkPlan(range(1, 101), 'feedback', 10, 5).chunks
+    [[1], [100], [51], [2, ..., 11], [12, ..., 21], ..., [93, ..., 99]]
+
+    The job API takes a frame range and a chunk size rather than a list of
+    chunks, so jobs() gives the fewest jobs that render exactly these
+    chunks when each job's frames are chunked in order.
+    """
+    def __init__(self, frames, order='linear', chunk_size=None, slots=1):
+        if order not in CHUNK_ORDERS:
+            raise ValueError('Unknown chunk order: %s' % (order,))
+        frames = sorted(set(frames))
+        self.order = order
+        self.probes = []
+        # with only a few frames there's nothing to find out early
+        if order == 'feedback' and len(frames) > 3:
+            for frame in (frames[0], frames[-1], frames[len(frames) // 2]):
+                if frame not in self.probes:
+                    self.probes.append(frame)
+        probes = set(self.probes)
+        self.rest = [x for x in frames if x not in probes]
+        # small enough to give every slot a chunk of the rest
+        per_slot = -(-len(self.rest) // max(1, slots))
+        self.chunk_size = max(1, min(chunk_size or len(self.rest), per_slot))
+        self.chunks = [[x] for x in self.probes] + [
+            self.rest[i:i + self.chunk_size]
+            for i in range(0, len(self.rest), self.chunk_size)]
+
+    def jobs(self):
+        """
+        Returns the plan as a list of (sorted frames, chunk size), one per
+        job, in the order they should be submitted. A chunk joins the job
+        before it when chunking the job's frames in order still gives the
+        same chunks.
+        """
+        jobs = []
+        for chunk in self.chunks:
+            if jobs:
+                frames, size = jobs[-1]
+                full = len(chunk) == size
+                if size == 1 and full or \
+                   chunk[-1] < frames[0] and full or \
+                   chunk[0] > frames[-1] and len(chunk) <= size and \
+                   len(frames) % size == 0:
+                    frames.extend(chunk)
+                    frames.sort()
+                    continue
+            jobs.append((list(chunk), len(chunk)))
+        return jobs
+
+def plan_frames(params, order):
+    """
+    Makes a ChunkPlan of a set of job params in the given order, sized to
+    their num_instances, and returns the params of the jobs it takes, in
+    the order they should be submitted. A plan that fits in one job keeps
+    the frame range as it was given. Raises ValueError if the frame range
+    can't be parsed or is empty.
+    """
+    frames = expand_frames(params['frange'], params.get('step') or 1)
+    if not frames:
+        raise ValueError('Empty frame range: %s' % (params['frange'],))
+    plan = ChunkPlan(frames, order, params.get('chunk_size'),
+                     params.get('num_instances') or 1)
+    jobs = plan.jobs()
+    if len(jobs) == 1:
+        return [dict(params, chunk_size=jobs[0][1])]
+    return [dict(params, frange=compact_frames(x), step=1, chunk_size=y)
+            for x, y in jobs]
+
+#
+#   Render cost estimates. Node costs are roughly seconds per megapixel on a
+#   REFERENCE_CORES machine; the scale is corrected from the timings of past
+#   jobs kept in the render history.
+#
+NODE_COSTS = {
+    # reads and writes
+    'Read': 0.5, 'DeepRead': 1.0, 'Write': 0.3, 'DeepWrite': 0.6,
+    # filters
+    'Blur': 0.2, 'Defocus': 4.0, 'ZDefocus2': 5.0, 'ZBlur': 2.0,
+    'Convolve': 3.0, 'Bokeh': 8.0, 'GodRays': 0.8, 'Glow': 0.4, 'Glow2': 0.4,
+    'LensDistortion': 1.0, 'LensDistortion2': 1.0, 'STMap': 0.3,
+    'IDistort': 0.3, 'Median': 0.8, 'EdgeBlur': 0.3,
+    # motion
+    'VectorBlur': 2.0, 'VectorBlur2': 2.0, 'MotionBlur': 6.0,
+    'MotionBlur2D': 1.0, 'MotionBlur3D': 2.0, 'Kronos': 8.0, 'OFlow': 6.0,
+    'OFlow2': 6.0, 'VectorGenerator': 4.0, 'Denoise': 10.0, 'Denoise2': 10.0,
+    # 3D
+    'ScanlineRender': 4.0, 'RayRender': 12.0, 'PrmanRender': 20.0,
+    'DepthGenerator': 4.0, 'ReadGeo': 1.0, 'ReadGeo2': 1.0,
+    'PointCloudGenerator': 6.0,
+    # free
+    'Dot': 0.0, 'NoOp': 0.0, 'Group': 0.0, 'Gizmo': 0.0, 'Input': 0.0,
+    'Output': 0.0, 'Backdrop': 0.0, 'BackdropNode': 0.0, 'StickyNote': 0.0,
+    'Viewer': 0.0, 'Camera': 0.0, 'Camera2': 0.0, 'Axis': 0.0, 'Axis2': 0.0,
+}
+DEFAULT_NODE_COST = 0.1
+REFERENCE_CORES = 8
+REFERENCE_MEGAPIXELS = 2048 * 1556 / 1000000.0
+
+# a frame shouldn't take longer than this on the suggested instance type
+MAX_FRAME_SECONDS = 300
+
+def _node_megapixels(node):
+    try:
+        return node.width() * node.height() / 1000000.0
+    except Exception:
+        pass
+    try:
+        root_format = nuke.root().format()
+        return root_format.width() * root_format.height() / 1000000.0
+    except Exception:
+        return REFERENCE_MEGAPIXELS
+
+class CostEstimate(object):
+    """
+    The estimated cost of rendering one frame through the given nodes, from
+    each node's class weight in NODE_COSTS and the size of its format.
+    Disabled nodes are free.
+    """
+    def __init__(self, nodes):
+        self.per_frame = 0.0
+        self.by_class = dict()
+        self.reads = 0
+        for node in nodes:
+            disable = node.knob('disable')
+            if disable is not None and disable.value():
+                continue
+            cls = node.Class()
+            weight = NODE_COSTS.get(cls, DEFAULT_NODE_COST)
+            if cls == 'Read':
+                self.reads += 1
+            if not weight:
+                continue
+            cost = weight * _node_megapixels(node)
+            self.per_frame += cost
+            self.by_class[cls] = self.by_class.get(cls, 0.0) + cost
+
+    def heaviest(self, count=3):
+        """
+        Returns the classes that cost the most, most expensive first.
+        """
+        by_cost = sorted(self.by_class, key=lambda x: -self.by_class[x])
+        return by_cost[:count]
+
+def instance_cores(instance_type, info=None):
+    """
+    Returns the number of cores an instance type has, going by its
+    description, or REFERENCE_CORES if it doesn't say.
+    """
+    for text in ((info or {}).get('description', ''), instance_type):
+        match = re.search(r'(\d+)\s*(?:cores?|cpus?|vcpus?)\b', text, re.I)
+        if match is not None:
+            return int(match.group(1))
+    match = re.search(r'(\d+)$', instance_type)
+    if match is not None:
+        return int(match.group(1))
+    return REFERENCE_CORES
+
+class RenderHistory(object):
+    """
+    A local record of how long past jobs took per frame against what was
+    estimated, used to scale new estimates into seconds.
+    """
+    def __init__(self, path, max_entries=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def _load(self):
+        if self.entries is None:
+            self.entries = _read_json(self.path, [])
+        return self.entries
+
+    def _save(self):
+        _write_json_atomic(self.path, self.entries)
+
+    def record(self, estimate, instance_type, frames, seconds, cores=None):
+        """
+        Records that a job of the given number of frames, estimated at
+        estimate units per frame, took seconds of render time on the given
+        instance type.
+        """
+        if estimate <= 0 or frames <= 0 or seconds <= 0:
+            return
+        if cores is None:
+            cores = instance_cores(instance_type)
+        with self.lock:
+            entries = self._load()
+            entries.append(dict(time=time.time(), estimate=estimate,
+                                instance_type=instance_type, cores=cores,
+                                frames=frames, seconds=seconds))
+            del entries[:-self.max_entries]
+            try:
+                self._save()
+            except (IOError, OSError):
+                pass
+
+    def scale(self, recent=50):
+        """
+        Returns the median seconds per estimated unit on a REFERENCE_CORES
+        machine over the most recent jobs, or 1.0 with no history.
+        """
+        with self.lock:
+            entries = list(self._load()[-recent:])
+        ratios = sorted(x['seconds'] / x['frames'] * x['cores'] /
+                        REFERENCE_CORES / x['estimate'] for x in entries)
+        if not ratios:
+            return 1.0
+        return ratios[len(ratios) // 2]
+
+RENDER_HISTORY = RenderHistory(os.path.join(CACHE_DIR, 'nuke_render_history.json'))
+
+def record_job_timing(estimate, instance_type, frames, seconds, cores=None):
+    """
+    Adds a finished job's timing to the render history, to calibrate future
+    estimates.
+    """
+    RENDER_HISTORY.record(estimate, instance_type, frames, seconds, cores)
+
+def suggest_render_settings(estimate, frames, instance_types, history=None):
+    """
+    Suggests an instance type, num_slots and chunk_size for rendering the
+    given number of frames at estimate units per frame. Picks the instance type with the
+    fewest cores that renders a frame within MAX_FRAME_SECONDS, chunks of
+    about TARGET_CHUNK_MINUTES, and enough slots to finish in about
+    TARGET_JOB_MINUTES. Returns a dict, with frame_seconds and total_seconds
+    for the chosen type.
+    """
+    if history is None:
+        history = RENDER_HISTORY
+    scale = history.scale()
+    frames = max(1, frames)
+
+    by_cores = []
+    for inst_type in instance_types:
+        cores = instance_cores(inst_type, instance_types[inst_type])
+        # prefer the default type over others with as many cores
+        by_cores.append((cores, inst_type != zync.DEFAULT_INSTANCE_TYPE,
+                         inst_type))
+    by_cores.sort()
+    if not by_cores:
+        by_cores = [(REFERENCE_CORES, False, zync.DEFAULT_INSTANCE_TYPE)]
+    for cores, non_default, inst_type in by_cores:
+        frame_seconds = estimate * scale * REFERENCE_CORES / cores
+        if frame_seconds <= MAX_FRAME_SECONDS:
+            break
+
+    frame_seconds = max(frame_seconds, 0.1)
+    chunk_size = int(TARGET_CHUNK_MINUTES * 60 / frame_seconds)
+    chunk_size = max(1, min(chunk_size, frames))
+    chunks = (frames + chunk_size - 1) // chunk_size
+    total_seconds = frame_seconds * frames
+    num_slots = int(math.ceil(total_seconds / (TARGET_JOB_MINUTES * 60.0)))
+    num_slots = max(1, min(num_slots, chunks, MAX_SUGGESTED_SLOTS))
+    return dict(instance_type=inst_type, num_slots=num_slots,
+                chunk_size=chunk_size, frame_seconds=frame_seconds,
+                total_seconds=total_seconds)
+
+def format_duration(seconds):
+    """
+    Returns a rough duration like '45s', '12m' or '3h 20m'.
+    """
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return '%ds' % (seconds,)
+    if seconds < 3600:
+        return '%dm' % (seconds // 60,)
+    return '%dh %dm' % (seconds // 3600, seconds % 3600 // 60)
+
+_FRAME_TOKEN_RE = re.compile(r'%(\d*)d|#+')
+
+def has_frame_token(path):
+    return _FRAME_TOKEN_RE.search(path) is not None
+
+def expand_path(pattern, frame=None, view=None):
+    """
+    Returns the path a file pattern resolves to for the given frame and view.
+    Handles %04d and #### frame numbers, %V for the view name and %v for
+    its first letter.
+    """
+    if view:
+        pattern = pattern.replace('%V', view).replace('%v', view[:1].lower())
+    if frame is None:
+        return pattern
+    def replace(match):
+        if match.group(0).startswith('#'):
+            return '%0*d' % (len(match.group(0)), frame)
+        width = match.group(1)
+        return '%0*d' % (int(width or 0), frame)
+    return _FRAME_TOKEN_RE.sub(replace, pattern)
+
+def parallel_map(func, items, workers):
+    """
+    Calls func on each item using a pool of threads and returns the results
+    in order. The first exception raised by func is re-raised once every
+    item has been processed.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+    pending = queue.Queue()
+    for i, item in enumerate(items):
+        pending.put((i, item))
+
+    def work():
+        while True:
+            try:
+                i, item = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[i] = func(item)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=work)
+               for x in range(max(1, min(workers, len(items))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+def _list_sizes(directory):
+    """
+    Returns a {file name: entry} map of a directory with a single listing,
+    or None if it can't be read. Entries are os.scandir() DirEntry objects
+    where there is one, or None. Sizes aren't part of the listing: except
+    on Windows, entry.stat() is a system call per file, so only look them
+    up for the files that need it.
+    """
+    scandir = getattr(os, 'scandir', None)
+    try:
+        if scandir is not None:
+            sizes = dict()
+            for entry in scandir(directory):
+                sizes[entry.name] = entry
+            return sizes
+        return dict((x, None) for x in os.listdir(directory))
+    except OSError:
+        return None
+
+class PreflightReport(object):
+    """
+    The frames each node is missing, and the frames that exist but are
+    empty, as {node name: [frames]}.
+    """
+    def __init__(self):
+        self.missing = dict()
+        self.empty = dict()
+        self.files_checked = 0
+
+    def ok(self):
+        return not self.missing and not self.empty
+
+    def summary(self, limit=20):
+        lines = []
+        for label, problems in (('missing', self.missing),
+                                ('empty', self.empty)):
+            for name in sorted(problems):
+                frames = [x for x in problems[name] if x is not None]
+                if frames:
+                    lines.append('%s: %s frames %s' % (name, label,
+                                                        compact_frames(frames)))
+                else:
+                    lines.append('%s: %s file' % (name, label))
+        if len(lines) > limit:
+            lines = lines[:limit] + ['... and %d more' % (len(lines) - limit,)]
+        return '\n'.join(lines)
+
+def check_sequences(sequences, workers=None, check_empty=None):
+    """
+    Checks that every file of the given (node name, pattern, frames, views)
+    sequences exists and, if check_empty is set, isn't empty. frames and
+    views may be None for paths without frame or view tokens. Each
+    directory is listed once, and directories are listed in parallel.
+    Whether files exist comes from the listings, but finding empty ones
+    takes a stat() per file. Returns a PreflightReport.
+    """
+    if workers is None:
+        workers = PREFLIGHT_THREADS
+    if check_empty is None:
+        check_empty = PREFLIGHT_CHECK_EMPTY
+    expected = dict()
+    for name, pattern, frames, views in sequences:
+        for view in views or [None]:
+            for frame in frames or [None]:
+                path = expand_path(pattern, frame, view)
+                directory, file_name = os.path.split(path)
+                expected.setdefault(directory, dict()).setdefault(
+                    file_name, []).append((name, frame))
+
+    def check(directory):
+        entries = _list_sizes(directory or '.')
+        missing, empty = [], []
+        for file_name, users in expected[directory].items():
+            if entries is None or file_name not in entries:
+                missing.extend(users)
+                continue
+            if not check_empty:
+                continue
+            entry = entries[file_name]
+            try:
+                if entry is None:
+                    size = os.path.getsize(os.path.join(directory, file_name))
+                else:
+                    size = entry.stat().st_size
+            except OSError:
+                missing.extend(users)
+                continue
+            if size == 0:
+                empty.extend(users)
+        return missing, empty
+
+    report = PreflightReport()
+    directories = list(expected)
+    for missing, empty in parallel_map(check, directories, workers):
+        for problems, found in ((report.missing, missing),
+                                (report.empty, empty)):
+            for name, frame in found:
+                problems.setdefault(name, []).append(frame)
+    report.files_checked = sum(len(x) for x in expected.values())
+    return report
+
+def read_sequences(nodes, frames, views=None):
+    """
+    Returns the (node name, pattern, frames, views) sequences read by the
+    given nodes over the given frames, for check_sequences(). Frames are
+    clamped to each Read's own range, and expressions are frozen.
+    """
+    sequences = []
+    for node in nodes:
+        if node.Class() != 'Read' or node.knob('disable').value():
+            continue
+        pattern = frozen_value(node, 'file') or node.knob('file').value()
+        if not pattern:
+            continue
+        node_frames = None
+        if has_frame_token(pattern):
+            first = int(node.knob('first').value())
+            last = int(node.knob('last').value())
+            node_frames = sorted(set(min(max(x, first), last) for x in frames))
+        node_views = None
+        if '%v' in pattern or '%V' in pattern:
+            node_views = views
+        sequences.append((_node_key(node), pattern, node_frames, node_views))
+    return sequences
+
+# nodes that change which frame of their input is used, and the knob
+# holding the offset or held frame. Other time nodes (Retime, TimeWarp,
+# Kronos...) make their Reads fall back to their whole range.
+TIME_OFFSET_KNOBS = (('TimeOffset', 'time_offset'),)
+FRAME_HOLD_KNOBS = (('FrameHold', 'first_frame'), ('FrameHold', 'firstFrame'))
+TIME_NODE_CLASSES = ('Retime', 'TimeWarp', 'OFlow', 'OFlow2', 'Kronos',
+                     'TimeBlur', 'TimeEcho', 'FrameBlend', 'FrameRange')
+
+# expressions that give a different result on each frame
+_FRAME_EXPR_RE = re.compile(r'\[\s*(frame|t)\b|\$frame|\bframe\b')
+
+def _frame_pattern(expression, path):
+    """
+    Returns the path a file expression evaluated to with its frame tokens
+    put back, so the Read's own frame can be filled in. Nuke fills them
+    with the frame the Read is asked for, before its frame mode and before
+    and after behaviour. The text of the expression outside brackets is
+    matched up with the path; if it can't be, the path is returned as is.
+    """
+    pieces = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(expression):
+        if char == '[':
+            if depth == 0:
+                pieces.append((False, expression[start:i]))
+                start = i
+            depth += 1
+        elif char == ']' and depth:
+            depth -= 1
+            if depth == 0:
+                pieces.append((True, expression[start:i + 1]))
+                start = i + 1
+    if depth:
+        return path
+    pieces.append((False, expression[start:]))
+
+    regex = []
+    tokens = []
+    for bracketed, text in pieces:
+        if bracketed:
+            regex.append('.*?')
+            continue
+        position = 0
+        for match in _FRAME_TOKEN_RE.finditer(text):
+            regex.append(re.escape(text[position:match.start()]))
+            regex.append(r'(-?\d+)')
+            tokens.append(match.group(0))
+            position = match.end()
+        regex.append(re.escape(text[position:]))
+    if not tokens:
+        return path
+    match = re.match('%s$' % (''.join(regex),), path, re.S)
+    if match is None:
+        return path
+    parts = []
+    position = 0
+    for i, token in enumerate(tokens):
+        parts.append(path[position:match.start(i + 1)])
+        parts.append(token)
+        position = match.end(i + 1)
+    parts.append(path[position:])
+    return ''.join(parts)
+
+def _time_mapping(node, mapping):
+    """
+    Returns the mapping from render frames to the frames the node's inputs
+    are asked for, given the node's own mapping: ('offset', n) for the
+    render frame plus n, ('hold', n) for frame n, ('blocks', n, first,
+    increment, m) for a FrameHold with an increment asked for the render
+    frame plus n, plus m, or None for any frame. See _map_frame().
+    """
+    if mapping is None:
+        return None
+    cls = node.Class()
+    for node_class, knob_name in FRAME_HOLD_KNOBS:
+        if cls == node_class and node.knob(knob_name) is not None:
+            first = int(node.knob(knob_name).value())
+            increment = node.knob('increment')
+            increment = int(increment.value()) if increment is not None else 0
+            if increment <= 0:
+                return ('hold', first)
+            if mapping[0] == 'hold':
+                return ('hold', _map_frame(('blocks', 0, first, increment, 0),
+                                           mapping[1]))
+            if mapping[0] == 'offset':
+                return ('blocks', mapping[1], first, increment, 0)
+            # blocks of blocks aren't followed
+            return None
+    for node_class, knob_name in TIME_OFFSET_KNOBS:
+        if cls == node_class and node.knob(knob_name) is not None:
+            offset = int(node.knob(knob_name).value())
+            if mapping[0] == 'blocks':
+                return mapping[:4] + (mapping[4] - offset,)
+            return (mapping[0], mapping[1] - offset)
+    if cls in TIME_NODE_CLASSES:
+        return None
+    return mapping
+
+def _map_frame(mapping, frame):
+    """
+    Returns the frame a _time_mapping() asks for on the given render frame,
+    or None if it could be any.
+    """
+    if mapping is None:
+        return None
+    if mapping[0] == 'hold':
+        return mapping[1]
+    if mapping[0] == 'offset':
+        return frame + mapping[1]
+    offset, first, increment, after = mapping[1:]
+    frame += offset
+    return first + (frame - first) // increment * increment + after
+
+def _node_inputs(node):
+    """
+    Returns the nodes feeding the given node: its inputs, the Output nodes
+    of a Group, or for an Input node inside a Group, the Group's input.
+    """
+    inputs = [node.input(i) for i in range(node.inputs())]
+    cls = node.Class()
+    if cls in GROUP_CLASSES and hasattr(node, 'nodes'):
+        outputs = [x for x in node.nodes() if x.Class() == 'Output']
+        if outputs:
+            return outputs
+    if cls == 'Input':
+        key = _node_key(node)
+        if '.' in key:
+            group = nuke.toNode(key.rsplit('.', 1)[0])
+            number = node.knob('number')
+            index = int(number.value()) if number is not None else 0
+            if group is not None:
+                return [group.input(index)]
+    return inputs
+
+def _file_frame(node, frame):
+    """
+    Returns the frame of a Read's sequence it shows on the given frame,
+    after its frame mode and before and after behaviour, or None if it's
+    black there.
+    """
+    first = int(node.knob('first').value())
+    last = int(node.knob('last').value())
+    mode = node.knob('frame_mode')
+    value = node.knob('frame')
+    if mode is not None and value is not None and str(value.value()).strip():
+        try:
+            amount = int(float(value.value()))
+        except ValueError:
+            amount = None
+        if amount is not None:
+            if mode.value() == 'offset':
+                frame -= amount
+            elif mode.value() == 'start at':
+                frame += first - amount
+    if first <= frame <= last:
+        return frame
+    behaviour = node.knob('before' if frame < first else 'after')
+    behaviour = behaviour.value() if behaviour is not None else 'hold'
+    length = last - first + 1
+    if behaviour == 'black':
+        return None
+    if behaviour == 'loop':
+        return first + (frame - first) % length
+    if behaviour == 'bounce' and length > 1:
+        position = (frame - first) % (2 * length - 2)
+        return first + (position if position < length else
+                        2 * length - 2 - position)
+    return min(max(frame, first), last)
+
+class FramePathTable(object):
+    """
+    The exact file each Read uses on each frame of a render, following
+    TimeOffset and FrameHold nodes and the Reads' frame modes and before and
+    after behaviour, and evaluating file expressions that change per frame.
+    For example:
+
+    table = FramePathTable.build(write_nodes, expand_frames('1-100'))
+    table.files('Read1')
+
+    Each Read's frames and files are kept in arrays, with every distinct
+    path stored once. Paths are worked out once per Read and frame, however
+    many routes lead to it.
+    """
+    def __init__(self):
+        self.paths = []
+        self.path_index = dict()
+        # {node name: (frames asked for, path indices)}
+        self.reads = dict()
+        # every Read reached, and those under a time node this can't
+        # follow, which need their whole range
+        self.reached = set()
+        self.unmapped = set()
+        # {node name: time mappings it's reached with}, and the paths of
+        # each Read by the frame it's asked for, built when needed
+        self.mappings = dict()
+        self._by_frame = dict()
+
+    def add(self, name, frame, path):
+        index = self.path_index.get(path)
+        if index is None:
+            index = self.path_index[path] = len(self.paths)
+            self.paths.append(path)
+        if name not in self.reads:
+            self.reads[name] = (array.array('l'), array.array('l'))
+        frames, indices = self.reads[name]
+        frames.append(frame)
+        indices.append(index)
+
+    def frames(self, name):
+        """
+        Returns the (frame, path) pairs of the named Read, where frame is
+        the time the Read is asked for after any remapping downstream.
+        """
+        frames, indices = self.reads.get(name, ((), ()))
+        return [(x, self.paths[y]) for x, y in zip(frames, indices)]
+
+    def files(self, name=None):
+        """
+        Returns the set of files used by the named Read, or by all of them.
+        """
+        names = [name] if name is not None else list(self.reads)
+        return set(self.paths[x] for y in names
+                   for x in self.reads.get(y, ((), ()))[1])
+
+    def render_files(self, frame):
+        """
+        Returns the set of files used to render the given frame, following
+        each Read's time mappings back from it.
+        """
+        files = set()
+        for name, mappings in self.mappings.items():
+            if name not in self._by_frame:
+                by_frame = self._by_frame[name] = dict()
+                for read_frame, path in self.frames(name):
+                    by_frame.setdefault(read_frame, []).append(path)
+            by_frame = self._by_frame[name]
+            for mapping in mappings:
+                if mapping is None:
+                    files.update(self.files(name))
+                else:
+                    files.update(by_frame.get(_map_frame(mapping, frame), ()))
+        return files
+
+    def sequences(self):
+        """
+        Returns (node name, path, None, None) sequences of every file, for
+        check_sequences() and sequence_files().
+        """
+        return [(name, self.paths[x], None, None)
+                for name in sorted(self.reads)
+                for x in sorted(set(self.reads[name][1]))]
+
+    @classmethod
+    def build(cls, roots, frames, views=None):
+        """
+        Builds the table for the Reads upstream of the given nodes over the
+        given render frames and views. Each node is visited once per
+        distinct time mapping it's reached with.
+        """
+        table = cls()
+        seen = set()
+        read_mappings = dict()
+        stack = [(x, ('offset', 0)) for x in roots]
+        while stack:
+            node, mapping = stack.pop()
+            key = (_node_key(node), mapping)
+            if key in seen:
+                continue
+            seen.add(key)
+            if node.Class() == 'Read':
+                read_mappings.setdefault(key[0], (node, []))[1].append(mapping)
+                continue
+            inner = _time_mapping(node, mapping)
+            for dep in _node_inputs(node):
+                if dep is not None:
+                    stack.append((dep, inner))
+
+        table.reached.update(read_mappings)
+        for name, (node, node_mappings) in sorted(read_mappings.items()):
+            if node.knob('disable').value():
+                continue
+            if None in node_mappings:
+                table.unmapped.add(name)
+            table.mappings[name] = node_mappings
+            table._add_read(name, node, node_mappings, frames, views)
+        return table
+
+    def _add_read(self, name, node, mappings, frames, views):
+        file_knob = node.knob('file')
+        expression = file_knob.value()
+        per_frame = '[' in expression and \
+            _FRAME_EXPR_RE.search(expression) is not None
+        pattern = None
+        if not per_frame:
+            pattern = frozen_value(node, 'file') or expression
+            if not pattern:
+                return
+        if not ('%v' in expression or '%V' in expression):
+            views = None
+
+        read_frames = set()
+        for mapping in mappings:
+            if mapping is None:
+                first = int(node.knob('first').value())
+                last = int(node.knob('last').value())
+                read_frames.update(range(first, last + 1))
+            else:
+                read_frames.update(_map_frame(mapping, x) for x in frames)
+
+        for frame in sorted(read_frames):
+            file_frame = _file_frame(node, frame)
+            if file_frame is None:
+                continue
+            path = pattern
+            if per_frame:
+                try:
+                    path = file_knob.evaluate(frame)
+                except TypeError:
+                    # no time argument in older versions of Nuke
+                    path = file_knob.evaluate()
+                path = _frame_pattern(expression, path)
+            for view in views or [None]:
+                self.add(name, frame, expand_path(path, file_frame, view))
+
+def sequence_files(sequences):
+    """
+    Returns the paths of the existing files in the given sequences.
+    """
+    paths = set()
+    for name, pattern, frames, views in sequences:
+        for view in views or [None]:
+            for frame in frames or [None]:
+                paths.add(expand_path(pattern, frame, view))
+    return sorted(x for x in paths if os.path.isfile(x))
+
+def write_sequences(nodes, frames, views=None):
+    """
+    Returns the (node name, pattern, frames, views) sequences the given
+    Write nodes render over the given frames, like read_sequences(). Frames
+    are limited to a Write's own range if it has one, and views to the ones
+    it renders.
+    """
+    sequences = []
+    for node in nodes:
+        if node.Class() != 'Write' or node.knob('disable').value():
+            continue
+        pattern = frozen_value(node, 'file') or node.knob('file').value()
+        if not pattern:
+            continue
+        node_frames = None
+        if has_frame_token(pattern):
+            node_frames = frames
+            if node.knob('use_limit') is not None and \
+               node.knob('use_limit').value():
+                first = int(node.knob('first').value())
+                last = int(node.knob('last').value())
+                node_frames = [x for x in frames if first <= x <= last]
+        node_views = None
+        if '%v' in pattern or '%V' in pattern:
+            node_views = views
+            if views and node.knob('views') is not None:
+                wanted = node.knob('views').value().split()
+                node_views = [x for x in views if x in wanted] or views
+        sequences.append((_node_key(node), pattern, node_frames, node_views))
+    return sequences
+
+class OutputReport(object):
+    """
+    Problems with where Write nodes render to: files rendered by more than
+    one Write, and files the script also reads, as {(node names, pattern):
+    [frames]}. directories holds every output directory.
+    """
+    def __init__(self):
+        self.collisions = dict()
+        self.clobbers = dict()
+        self.directories = set()
+
+    def ok(self):
+        return not self.collisions and not self.clobbers
+
+    def summary(self, limit=20):
+        lines = []
+        for (names, pattern), frames in sorted(self.collisions.items()):
+            lines.append(_with_frames('%s %s render %s' % (
+                ' and '.join(names), 'both' if len(names) == 2 else 'all',
+                pattern), frames))
+        for (names, pattern), frames in sorted(self.clobbers.items()):
+            lines.append(_with_frames('%s overwrites %s, which %s reads' % (
+                names[0], pattern, names[1]), frames))
+        if len(lines) > limit:
+            lines = lines[:limit] + ['... and %d more' % (len(lines) - limit,)]
+        return '\n'.join(lines)
+
+def _with_frames(line, frames):
+    frames = sorted(set(x for x in frames if x is not None))
+    if frames:
+        line += ' (frames %s)' % (compact_frames(frames),)
+    return line
+
+def _sequence_paths(sequences):
+    """
+    Yields (normalized path, path, node name, pattern, frame) for every
+    file of the given sequences.
+    """
+    for name, pattern, frames, views in sequences:
+        for view in views or [None]:
+            for frame in frames or [None]:
+                path = expand_path(pattern, frame, view)
+                yield (os.path.normcase(os.path.normpath(path)), path, name,
+                       pattern, frame)
+
+def check_outputs(writes, reads=None):
+    """
+    Checks the output files of the given Write sequences from
+    write_sequences() against each other, and against the Read sequences
+    from read_sequences() if given. Returns an OutputReport.
+    """
+    report = OutputReport()
+    writers = dict()
+    for key, path, name, pattern, frame in _sequence_paths(writes):
+        writers.setdefault(key, []).append((name, pattern, frame))
+        report.directories.add(os.path.dirname(path))
+    for users in writers.values():
+        names = sorted(set(x[0] for x in users))
+        if len(names) > 1:
+            report.collisions.setdefault((tuple(names), users[0][1]),
+                                         []).append(users[0][2])
+
+    for key, path, name, pattern, frame in _sequence_paths(reads or ()):
+        for writer, write_pattern, write_frame in writers.get(key, ()):
+            report.clobbers.setdefault(((writer, name), write_pattern),
+                                       []).append(write_frame)
+    return report
+
+def create_directories(directories, workers=None):
+    """
+    Creates any of the given directories that don't exist yet, several at a
+    time. Only the deepest of nested directories are created, since making
+    them makes their parents. Returns the directories created.
+    """
+    if workers is None:
+        workers = PREFLIGHT_THREADS
+    directories = sorted(set(x for x in directories if x))
+    deepest = [x for i, x in enumerate(directories)
+               if not (i + 1 < len(directories) and
+                       directories[i + 1].startswith(x + os.sep))]
+
+    def create(directory):
+        if os.path.isdir(directory):
+            return None
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # made by another thread or process in the meantime
+            if not os.path.isdir(directory):
+                raise
+        return directory
+
+    return [x for x in parallel_map(create, deepest, workers) if x]
+
+class FrameManifest(object):
+    """
+    The fingerprint of the script and input files each frame of each output
+    was rendered from, as {pattern: {frame: fingerprint}}. It's kept in
+    CACHE_DIR rather than next to the renders. Fingerprints are recorded
+    for each job when it's submitted, and only count once a later check
+    finds the job's output file for the frame, written after the job was
+    submitted. For example:
+
+    FRAME_MANIFEST.submitted(job_id, outputs, frames)
+    ...
+    changed = changed_frames(outputs)    # confirms what's been rendered
+
+    Jobs that never produce their frames are forgotten after max_days.
+    """
+    def __init__(self, path, max_days=30):
+        self.path = path
+        self.max_days = max_days
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def _load(self):
+        if self.entries is None:
+            self.entries = _read_json(self.path, dict())
+            self.entries.setdefault('jobs', dict())
+            self.entries.setdefault('frames', dict())
+        return self.entries
+
+    def _save(self):
+        try:
+            _write_json_atomic(self.path, self.entries)
+        except (IOError, OSError):
+            pass
+
+    def get(self, pattern):
+        """
+        Returns the confirmed {frame: fingerprint} of an output pattern.
+        """
+        with self.lock:
+            frames = self._load()['frames'].get(pattern, dict())
+            return dict((int(x), y) for x, y in frames.items())
+
+    def submitted(self, job_id, outputs, frames):
+        """
+        Records the fingerprints of the given frames of frame_fingerprints()
+        outputs for a job that was just submitted. The manifest is re-read
+        first, in case another session changed it in the meantime.
+        """
+        frames = set(frames)
+        with self.lock:
+            self.entries = None
+            self._load()['jobs'][str(job_id)] = dict(
+                time=time.time(),
+                outputs=dict((pattern, dict(
+                    (str(x), y) for x, y in fingerprints.items()
+                    if x in frames)) for pattern, fingerprints in outputs))
+            self._save()
+
+    def confirm(self, patterns=None):
+        """
+        Moves the fingerprints of submitted frames whose output file has
+        been written since their job was submitted to the confirmed ones,
+        for the given output patterns or all of them. Jobs with nothing
+        left to confirm, or older than max_days, are dropped.
+        """
+        with self.lock:
+            self.entries = None
+            entries = self._load()
+            jobs = entries['jobs']
+            cutoff = time.time() - self.max_days * 24 * 60 * 60
+            changed = False
+            # oldest first, so a later job's fingerprint wins
+            for job_id in sorted(jobs, key=lambda x: jobs[x]['time']):
+                job = jobs[job_id]
+                for pattern, fingerprints in list(job['outputs'].items()):
+                    if patterns is not None and pattern not in patterns:
+                        continue
+                    for frame, fingerprint in list(fingerprints.items()):
+                        try:
+                            stat = os.stat(expand_path(pattern, int(frame)))
+                        except OSError:
+                            continue
+                        # file times are coarser than time.time()
+                        if stat.st_size and stat.st_mtime >= job['time'] - 2:
+                            entries['frames'].setdefault(
+                                pattern, dict())[frame] = fingerprint
+                            del fingerprints[frame]
+                            changed = True
+                    if not fingerprints:
+                        del job['outputs'][pattern]
+                        changed = True
+                if not job['outputs'] or job['time'] < cutoff:
+                    del jobs[job_id]
+                    changed = True
+            if changed:
+                self._save()
+
+FRAME_MANIFEST = FrameManifest(os.path.join(CACHE_DIR, 'nuke_frames.json'))
+
+def frame_fingerprints(script, write_node, frames, views=None, graph=None):
+    """
+    Returns a list of (output pattern, {frame: fingerprint}) for a Write
+    node, one per view if it renders each view to its own files. A frame's
+    fingerprint covers every node upstream of the Write in the parsed script
+    and the path, size and modification time of each file it reads on that
+    frame.
+    """
+    if graph is None:
+        graph = script.graph()
+    name = _node_key(write_node)
+    digest = hashlib.md5()
+    if script.root is not None:
+        digest.update(script.root.digest.encode('utf-8'))
+    for upstream_name in sorted(graph.upstream_names([name])):
+        node = script.by_name.get(upstream_name)
+        if node is not None:
+            digest.update(('%s %s\n' % (upstream_name,
+                                        node.digest)).encode('utf-8'))
+    graph_digest = digest.hexdigest()
+
+    pattern = frozen_value(write_node, 'file') or \
+        write_node.knob('file').value()
+    if '%v' not in pattern and '%V' not in pattern:
+        views = None
+    table = FramePathTable.build([write_node], frames, views)
+    identities = dict()
+
+    def identity(path):
+        if path not in identities:
+            try:
+                stat = os.stat(path)
+                identities[path] = '%s %d %d' % (path, stat.st_size,
+                                                 int(stat.st_mtime))
+            except OSError:
+                identities[path] = '%s missing' % (path,)
+        return identities[path]
+
+    frame_digests = dict()
+    for frame in frames:
+        digest = hashlib.md5(graph_digest.encode('utf-8'))
+        for path in sorted(table.render_files(frame)):
+            digest.update(identity(path).encode('utf-8'))
+        frame_digests[frame] = digest.hexdigest()
+    return [(expand_path(pattern, None, view), frame_digests)
+            for view in views or [None]]
+
+def changed_frames(outputs):
+    """
+    Returns the sorted frames of the given frame_fingerprints() outputs that
+    need rendering: those whose file is missing or empty, or whose
+    fingerprint differs from the confirmed one in FRAME_MANIFEST. Frames of
+    earlier jobs that have since been rendered are confirmed first.
+    """
+    FRAME_MANIFEST.confirm(set(x[0] for x in outputs))
+    changed = set()
+    listings = dict()
+    for pattern, fingerprints in outputs:
+        directory = os.path.dirname(expand_path(pattern, 0))
+        if directory not in listings:
+            listings[directory] = _list_sizes(directory or '.')
+        sizes = listings[directory]
+        recorded = FRAME_MANIFEST.get(pattern)
+        for frame, fingerprint in fingerprints.items():
+            if recorded.get(frame) != fingerprint or sizes is None:
+                changed.add(frame)
+                continue
+            file_name = os.path.basename(expand_path(pattern, frame))
+            entry = sizes.get(file_name, False)
+            try:
+                if entry is False:
+                    size = 0
+                elif entry is None:
+                    size = os.path.getsize(os.path.join(directory, file_name))
+                else:
+                    size = entry.stat().st_size
+            except OSError:
+                size = 0
+            if not size:
+                changed.add(frame)
+    return sorted(changed)
+
+def record_frames(job_id, outputs, frames):
+    """
+    Saves the fingerprints of the given frames of frame_fingerprints()
+    outputs for a submitted job, to be confirmed once they're rendered.
+    """
+    FRAME_MANIFEST.submitted(job_id, outputs, frames)
+
+def preflight(view=None, frange=None, step=1, nodes=None, sequences=None):
+    """
+    Runs a preflight pass on the current nuke scene. Modify as needed.
+    Returning True = success, False = failure
+
+    Checks that every frame the Read nodes (or just the given nodes) need
+    over the frame range exists and, with PREFLIGHT_CHECK_EMPTY, isn't
+    empty, and asks whether to carry on if any don't. Sequences already found with read_sequences() may be
+    given instead.
+    """
+    if sequences is None:
+        if frange is None:
+            frange = '%d-%d' % (nuke.root().knob('first_frame').value(),
+                                nuke.root().knob('last_frame').value())
+        if nodes is None:
+            nodes = _node_list()
+        views = [view] if view else nuke.views()
+        sequences = read_sequences(nodes, expand_frames(frange, step), views)
+    report = check_sequences(sequences)
+    if report.ok():
+        return True
+    msg = 'Some files needed for this render are missing or empty:\n\n%s\n\n' \
+          'Submit anyway?' % (report.summary(),)
+    return nuke.ask(msg)
+
+class PasswordPrompt(nukescripts.panels.PythonPanel):
+    """
+    A hacked-in username/password prompt ui.
+    """
+    def __init__( self, title=None, user_default=None ):
+        """
+        Initialize the password prompt.
+        """
+        if not title:
+            title = ''
+        super(PasswordPrompt, self).__init__(title)
+
+        self.__password = None
+
+        self.username = nuke.String_Knob('username', 'Username: ')
+        if user_default != None:
+            self.username.setValue( user_default )
+        try:
+            self.password = nuke.Password_Knob('password', 'Password: ')
+        except Exception:
+            self.password = nuke.String_Knob('password', 'Password: ')
+        self.addKnob(self.username)
+        self.addKnob(self.password)
+
+    def knobChanged(self, knob):
+        if knob == self.password:
+            self.__password = knob.value()
+            knob.setValue(len(knob.value()) * '*')
+
+    def get_password(self):
+        """
+        Function alias for showModalDialog
+        """
+        return self.showModalDialog()
+
+    def showModalDialog(self):
+        """
+        Puts the PasswordPrompt in a modal dialog box and returns the inputs
+        """
+        result = super(PasswordPrompt, self).showModalDialog()
+        if result:
+            return (self.username.value(), self.__password)
+
+class WriteChanges(object):
+    """
+    Given a script to save to, will save all of the changes made in the
+    with block to the script, then undoes those changes in the current
+    script. For example:
+
+    with WriteChanges('/Volumes/af/show/omg/script.nk'):
+        for node in nuke.allNodes():
+            node.setYpos(100)
+
+    FIXME: need to come up with a better name?
+    """
+    def __init__(self, script, save_func=None):
+        """
+        Initialize a WriteChanges context manager.
+        Must provide a script to write to.
+
+        If you provide a save_func, it will be called instead of the default
+        `nuke.scriptSave`. The function must have the same interface as
+        `nuke.scriptSave`. A possible alternative is `nuke.nodeCopy`.
+        """
+        self.undo = nuke.Undo
+        self.__disabled = self.undo.disabled()
+        self.script = script
+        if save_func:
+            self.save_func = save_func
+        else:
+            self.save_func = nuke.scriptSave
+
+    def __enter__(self):
+        """
+        Enters the with block.
+        NOTE: does not return an object, so assigment using 'as' doesn't work:
+            `with WriteChanges('foo') as wc:`
+        """
+        if self.__disabled:
+            self.undo.enable()
+
+        self.undo.begin()
+
+    def __exit__(self, type, value, traceback):
+        """
+        Exits the with block.
+
+        First it calls the save_func, then undoes all actions in the with
+        context, leaving the state of the current script untouched.
+        """
+        self.save_func(self.script)
+        self.undo.cancel()
+        if self.__disabled:
+            self.undo.disable()
+
+#
+#   Offline .nk parsing. Reads a saved script as text so that the cloud
+#   script can be written without touching the open session.
+#
+
+# classes whose block is followed by child nodes and an end_group
+GROUP_CLASSES = ('Group', 'Gizmo', 'LiveGroup')
+
+# knobs remembered for each node while parsing. Everything else is only
+# carried through to the output untouched.
+TRACKED_KNOBS = ('name', 'inputs', 'disable', 'file', 'font', 'views',
+                 'first', 'last', 'first_frame', 'last_frame', 'before',
+                 'after', 'frame_mode', 'frame', 'origfirst', 'origlast',
+                 'time_offset', 'reverse_input', 'increment', 'format',
+                 'proxy', 'file_type')
+
+# top-level script commands that may look like node blocks
+SCRIPT_COMMANDS = ('add_layer', 'define_user_knobs', 'version', 'push',
+                   'set', 'end_group', 'cut_paste_input')
+
+_HEADER_RE = re.compile(r'^\s*(?:clone\s+(\S+)(?:\s+\w+)?|(\w+))\s*\{')
+_SET_RE = re.compile(r'^set\s+(\S+)\s+\[stack\s+(\d+)\]')
+_REF_RE = re.compile(r'(?<![\w.$\\])(parent\.)?([A-Za-z_]\w*)\.(?=[A-Za-z_])')
+_ESCAPE_RE = re.compile(r'\\(.)')
+_COMMAND_RE = re.compile(r'\[([^\[\]]*)\]')
+_BARE_RE = re.compile(r'^[\w./:%#@+,=~-]+$')
+
+def _decode(line):
+    """
+    Decodes a line read from a script, falling back to latin-1 for scripts
+    that aren't valid utf-8.
+    """
+    try:
+        return line.decode('utf-8')
+    except UnicodeDecodeError:
+        return line.decode('latin-1')
+
+def _scan_braces(line, depth, quoted):
+    """
+    Returns the brace depth and quote state at the end of the given line.
+    Quotes only matter at the top level of a node block; braces inside
+    quotes and escaped characters don't count.
+    """
+    if not quoted and '"' not in line and '\\' not in line:
+        return depth + line.count('{') - line.count('}'), False
+    i = 0
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '"' and depth <= 1:
+            quoted = not quoted
+        elif not quoted:
+            if c == '{':
+                depth += 1
+            elif c == '}':
+                depth -= 1
+        i += 1
+    return depth, quoted
+
+def tcl_unquote(raw):
+    """
+    Returns the value of a knob as it was written in the script, removing
+    quotes, braces and backslash escapes.
+    """
+    if len(raw) > 1 and raw[0] == '{' and raw[-1] == '}':
+        return raw[1:-1]
+    if len(raw) > 1 and raw[0] == '"' and raw[-1] == '"':
+        raw = raw[1:-1]
+    if '\\' not in raw:
+        return raw
+    escapes = {'n': '\n', 't': '\t'}
+    return _ESCAPE_RE.sub(lambda m: escapes.get(m.group(1), m.group(1)), raw)
+
+def tcl_quote(value):
+    """
+    Returns the given value quoted for writing as a knob value in a script.
+    """
+    if _BARE_RE.match(value):
+        return value
+    value = re.sub(r'([\\"$\[\]])', r'\\\1', value)
+    return '"%s"' % (value.replace('\n', '\\n'),)
+
+class ScriptNode(object):
+    """
+    A node read from a script: its class, name, inputs and the lines of the
+    script its definition spans.
+    """
+    __slots__ = ('index', 'cls', 'name', 'full_name', 'parent', 'inputs',
+                 'start', 'end', 'knobs', 'refs', 'clone_of', 'clone_vars',
+                 'digest')
+
+    def __init__(self, index, cls, parent, start):
+        self.index = index
+        self.cls = cls
+        self.name = None
+        self.full_name = None
+        self.parent = parent
+        self.inputs = []
+        self.start = start
+        self.end = None
+        self.knobs = dict()
+        self.refs = None
+        self.clone_of = None
+        self.clone_vars = None
+        self.digest = hashlib.md5()
+
+    def value(self, knob_name, default=None):
+        """
+        Returns the unquoted value of a tracked knob, or the default if the
+        knob isn't set in the script.
+        """
+        if knob_name not in self.knobs:
+            return default
+        return tcl_unquote(self.knobs[knob_name][1])
+
+    def disabled(self):
+        return self.value('disable', 'false') in ('true', '1')
+
+    def num_inputs(self):
+        """
+        The number of stack entries the node consumes. A missing inputs
+        knob means one; masks are written as "2+1".
+        """
+        if self.cls == 'Root':
+            return 0
+        raw = self.value('inputs', '1')
+        try:
+            return sum(int(x) for x in raw.split('+'))
+        except ValueError:
+            return 1
+
+class NukeScript(object):
+    """
+    A streaming reader and writer for the .nk format. Reading a script keeps
+    only a small record per node, never the script text, so memory stays
+    bounded on huge scripts. For example:
+
+    script = NukeScript('/Volumes/af/show/omg/script.nk')
+    keep = script.graph().upstream_names(['Write1'])
+    script.write(generate_script_path(), keep=keep)
+
+    Only the node blocks upstream of the given roots are written, with the
+    stack commands between them regenerated.
+    """
+    def __init__(self, path):
+        """
+        Parses the script at the given path.
+        """
+        self.path = path
+        self.nodes = []
+        self.by_name = dict()
+        self.root = None
+        # (start line, end line, node index) for each top-level span. The
+        # index is None for other commands and -1 for stack commands.
+        self._items = []
+        # (node index, knob name) of every FREEZE_KNOBS knob holding an
+        # expression, so freezing never has to look at the other nodes.
+        self.expression_knobs = []
+        # (node index, knob name) of every FREEZE_KNOBS knob with a %v or %V
+        # view in its path, to substitute when writing one view's script.
+        self.view_knobs = []
+        # md5 of the whole file
+        self.digest = None
+        self._parse()
+
+    def _parse(self):
+        stack = []
+        scopes = []
+        variables = dict()
+        node = None
+        depth, quoted = 0, False
+        items = self._items
+        lineno = -1
+        digest = hashlib.md5()
+
+        f = open(self.path, 'rb')
+        try:
+            for lineno, raw_line in enumerate(f):
+                digest.update(raw_line)
+                line = _decode(raw_line)
+
+                if node is not None:
+                    continuing = depth > 1 or quoted
+                    depth, quoted = _scan_braces(line, depth, quoted)
+                    node.digest.update(raw_line)
+                    if depth <= 0:
+                        stack = self._end_node(node, lineno, stack, scopes)
+                        node = None
+                        continue
+                    self._read_knob(node, lineno, line, continuing,
+                                    depth > 1 or quoted)
+                    continue
+
+                stripped = line.strip()
+                words = stripped.split(None, 1)
+                command = words[0] if words else ''
+                header = _HEADER_RE.match(line)
+                if header and command not in SCRIPT_COMMANDS:
+                    cls = header.group(2)
+                    clone_of = None
+                    if header.group(1):
+                        clone_of = variables.get(header.group(1).lstrip('$'))
+                        cls = self.nodes[clone_of].cls if clone_of is not None else 'clone'
+                    parent = scopes[-1][0] if scopes else None
+                    node = ScriptNode(len(self.nodes), cls, parent, lineno)
+                    node.clone_of = clone_of
+                    node.digest.update(raw_line)
+                    self.nodes.append(node)
+                    depth, quoted = _scan_braces(line, 0, False)
+                    if depth <= 0:
+                        # the whole block is on one line
+                        body = line[line.index('{') + 1:line.rindex('}')]
+                        self._read_inline_knobs(node, body)
+                        stack = self._end_node(node, lineno, stack, scopes)
+                        node = None
+                    continue
+
+                if command == 'push':
+                    arg = words[1].strip() if len(words) > 1 else '0'
+                    if arg.startswith('$'):
+                        stack.append(variables.get(arg[1:]))
+                    else:
+                        stack.append(None)
+                    kind = -1
+                elif command == 'set' and _SET_RE.match(stripped):
+                    match = _SET_RE.match(stripped)
+                    position = int(match.group(2))
+                    target = None
+                    if position < len(stack):
+                        target = stack[-1 - position]
+                    variables[match.group(1)] = target
+                    if target is not None and match.group(1).startswith('C'):
+                        target_node = self.nodes[target]
+                        if target_node.clone_vars is None:
+                            target_node.clone_vars = []
+                        target_node.clone_vars.append(match.group(1))
+                    kind = -1
+                elif command == 'end_group' and scopes:
+                    index, stack, item = scopes.pop()
+                    stack.append(index)
+                    if item is not None:
+                        item[1] = lineno + 1
+                    continue
+                else:
+                    kind = None
+
+                if scopes:
+                    continue
+                if kind is None and items and items[-1][2] is None and \
+                   items[-1][1] == lineno:
+                    items[-1][1] = lineno + 1
+                else:
+                    items.append([lineno, lineno + 1, kind])
+        finally:
+            f.close()
+
+        # close any groups left open by a truncated script
+        while scopes:
+            index, stack, item = scopes.pop()
+            if item is not None:
+                item[1] = lineno + 1
+
+        self.digest = digest.hexdigest()
+        self._resolve_refs()
+
+    def _read_knob(self, node, lineno, line, continuing, incomplete):
+        """
+        Records a knob line from inside a node block.
+        """
+        if not continuing:
+            words = line.strip().split(None, 1)
+            if not words:
+                return
+            name = words[0]
+            raw = words[1] if len(words) > 1 else ''
+            tracked = name in TRACKED_KNOBS or node.cls == 'Root'
+            if tracked and not incomplete:
+                node.knobs[name] = (lineno, raw)
+                if name == 'name':
+                    node.name = tcl_unquote(raw)
+                elif name in FREEZE_KNOBS:
+                    if '[' in raw:
+                        self.expression_knobs.append((node.index, name))
+                    if '%v' in raw or '%V' in raw:
+                        self.view_knobs.append((node.index, name))
+        if '[' in line or '{{' in line:
+            refs = [(m.group(1) is not None, m.group(2))
+                    for m in _REF_RE.finditer(line)]
+            if refs:
+                if node.refs is None:
+                    node.refs = set()
+                node.refs.update(refs)
+
+    def _read_inline_knobs(self, node, body):
+        """
+        Records the name and inputs of a node written on a single line.
+        These knobs can't be rewritten, so their line isn't remembered.
+        """
+        words = body.split()
+        for name, value in zip(words[::2], words[1::2]):
+            if name in ('name', 'inputs', 'disable'):
+                node.knobs[name] = (None, value)
+        node.name = node.value('name')
+
+    def _end_node(self, node, lineno, stack, scopes):
+        """
+        Finishes a node block: pops its inputs off the stack and pushes the
+        node, or starts a new stack for the children of a group. Returns the
+        stack to carry on with.
+        """
+        node.end = lineno + 1
+        node.digest = node.digest.hexdigest()
+        if node.name is None:
+            node.name = '%s%d' % (node.cls, node.index)
+        if node.parent is None:
+            node.full_name = node.name
+        else:
+            node.full_name = '.'.join([self.nodes[node.parent].full_name,
+                                       node.name])
+        self.by_name[node.full_name] = node
+
+        if node.cls == 'Root':
+            self.root = node
+            if not scopes:
+                self._items.append([node.start, node.end, node.index])
+            return stack
+
+        for i in range(node.num_inputs()):
+            node.inputs.append(stack.pop() if stack else None)
+
+        item = None
+        if not scopes:
+            item = [node.start, node.end, node.index]
+            self._items.append(item)
+        if node.cls in GROUP_CLASSES:
+            scopes.append((node.index, stack, item))
+            return []
+        stack.append(node.index)
+        return stack
+
+    def _resolve_refs(self):
+        """
+        Turns the names found in expressions into node references, looking
+        in the node's own group first and then at the top level.
+        """
+        for node in self.nodes:
+            if not node.refs:
+                node.refs = None
+                continue
+            refs = set()
+            scope = self.nodes[node.parent] if node.parent is not None else None
+            for from_parent, name in node.refs:
+                target_scope = scope
+                if from_parent and scope is not None:
+                    target_scope = self.nodes[scope.parent] \
+                        if scope.parent is not None else None
+                candidates = [name]
+                if target_scope is not None:
+                    candidates.insert(0, target_scope.full_name + '.' + name)
+                for candidate in candidates:
+                    if candidate in self.by_name and candidate != node.full_name:
+                        refs.add(candidate)
+                        break
+            node.refs = refs or None
+
+    def graph(self):
+        """
+        Returns a DependencyGraph of the script: each node depends on its
+        inputs, the nodes its expressions refer to, the node it's a clone of
+        and, for groups, its children.
+        """
+        edges = dict()
+        nodes = self.nodes
+        for node in nodes:
+            deps = edges.setdefault(node.full_name, [])
+            deps.extend(nodes[x].full_name for x in node.inputs if x is not None)
+            if node.refs:
+                deps.extend(node.refs)
+            if node.clone_of is not None:
+                deps.append(nodes[node.clone_of].full_name)
+            if node.parent is not None:
+                edges.setdefault(nodes[node.parent].full_name, []).append(
+                    node.full_name)
+        return DependencyGraph.from_edges(edges, self.by_name)
+
+    def writes(self, enabled_only=True):
+        """
+        Returns the top-level Write nodes in the script.
+        """
+        return [x for x in self.nodes if x.cls == 'Write' and
+                x.parent is None and not (enabled_only and x.disabled())]
+
+    def is_stereo(self, keep=None):
+        """
+        Returns True if any of the nodes in keep (or the whole script) has a
+        per-view path, or is a Write rendering more than one view.
+        """
+        for index, knob_name in self.view_knobs:
+            if keep is None or self.nodes[index].full_name in keep:
+                return True
+        for node in self.writes():
+            if keep is not None and node.full_name not in keep:
+                continue
+            if len(node.value('views', '').split()) > 1:
+                return True
+        return False
+
+    def expressions(self, keep=None, knob_names=FREEZE_KNOBS):
+        """
+        Yields (node, knob name, value) for each of the given knobs that
+        holds an expression, limited to the nodes in keep if given.
+        """
+        if knob_names == FREEZE_KNOBS:
+            for index, knob_name in self.expression_knobs:
+                node = self.nodes[index]
+                if keep is not None and node.full_name not in keep:
+                    continue
+                value = node.value(knob_name)
+                if '[' in value:
+                    yield node, knob_name, value
+            return
+
+        for node in self.nodes:
+            if keep is not None and node.full_name not in keep:
+                continue
+            for knob_name in knob_names:
+                if knob_name not in node.knobs:
+                    continue
+                value = node.value(knob_name)
+                if '[' in value:
+                    yield node, knob_name, value
+
+    def freeze(self, evaluate, keep=None):
+        """
+        Returns a {(node name, knob name): value} map of frozen expressions
+        to pass to write(). evaluate is called with each node, knob name
+        and current value and should return the frozen value, or None to
+        leave the knob alone.
+        """
+        values = dict()
+        for node, knob_name, value in self.expressions(keep):
+            frozen = evaluate(node, knob_name, value)
+            if frozen is not None and frozen != value:
+                values[(node.full_name, knob_name)] = frozen
+        return values
+
+    def write(self, path, keep=None, values=None, gizmos=None, view=None):
+        """
+        Writes the script to the given path, keeping only the top-level nodes
+        named in keep (all of them if keep is None) and setting the knob
+        values given as {(node name, knob name): value}.
+
+        If a GizmoLibrary is given, top-level gizmo instances are written as
+        Groups built from their gizmo's definition and the instance's knobs.
+
+        If a view is given, %v and %V in file paths are replaced with it and
+        the top-level Write nodes render only that view.
+        """
+        replacements = dict()
+        if view is not None:
+            values = dict(values or dict())
+            for index, knob_name in self.view_knobs:
+                node = self.nodes[index]
+                if keep is not None and node.full_name not in keep:
+                    continue
+                key = (node.full_name, knob_name)
+                values[key] = expand_path(values.get(key, node.value(knob_name)),
+                                          None, view)
+            for node in self.writes(enabled_only=False):
+                if keep is not None and node.full_name not in keep:
+                    continue
+                line = ' views %s\n' % (tcl_quote(view),)
+                if 'views' in node.knobs:
+                    lineno = node.knobs['views'][0]
+                elif 'name' in node.knobs:
+                    # no views knob means every view, add one before the name
+                    lineno = node.knobs['name'][0]
+                    line += ' name %s\n' % (node.knobs['name'][1],)
+                else:
+                    continue
+                if lineno is not None:
+                    replacements[lineno] = line.encode('utf-8')
+
+        for (name, knob_name), value in (values or dict()).items():
+            node = self.by_name[name]
+            lineno = node.knobs.get(knob_name, (None,))[0]
+            if lineno is None:
+                continue
+            indent = ' ' * (node.full_name.count('.') + 1)
+            line = '%s%s %s\n' % (indent, knob_name, tcl_quote(value))
+            replacements[lineno] = line.encode('utf-8')
+
+        variables = dict()
+        src = open(self.path, 'rb')
+        dst = open(path, 'wb')
+        try:
+            for start, end, index in self._items:
+                node = None
+                emit = index is None
+                if index is not None and index >= 0:
+                    node = self.nodes[index]
+                    emit = node is self.root or keep is None or \
+                        node.full_name in keep
+
+                if emit and node is not None and node is not self.root:
+                    for input_index in reversed(node.inputs):
+                        if input_index in variables:
+                            dst.write(('push $%s\n' % variables[input_index]).encode('utf-8'))
+                        else:
+                            dst.write(b'push 0\n')
+
+                gizmo = None
+                if emit and gizmos is not None and node is not None and \
+                   node.clone_of is None and not node.clone_vars and \
+                   end - start > 1:
+                    gizmo = gizmos.definition(node.cls)
+
+                for lineno in range(start, end):
+                    line = next(src)
+                    if not emit:
+                        continue
+                    if gizmo is not None and lineno == start:
+                        dst.write(b'Group {\n')
+                        dst.writelines(gizmo.knob_lines)
+                        continue
+                    dst.write(replacements.get(lineno, line))
+                if gizmo is not None:
+                    dst.writelines(gizmo.body_lines)
+                    dst.write(b'end_group\n')
+
+                if emit and node is not None and node is not self.root:
+                    variables[index] = 'Nzync%d' % (index,)
+                    for name in [variables[index]] + (node.clone_vars or []):
+                        dst.write(('set %s [stack 0]\n' % (name,)).encode('utf-8'))
+        finally:
+            src.close()
+            dst.close()
+
+# knobs of a gizmo definition that belong to the instance instead
+_INSTANCE_KNOBS = ('inputs', 'name', 'xpos', 'ypos', 'selected')
+
+class GizmoDefinition(object):
+    """
+    The contents of a .gizmo file, split into the knob lines of its Gizmo
+    block (user knob definitions and defaults) and the lines of its child
+    nodes, ready to be written out as a Group.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.knob_lines = []
+        self.body_lines = []
+        self._parse()
+
+    def _parse(self):
+        f = open(self.path, 'rb')
+        try:
+            lines = f.readlines()
+        finally:
+            f.close()
+
+        start = None
+        for i, line in enumerate(lines):
+            if re.match(r'^\s*Gizmo\s*\{', _decode(line)):
+                start = i
+                break
+        if start is None:
+            raise ValueError('No Gizmo block in %s' % (self.path,))
+
+        depth, quoted = _scan_braces(_decode(lines[start]), 0, False)
+        entry = []
+        i = start + 1
+        while i < len(lines) and depth > 0:
+            text = _decode(lines[i])
+            continuing = depth > 1 or quoted
+            depth, quoted = _scan_braces(text, depth, quoted)
+            if depth <= 0:
+                break
+            if not continuing:
+                self._add_knob(entry)
+                entry = []
+            entry.append(lines[i])
+            i += 1
+        self._add_knob(entry)
+
+        end = len(lines)
+        for j in range(len(lines) - 1, i, -1):
+            if _decode(lines[j]).strip() == 'end_group':
+                end = j
+                break
+        self.body_lines = lines[i + 1:end]
+
+    def _add_knob(self, entry):
+        if not entry:
+            return
+        words = _decode(entry[0]).split(None, 1)
+        if words and words[0] not in _INSTANCE_KNOBS:
+            self.knob_lines.extend(entry)
+
+class GizmoLibrary(object):
+    """
+    Finds and parses .gizmo files on the plugin path, once per file and
+    modification time, so that every instance of a gizmo can be written out
+    as a Group from the same definition.
+    """
+    def __init__(self, search_path=None):
+        self.search_path = search_path
+        self.index = None
+        self.definitions = dict()
+        self.lock = threading.Lock()
+
+    def _build_index(self):
+        search_path = self.search_path
+        if search_path is None:
+            search_path = nuke.pluginPath()
+        index = dict()
+        for directory in search_path:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                base, ext = os.path.splitext(name)
+                if ext == '.gizmo' and base not in index:
+                    index[base] = os.path.join(directory, name)
+        return index
+
+    def definition(self, cls):
+        """
+        Returns the GizmoDefinition for a node class, or None if the class
+        isn't a gizmo.
+        """
+        with self.lock:
+            if self.index is None:
+                self.index = self._build_index()
+            path = self.index.get(cls)
+            if path is None:
+                return None
+            try:
+                key = (path, os.path.getmtime(path))
+            except OSError:
+                return None
+            if key not in self.definitions:
+                self.definitions[key] = GizmoDefinition(path)
+            return self.definitions[key]
+
+GIZMO_LIBRARY = GizmoLibrary()
+
+class ScriptEvaluator(object):
+    """
+    Evaluates the simple TCL expressions commonly found in file knobs
+    against a parsed script, for when there's no session to ask. Supports
+    value/knob, getenv, file and string commands. Anything else, including
+    frame, raises ValueError, and the knob is left as it is.
+    """
+    def __init__(self, script):
+        self.script = script
+        self.unsupported = []
+
+    def _knob_value(self, ref, node):
+        if '.' in ref:
+            node_name, knob_name = ref.rsplit('.', 1)
+        else:
+            node_name, knob_name = 'this', ref
+        if node_name == 'this':
+            target = node
+        elif node_name == 'root':
+            target = self.script.root
+        else:
+            target = self.script.by_name.get(node_name)
+            if target is None and node is not None and node.parent is not None:
+                scope = self.script.nodes[node.parent].full_name
+                target = self.script.by_name.get(scope + '.' + node_name)
+        if target is None:
+            raise ValueError('unknown node %s' % (node_name,))
+        if target is self.script.root and knob_name == 'name':
+            return self.script.root.value('name', self.script.path)
+        value = target.value(knob_name)
+        if value is None:
+            raise ValueError('unknown knob %s' % (ref,))
+        if '[' in value:
+            return self.evaluate(value, target)
+        return value
+
+    def _command(self, words, node):
+        command, args = words[0], words[1:]
+        if command in ('value', 'knob') and len(args) == 1:
+            return self._knob_value(args[0], node)
+        if command == 'getenv' and len(args) == 1:
+            return os.environ.get(args[0], '')
+        if command == 'frame':
+            # the frame changes as the job renders, so it's left to Nuke
+            raise ValueError('[frame] changes from frame to frame')
+        if command == 'file' and len(args) == 2:
+            op, path = args
+            if op == 'dirname':
+                return os.path.dirname(path) or '.'
+            if op == 'tail':
+                return os.path.basename(path)
+            if op == 'rootname':
+                return os.path.splitext(path)[0]
+            if op == 'extension':
+                return os.path.splitext(path)[1]
+        if command == 'string' and len(args) == 2:
+            op, text = args
+            if op == 'tolower':
+                return text.lower()
+            if op == 'toupper':
+                return text.upper()
+            if op == 'trim':
+                return text.strip()
+        raise ValueError('unsupported expression [%s]' % (' '.join(words),))
+
+    def evaluate(self, text, node=None):
+        """
+        Returns the text with every [command] substituted, innermost first.
+        """
+        while '[' in text:
+            match = _COMMAND_RE.search(text)
+            if match is None:
+                raise ValueError('unbalanced expression %s' % (text,))
+            words = match.group(1).split()
+            if not words:
+                raise ValueError('empty expression in %s' % (text,))
+            text = text[:match.start()] + self._command(words, node) + \
+                text[match.end():]
+        return text
+
+    def freeze(self, node, knob_name, value):
+        """
+        Freezes a knob the same way frozen_value() does in a session: Write
+        paths are evaluated whole, anything else keeps its file name and only
+        has its directory evaluated.
+        """
+        try:
+            evaluated = self.evaluate(value, node)
+        except ValueError as e:
+            self.unsupported.append('%s.%s: %s' % (node.full_name, knob_name, e))
+            return None
+        if node.cls == 'Write':
+            return evaluated
+        frozen_dir = os.path.split(evaluated)[0]
+        return os.path.join(frozen_dir, os.path.split(value)[-1])
+
+class _Span(object):
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def set(self, **args):
+        """
+        Adds arguments to the span, e.g. counts only known at the end.
+        """
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.profiler.add(self.name, self.start, time.time(), self.args)
+        return False
+
+class _NullSpan(object):
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class Profiler(object):
+    """
+    Records how long each phase of a submission takes, as spans that can be
+    nested and recorded from any thread, along with counts like nodes and
+    bytes written. The spans are saved as a Chrome trace (chrome://tracing)
+    per submission, and their durations appended to a rolling log for
+    profile_percentiles(). A disabled profiler records nothing.
+    """
+    def __init__(self, name, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.start = time.time()
+        self.spans = []
+        self.counts = dict()
+        self.lock = threading.Lock()
+
+    def span(self, name, **args):
+        """
+        Returns a context manager timing the with block as a span.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def add(self, name, start, end, args=None):
+        with self.lock:
+            self.spans.append((name, start, end,
+                               threading.current_thread().name, args or {}))
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counts[name] = self.counts.get(name, 0) + value
+
+    def durations(self):
+        """
+        Returns the total seconds spent in each span name.
+        """
+        durations = dict()
+        with self.lock:
+            for name, start, end, thread, args in self.spans:
+                durations[name] = durations.get(name, 0.0) + end - start
+        return durations
+
+    def trace(self):
+        """
+        Returns the spans in Chrome trace event format.
+        """
+        events = []
+        threads = dict()
+        with self.lock:
+            spans = list(self.spans)
+        for name, start, end, thread, args in spans:
+            if thread not in threads:
+                threads[thread] = len(threads) + 1
+                events.append(dict(name='thread_name', ph='M', pid=1,
+                                   tid=threads[thread],
+                                   args=dict(name=thread)))
+            events.append(dict(name=name, cat='submit', ph='X', pid=1,
+                               tid=threads[thread],
+                               ts=int((start - self.start) * 1e6),
+                               dur=int((end - start) * 1e6), args=args))
+        return dict(traceEvents=events, displayTimeUnit='ms',
+                    otherData=dict(name=self.name, start=self.start,
+                                   counts=self.counts))
+
+    def save(self, trace_dir=None, log_path=None, keep_traces=None,
+             log_size=None):
+        """
+        Writes the trace to trace_dir, keeping the newest keep_traces, and
+        appends the span durations to the log at log_path. The log is only
+        cut back to the newest log_size entries once it's grown to about
+        twice that. Returns the trace path, or None if disabled.
+        """
+        if not self.enabled:
+            return None
+        trace_dir = trace_dir or os.path.join(CACHE_DIR, 'traces')
+        log_path = log_path or os.path.join(CACHE_DIR, 'nuke_submit_profile.jsonl')
+        keep_traces = keep_traces or PROFILE_TRACES
+        log_size = log_size or PROFILE_LOG_SIZE
+
+        stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(self.start))
+        name = re.sub(r'[^\w.-]', '_', self.name)
+        trace_path = os.path.join(trace_dir, '%s_%s.json' % (stamp, name))
+        _write_json_atomic(trace_path, self.trace())
+        traces = sorted(glob.glob(os.path.join(trace_dir, '*.json')),
+                        key=os.path.getmtime)
+        for path in traces[:-keep_traces]:
+            os.remove(path)
+
+        durations = self.durations()
+        durations['total'] = max([x[2] for x in self.spans] or [self.start]) - \
+                             self.start
+        line = json.dumps(dict(time=self.start, name=self.name,
+                               spans=durations, counts=self.counts)) + '\n'
+        log_dir = os.path.dirname(log_path)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        f = open(log_path, 'a')
+        try:
+            f.write(line)
+        finally:
+            f.close()
+        if os.path.getsize(log_path) > 2 * log_size * len(line):
+            _trim_lines(log_path, log_size)
+        return trace_path
+
+def _trim_lines(path, count):
+    """
+    Cuts the file at path back to its last count lines.
+    """
+    f = open(path)
+    try:
+        lines = f.readlines()
+    finally:
+        f.close()
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    f = open(tmp_path, 'w')
+    try:
+        f.writelines(lines[-count:])
+    finally:
+        f.close()
+    os.remove(path)
+    os.rename(tmp_path, path)
+
+def profile_percentiles(log_path=None, percentiles=(50, 90, 99)):
+    """
+    Returns {span name: {percentile: seconds}} over the submissions in the
+    profile log.
+    """
+    log_path = log_path or os.path.join(CACHE_DIR, 'nuke_submit_profile.jsonl')
+    samples = dict()
+    try:
+        f = open(log_path)
+    except (IOError, OSError):
+        return dict()
+    try:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            for name, seconds in entry['spans'].items():
+                samples.setdefault(name, []).append(seconds)
+    finally:
+        f.close()
+    result = dict()
+    for name, values in samples.items():
+        values.sort()
+        result[name] = dict(
+            (p, values[min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1)])
+            for p in percentiles)
+    return result
+
+def format_profile(percentiles):
+    """
+    Returns profile_percentiles() as a table, slowest spans first.
+    """
+    if not percentiles:
+        return 'No submissions profiled yet.'
+    columns = sorted(list(percentiles.values())[0])
+    lines = ['%-20s %s' % ('span', ' '.join('%9s' % ('p%d' % x,) for x in columns))]
+    for name in sorted(percentiles, key=lambda x: -percentiles[x][columns[-1]]):
+        lines.append('%-20s %s' % (name, ' '.join(
+            '%8.3fs' % (percentiles[name][x],) for x in columns)))
+    return '\n'.join(lines)
+
+# expressions whose value can change without the script changing, which are
+# always evaluated again
+_VOLATILE_RE = re.compile(r'\b(python|getenv|env|clock|date|random|frame)\b')
+
+class PreparedScript(object):
+    """
+    What PrepCache remembers about the last time a script was prepared for
+    the same Write nodes, checked against the script as it is now:
+
+    * masks, the upstream_masks() of the Write nodes, if none of the nodes
+      they cover has changed its inputs, expression links or children.
+    * the frozen value of each expression, reused by freeze() if the knob,
+      its node, its group, the nodes it refers to and the Root are all
+      unchanged.
+    * the paths of the scripts written, reused if the same nodes and values
+      are written from an unchanged file.
+    """
+    def __init__(self, script, key, entry=None):
+        self.script = script
+        self.key = key
+        self.masks = None
+        self.reused = 0
+        self.evaluated = 0
+        self.frozen = dict()
+        self.outputs = dict()
+        self._edges = None
+        self._fingerprints = dict()
+        entry = entry or dict()
+        self._masks = entry.get('masks')
+        self._values = entry.get('values', dict())
+        self._outputs = entry.get('outputs', dict())
+        fingerprints = entry.get('fingerprints')
+        if fingerprints and all(self.fingerprint(name) == fingerprint
+                                for name, fingerprint in fingerprints.items()):
+            self.masks = self._masks
+
+    def fingerprint(self, name):
+        """
+        Returns a hash of what the named node depends on, or None if it's no
+        longer in the script.
+        """
+        if name in self._fingerprints:
+            return self._fingerprints[name]
+        if self._edges is None:
+            self._edges = self.script.graph().edges
+        fingerprint = None
+        if name in self.script.by_name:
+            deps = '\n'.join(sorted(self._edges.get(name, ())))
+            fingerprint = hashlib.md5(deps.encode('utf-8')).hexdigest()
+        self._fingerprints[name] = fingerprint
+        return fingerprint
+
+    def context(self, node, value):
+        """
+        Returns a hash of everything an expression's frozen value depends
+        on, or None if it can't be cached.
+        """
+        if _VOLATILE_RE.search(value):
+            return None
+        script = self.script
+        digests = [value, node.digest]
+        if script.root is not None:
+            digests.append(script.root.digest)
+        if node.parent is not None:
+            digests.append(script.nodes[node.parent].digest)
+        for name in sorted(node.refs or ()):
+            digests.append(script.by_name[name].digest)
+        return hashlib.md5('\n'.join(digests).encode('utf-8')).hexdigest()
+
+    def freezer(self, evaluate):
+        """
+        Wraps an evaluate function for NukeScript.freeze() so that only
+        expressions whose context changed are evaluated.
+        """
+        def freeze(node, knob_name, value):
+            key = '%s %s' % (node.full_name, knob_name)
+            context = self.context(node, value)
+            cached = self._values.get(key)
+            if context is not None and cached is not None and \
+               cached[0] == context:
+                self.reused += 1
+                frozen = cached[1]
+            else:
+                self.evaluated += 1
+                frozen = evaluate(node, knob_name, value)
+            if context is not None:
+                self.frozen[key] = [context, frozen]
+            return frozen
+        return freeze
+
+    def output_key(self, keep, values, gizmos, view, extra_name):
+        digest = hashlib.md5()
+        for part in ([self.script.digest, str(gizmos is not None), view or '',
+                      extra_name or ''] + sorted(keep) +
+                     ['%s %s %s' % (x[0][0], x[0][1], x[1])
+                      for x in sorted(values.items())]):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\n')
+        return digest.hexdigest()
+
+    def output(self, key):
+        """
+        Returns the path of the script written last time for the given
+        output_key(), if it's still there.
+        """
+        path = self._outputs.get(key)
+        if path is not None and os.path.exists(path):
+            self.outputs[key] = path
+            return path
+        return None
+
+    def changed(self):
+        """
+        Returns True if anything differs from what was loaded, so the entry
+        needs saving.
+        """
+        return self.masks is not self._masks or \
+            self.frozen != self._values or self.outputs != self._outputs
+
+    def entry(self):
+        masks = self.masks or dict()
+        return dict(time=time.time(), masks=masks,
+                    fingerprints=dict((x, self.fingerprint(x)) for x in masks),
+                    values=self.frozen, outputs=self.outputs)
+
+class PrepCache(object):
+    """
+    An on-disk record of how each script was last prepared for each set of
+    Write nodes, so a resubmit only redoes the parts of the script that
+    changed. For example:
+
+    prepared = PREP_CACHE.get(script, [['Write1']])
+    path = prepare_script(script, ['Write1'], freezer, prepared=prepared)
+    PREP_CACHE.save(prepared)
+
+    Only the most recently changed max_entries scripts and Write sets are
+    kept.
+    """
+    def __init__(self, path, max_entries=20):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def _load(self):
+        if self.entries is None:
+            self.entries = _read_json(self.path, dict())
+        return self.entries
+
+    def _save(self):
+        _write_json_atomic(self.path, self.entries)
+
+    def key(self, script_path, groups):
+        return '%s|%s' % (os.path.abspath(script_path),
+                          ';'.join(','.join(x) for x in groups))
+
+    def get(self, script, groups):
+        """
+        Returns a PreparedScript for the given parsed script and groups of
+        Write node names, holding whatever is still valid from last time.
+        """
+        key = self.key(script.path, groups)
+        entry = None
+        if self.max_entries:
+            with self.lock:
+                entry = self._load().get(key)
+        return PreparedScript(script, key, entry)
+
+    def save(self, prepared):
+        """
+        Records a PreparedScript once its scripts have been written. An
+        entry that was reused unchanged isn't written again.
+        """
+        if not self.max_entries or not prepared.changed():
+            return
+        entry = prepared.entry()
+        with self.lock:
+            entries = self._load()
+            entries[prepared.key] = entry
+            for key in sorted(entries, key=lambda x: entries[x]['time'])[
+                    :-self.max_entries]:
+                del entries[key]
+            try:
+                self._save()
+            except (IOError, OSError):
+                pass
+
+    def clear(self):
+        with self.lock:
+            self._load().clear()
+            try:
+                self._save()
+            except (IOError, OSError):
+                pass
+
+PREP_CACHE = PrepCache(os.path.join(CACHE_DIR, 'nuke_prep_cache.json'),
+                       PREP_CACHE_SIZE)
+
+def _freeze_script(script, write_names, evaluate, keep, profiler,
+                   prepared=None):
+    if keep is None:
+        with profiler.span('prune'):
+            keep = script.graph().upstream_names(write_names)
+    with profiler.span('freeze') as span:
+        if prepared is not None:
+            evaluate = prepared.freezer(evaluate)
+        values = script.freeze(evaluate, keep)
+        span.set(knobs=len(values))
+    if prepared is not None:
+        profiler.count('expressions_reused', prepared.reused)
+    profiler.count('nodes_total', len(script.nodes))
+    profiler.count('nodes_kept', len(keep))
+    return keep, values
+
+def _write_cloud_script(script, keep, values, gizmos, profiler, view=None,
+                        extra_name=None, prepared=None):
+    """
+    Writes the pruned, frozen script next to the original in cloud_submit,
+    named after its contents (and extra name and view), so resubmitting an
+    unchanged script reuses the one already written. Returns the path.
+    """
+    output_key = None
+    if prepared is not None:
+        output_key = prepared.output_key(keep, values, gizmos, view,
+                                         extra_name)
+        path = prepared.output(output_key)
+        if path is not None:
+            profiler.count('scripts_reused')
+            return path
+    path = _write_new_script(script, keep, values, gizmos, profiler, view,
+                             extra_name)
+    if prepared is not None:
+        prepared.outputs[output_key] = path
+    return path
+
+def _write_new_script(script, keep, values, gizmos, profiler, view,
+                      extra_name):
+    extra_name = '_'.join(x for x in (extra_name, view) if x) or None
+    with profiler.span('generate_script_path'):
+        tmp_path = generate_script_path(extra_name, script.path) + '.tmp'
+    with profiler.span('write', path=tmp_path, view=view):
+        script.write(tmp_path, keep=keep, values=values, gizmos=gizmos,
+                     view=view)
+    profiler.count('bytes_written', os.path.getsize(tmp_path))
+    with profiler.span('hash_script'):
+        content_hash = hash_file(tmp_path, 'md5')
+    path = generate_script_path(extra_name, script.path, content_hash)
+    if os.path.exists(path) and hash_file(path, 'md5') == content_hash:
+        os.remove(tmp_path)
+        return path
+    if os.path.exists(path):
+        # a different script with the same short hash, fall back to a
+        # time-based name
+        path = generate_script_path(extra_name, script.path)
+        if os.path.exists(path):
+            os.remove(path)
+    os.rename(tmp_path, path)
+    return path
+
+def prepare_script(script, write_names, evaluate, keep=None, path=None,
+                   gizmos=None, profiler=None, prepared=None):
+    """
+    Writes the cloud version of a parsed script: only the nodes upstream of
+    the given Write nodes, with expressions frozen by evaluate. keep may be
+    given to override the pruning, and a GizmoLibrary to expand gizmos into
+    Groups. Each step is timed by the profiler, if given. A PreparedScript
+    from PREP_CACHE may be given to reuse the values frozen, and the script
+    written, the last time. Returns the path written to.
+    """
+    if profiler is None:
+        profiler = Profiler('prepare_script', enabled=False)
+    keep, values = _freeze_script(script, write_names, evaluate, keep,
+                                  profiler, prepared)
+    if path is not None:
+        with profiler.span('write', path=path):
+            script.write(path, keep=keep, values=values, gizmos=gizmos)
+        profiler.count('bytes_written', os.path.getsize(path))
+        return path
+    return _write_cloud_script(script, keep, values, gizmos, profiler,
+                               prepared=prepared)
+
+def prepare_view_scripts(script, write_names, evaluate, views, keep=None,
+                         gizmos=None, profiler=None, prepared=None):
+    """
+    Like prepare_script(), but writes one script per view with %v and %V
+    substituted, from a single pass of pruning and freezing. Returns a list
+    of (view, path).
+    """
+    if profiler is None:
+        profiler = Profiler('prepare_view_scripts', enabled=False)
+    keep, values = _freeze_script(script, write_names, evaluate, keep,
+                                  profiler, prepared)
+    return [(view, _write_cloud_script(script, keep, values, gizmos,
+                                       profiler, view, prepared=prepared))
+            for view in views]
+
+def prepare_split_scripts(script, groups, evaluate, views=None, masks=None,
+                          gizmos=None, profiler=None, prepared=None):
+    """
+    Writes a separate cloud script for each group of Write node names, and
+    for each view if views are given. The union of everything the groups
+    need is frozen once, and each script keeps only its own group's part.
+    masks may be given from DependencyGraph.upstream_masks(groups). Returns
+    a list of (write names, view, path).
+    """
+    if profiler is None:
+        profiler = Profiler('prepare_split_scripts', enabled=False)
+    if masks is None:
+        with profiler.span('prune'):
+            masks = script.graph().upstream_masks(groups)
+    keep, values = _freeze_script(script, None, evaluate, set(masks),
+                                  profiler, prepared)
+    scripts = []
+    for i, write_names in enumerate(groups):
+        bit = 1 << i
+        group_keep = set(x for x, mask in masks.items() if mask & bit)
+        for view in views or [None]:
+            path = _write_cloud_script(script, group_keep, values, gizmos,
+                                       profiler, view, '-'.join(write_names),
+                                       prepared)
+            scripts.append((write_names, view, path))
+    return scripts
+
+# TCL commands whose result only depends on their arguments. An expression
+# made of these, whose [value] references all name root or another node
+# by name, gives the same result on every node in the same group.
+_SHARED_COMMANDS = frozenset(('value', 'file', 'string', 'frame', 'format',
+                              'join', 'split', 'lindex', 'lrange', 'regsub',
+                              'getenv', 'date', 'clock', 'expr'))
+# names a [value] reference can start with that resolve from the node
+_NODE_RELATIVE_NAMES = frozenset(('this', 'parent', 'node', 'topnode'))
+_TCL_COMMAND_RE = re.compile(r'\[\s*([^\s\[\]]+)(\s+[^\s\[\]]+)?')
+_INPUT_NAME_RE = re.compile(r'input\d*$')
+
+def _node_relative(text):
+    """
+    Returns whether an expression may give a different result on each node
+    it's evaluated on. Only expressions that reference root or other nodes
+    by name, and nothing else, are taken to be the same everywhere.
+    """
+    for command, arg in _TCL_COMMAND_RE.findall(text):
+        if command not in _SHARED_COMMANDS:
+            return True
+        if command != 'value':
+            continue
+        arg = arg.strip()
+        if '.' not in arg or arg.startswith('-'):
+            # a knob on the node itself
+            return True
+        name = arg.split('.', 1)[0]
+        if name in _NODE_RELATIVE_NAMES or _INPUT_NAME_RE.match(name):
+            return True
+    return False
+
+class ExpressionFreezer(object):
+    """
+    Wraps an evaluate function for NukeScript.freeze() so that each distinct
+    expression is only evaluated once. Knobs are grouped by expression text
+    and context: Write paths by the whole expression, other file knobs by
+    their directory, since only that is frozen. Only expressions that refer
+    to root or to other nodes by name are shared by every node in the same
+    group; anything else is evaluated for each node.
+    """
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+        self.cache = dict()
+        self.expressions = 0
+        self.evaluations = 0
+
+    def skipped(self):
+        return self.expressions - self.evaluations
+
+    def summary(self):
+        return 'froze %d expressions with %d evaluations (%d skipped)' % (
+            self.expressions, self.evaluations, self.skipped())
+
+    def key(self, node, value):
+        whole = node.cls == 'Write'
+        text = value
+        if not whole:
+            head = os.path.split(value)[0]
+            if head.count('[') == head.count(']'):
+                text = head
+            else:
+                whole = True
+        if _node_relative(text):
+            context = node.full_name
+        elif node.parent is not None:
+            context = node.full_name.rsplit('.', 1)[0]
+        else:
+            context = ''
+        return whole, text, context
+
+    def __call__(self, node, knob_name, value):
+        self.expressions += 1
+        key = self.key(node, value)
+        whole = key[0]
+        if key in self.cache:
+            frozen = self.cache[key]
+        else:
+            self.evaluations += 1
+            frozen = self.evaluate(node, knob_name, value)
+            if frozen is not None and not whole:
+                frozen = os.path.split(frozen)[0]
+            self.cache[key] = frozen
+        if frozen is None or whole:
+            return frozen
+        return os.path.join(frozen, os.path.split(value)[-1])
+
+def _live_freeze(node, knob_name, value):
+    """
+    Evaluates a script node's expression against the matching node in the
+    open session, without changing it.
+    """
+    live_node = nuke.toNode(node.full_name)
+    if live_node is None:
+        return None
+    return frozen_value(live_node, knob_name)
+
+# first line of a delta payload, once decompressed
+DELTA_HEADER = b'zync-delta 1\n'
+
+def _script_family(path):
+    """
+    Returns the cloud script path with its content hash taken off, which is
+    the same for every version of a script prepared for the same Writes.
+    """
+    return re.sub(r'_\w{6}\.nk$', '', path)
+
+def _gzip_writer(path):
+    # mtime=0 makes the output the same for the same input, so an unchanged
+    # payload has the same hash and is never sent twice
+    return gzip.GzipFile(path, 'wb', compresslevel=6, mtime=0)
+
+def _delta_ops(base_lines, lines):
+    """
+    Yields ('copy', base start, count) and ('insert', [lines]) operations
+    that turn base_lines into lines. Each line that doesn't carry on the
+    current copy is looked up in the base, taking its nearest occurrence at
+    or after the current position so repeated lines like " }" don't break
+    up a run.
+    """
+    index = dict()
+    for i, line in enumerate(base_lines):
+        index.setdefault(line, []).append(i)
+    copy_start, copy_count, pos = None, 0, 0
+    inserts = []
+    for line in lines:
+        if copy_start is not None and pos < len(base_lines) and \
+           base_lines[pos] == line:
+            copy_count += 1
+            pos += 1
+            continue
+        positions = index.get(line)
+        if copy_start is not None:
+            yield 'copy', copy_start, copy_count
+            copy_start = None
+        if positions is None:
+            inserts.append(line)
+            continue
+        if inserts:
+            yield 'insert', inserts
+            inserts = []
+        start = positions[min(bisect.bisect_left(positions, pos),
+                              len(positions) - 1)]
+        copy_start, copy_count, pos = start, 1, start + 1
+    if copy_start is not None:
+        yield 'copy', copy_start, copy_count
+    if inserts:
+        yield 'insert', inserts
+
+def write_script_payload(path, payload_path, base_path=None):
+    """
+    Writes a script gzipped to payload_path, as a line delta against
+    base_path if given, for sending in place of the script. Returns the
+    {'encoding', 'script_sha1', 'script_size', 'base_sha1'} to send with
+    it. The payload is read back to check that it rebuilds the script
+    exactly, and written without the delta if it doesn't.
+    """
+    sha1 = HASH_MANIFEST.digest(path)
+    info = dict(encoding='gzip', script_sha1=sha1,
+                script_size=os.path.getsize(path), base_sha1=None)
+    if base_path is not None:
+        f = open(base_path, 'rb')
+        try:
+            base_lines = f.readlines()
+        finally:
+            f.close()
+        src = open(path, 'rb')
+        dst = _gzip_writer(payload_path)
+        try:
+            dst.write(DELTA_HEADER)
+            for op in _delta_ops(base_lines, src):
+                if op[0] == 'copy':
+                    dst.write(('C %d %d\n' % op[1:]).encode('ascii'))
+                else:
+                    dst.write(('I %d\n' % (len(op[1]),)).encode('ascii'))
+                    dst.writelines(op[1])
+        finally:
+            src.close()
+            dst.close()
+        digest = hashlib.sha1()
+        for line in read_script_payload(payload_path, base_lines):
+            digest.update(line)
+        if digest.hexdigest() == sha1:
+            info.update(encoding='delta',
+                        base_sha1=HASH_MANIFEST.digest(base_path))
+            return info
+
+    src = open(path, 'rb')
+    dst = _gzip_writer(payload_path)
+    try:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    finally:
+        src.close()
+        dst.close()
+    return info
+
+def read_script_payload(payload_path, base=None):
+    """
+    Yields the lines of the script a payload was written from. base is the
+    script a delta was made against, as a path or a list of its lines.
+    """
+    f = gzip.open(payload_path, 'rb')
+    try:
+        first = f.readline()
+        if first != DELTA_HEADER:
+            yield first
+            for line in f:
+                yield line
+            return
+        if isinstance(base, basestring):
+            base_file = open(base, 'rb')
+            try:
+                base = base_file.readlines()
+            finally:
+                base_file.close()
+        while True:
+            op = f.readline()
+            if not op:
+                return
+            kind, args = op.split(None, 1)
+            if kind == b'C':
+                start, count = [int(x) for x in args.split()]
+                for line in base[start:start + count]:
+                    yield line
+            elif kind == b'I':
+                for i in range(int(args)):
+                    yield f.readline()
+            else:
+                raise ValueError('Bad delta operation: %r' % (op,))
+    finally:
+        f.close()
+
+def script_payload(path):
+    """
+    Writes the payload to send for a cloud script next to it: a delta
+    against the last version of the same script sent to ZYNC if there's one
+    from the last DELTA_BASE_DAYS, or else the whole script gzipped.
+    Returns (payload path, details for the upload).
+    """
+    base, fresh = SCRIPT_BASES.get(_script_family(path))
+    base_path = None
+    if base is not None and fresh and base['path'] != path and \
+       os.path.exists(base['path']) and \
+       HASH_MANIFEST.digest(base['path']) == base['sha1']:
+        base_path = base['path']
+    payload_path = path + '.gz'
+    info = write_script_payload(path, payload_path, base_path)
+    info['script_name'] = os.path.basename(path)
+    return payload_path, info
+
+class UploadCancelled(Exception):
+    pass
+
+class ChunkedUploader(object):
+    """
+    Uploads files to UPLOAD_URL in fixed size chunks, sending chunks from
+    several files at once over a pool of persistent connections, one per
+    worker thread. Files are addressed by the sha1 of their contents:
+
+        GET  <url>/<sha1>            {"chunks": [acknowledged chunk indices]}
+        PUT  <url>/<sha1>/<index>    one chunk, with a Content-Range header
+        POST <url>/<sha1>/complete   once every chunk has been acknowledged
+
+    Only chunks the server hasn't acknowledged are sent, so an interrupted
+    upload resumes where it left off. Cloud scripts are sent as payloads
+    from script_payload(), with their encoding in the complete request.
+
+    This protocol is the plugin's own, not part of the ZYNC API: it needs an
+    upload server at UPLOAD_URL that ZYNC can fetch <url>/<sha1> from.
+    submit_job is then given that URL in place of the local script, with
+    files_uploaded set so it doesn't send the files again, and a compressed
+    script's script_payload() details as script_payload.
+    """
+    def __init__(self, url, chunk_size=None, workers=None, retries=3,
+                 backoff=1.0, headers=None, timeout=60):
+        parsed = urlparse.urlparse(url)
+        self.scheme = parsed.scheme
+        self.netloc = parsed.netloc
+        self.base_path = parsed.path.rstrip('/')
+        self.chunk_size = chunk_size or UPLOAD_CHUNK_SIZE
+        self.workers = workers or UPLOAD_THREADS
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = headers or dict()
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            if self.scheme == 'https':
+                conn = httplib.HTTPSConnection(self.netloc, timeout=self.timeout)
+            else:
+                conn = httplib.HTTPConnection(self.netloc, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def _request(self, method, path, body=None, headers=None, ok=(200, 201, 204)):
+        """
+        Makes a request on this thread's connection, retrying with backoff
+        and reconnecting after errors. Returns (status, body).
+        """
+        all_headers = dict(self.headers)
+        all_headers.update(headers or dict())
+        url = '%s/%s' % (self.base_path, path)
+
+        def attempt():
+            conn = self._connection()
+            try:
+                conn.request(method, url, body, all_headers)
+                response = conn.getresponse()
+                data = response.read()
+            except Exception:
+                conn.close()
+                self.local.conn = None
+                raise
+            if response.status not in ok:
+                raise IOError('%s %s failed: %d %s' % (method, url,
+                                                       response.status,
+                                                       response.reason))
+            return response.status, data
+
+        return retry(attempt, self.retries, self.backoff)[0]
+
+    def acknowledged(self, digest):
+        """
+        Returns the set of chunk indices of a file the server already has.
+        """
+        status, data = self._request('GET', digest, ok=(200, 404))
+        if status == 404:
+            return set()
+        return set(json.loads(data.decode('utf-8')).get('chunks', []))
+
+    def upload(self, paths, progress=None, cancelled=None, details=None):
+        """
+        Uploads the given files and returns their {path: sha1}. progress is
+        called with (bytes sent, bytes to send) as chunks are acknowledged,
+        and cancelled is polled between chunks. details may give a dict for
+        any of the paths to add to its complete request.
+        """
+        files = dict()
+        digests = dict()
+        for path in paths:
+            digest = HASH_MANIFEST.digest(path)
+            digests[path] = digest
+            files.setdefault(digest, (path, os.path.getsize(path)))
+        file_list = sorted(files.items())
+
+        acked = parallel_map(lambda x: self.acknowledged(x[0]), file_list,
+                             self.workers)
+        work = []
+        for (digest, (path, size)), done in zip(file_list, acked):
+            num_chunks = max(1, (size + self.chunk_size - 1) // self.chunk_size)
+            for index in range(num_chunks):
+                if index not in done:
+                    work.append((digest, path, size, index))
+
+        state = dict(sent=0)
+        total = sum(min(self.chunk_size, x[2] - x[3] * self.chunk_size)
+                    for x in work)
+        lock = threading.Lock()
+
+        def send(item):
+            digest, path, size, index = item
+            if cancelled is not None and cancelled():
+                raise UploadCancelled()
+            start = index * self.chunk_size
+            f = open(path, 'rb')
+            try:
+                f.seek(start)
+                chunk = f.read(self.chunk_size)
+            finally:
+                f.close()
+            end = start + len(chunk) - 1
+            headers = {'Content-Type': 'application/octet-stream',
+                       'Content-Range': 'bytes %d-%d/%d' % (start, max(start, end), size)}
+            self._request('PUT', '%s/%d' % (digest, index), chunk, headers)
+            with lock:
+                state['sent'] += len(chunk)
+                if progress is not None:
+                    progress(state['sent'], total)
+
+        parallel_map(send, work, self.workers)
+
+        def complete(item):
+            digest, (path, size) = item
+            body = dict((details or dict()).get(path, dict()))
+            body.update(path=path, size=size)
+            body = json.dumps(body).encode('utf-8')
+            self._request('POST', '%s/complete' % (digest,), body,
+                          {'Content-Type': 'application/json'})
+        parallel_map(complete, file_list, self.workers)
+        return digests
+
+class Submission(object):
+    """
+    A prepared script waiting to be sent to ZYNC, with the estimated cost of
+    a frame for calibrating against the job's real timings. Scripts split by
+    view or by Write are given as jobs, a list of (write names, view, path,
+    params), and are sent as sibling jobs under the parent_id in params, or
+    under one from create_parent_job().
+    """
+    def __init__(self, script_path, write_names, params, username, password,
+                 sequences=None, estimate=None, profiler=None, jobs=None,
+                 frame_outputs=None):
+        self.jobs = jobs or [(write_names, None, script_path, params)]
+        self.script_path = self.jobs[0][2]
+        self.write_names = write_names
+        self.params = params
+        self.username = username
+        self.password = password
+        self.sequences = sequences or []
+        self.estimate = estimate
+        # {script path: (frame_fingerprints() outputs, frames)} to record
+        # once each job has rendered
+        self.frame_outputs = frame_outputs or dict()
+        self.results = []
+        # the job the jobs went in under, if any
+        self.parent_id = None
+        self.profiler = profiler or Profiler(str(self), enabled=False)
+        self.result = None
+
+    def __str__(self):
+        return os.path.basename(self.script_path)
+
+class SubmitQueue(object):
+    """
+    Sends prepared submissions to ZYNC one at a time on a worker thread, so
+    Nuke stays responsive while logging in and uploading. Progress is shown
+    in a progress task that can cancel the submission between stages, and
+    results and errors are reported on the main thread.
+    """
+    def __init__(self):
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add(self, submission):
+        """
+        Queues a submission, starting the worker thread if needed.
+        """
+        self.pending.put(submission)
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run,
+                                               name='zync-submit')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def cancel_pending(self):
+        """
+        Drops every submission that hasn't started yet.
+        """
+        dropped = []
+        while True:
+            try:
+                dropped.append(self.pending.get_nowait())
+            except queue.Empty:
+                return dropped
+
+    def _run(self):
+        while True:
+            with self.lock:
+                try:
+                    submission = self.pending.get_nowait()
+                except queue.Empty:
+                    self.thread = None
+                    return
+            self._send(submission)
+
+    def _report(self, msg):
+        nuke.executeInMainThread(nuke.message, args=(msg,))
+
+    def _send(self, submission):
+        task = nuke.ProgressTask('ZYNC Submit: %s' % (submission,))
+        state = dict(task=task)
+
+        def login():
+            ZYNC_SESSION.login(submission.username, submission.password)
+            submission.password = None
+
+        def upload():
+            if not UPLOAD_URL:
+                return
+            scripts = [x[2] for x in submission.jobs]
+            details = dict()
+            payloads = dict()
+            if COMPRESS_SCRIPTS:
+                with submission.profiler.span('compress_scripts') as span:
+                    for path in scripts:
+                        payload_path, info = script_payload(path)
+                        details[payload_path] = info
+                        payloads[path] = payload_path
+                    span.set(deltas=len([x for x in details.values()
+                                         if x['encoding'] == 'delta']))
+                submission.profiler.count('script_bytes',
+                                          sum(x['script_size'] for x in details.values()))
+                submission.profiler.count('payload_bytes',
+                                          sum(os.path.getsize(x) for x in details))
+                scripts = sorted(details)
+            files = scripts + sequence_files(submission.sequences)
+            with submission.profiler.span('hash_files', files=len(files)):
+                changed = HASH_MANIFEST.changed(files)
+            submission.profiler.count('files_uploaded', len(changed))
+            submission.profiler.count('bytes_uploaded',
+                                      sum(os.path.getsize(x) for x in changed))
+            def progress(sent, total):
+                state['task'].setProgress(10 + int(80 * sent / max(1, total)))
+            uploader = ChunkedUploader(UPLOAD_URL, headers={
+                'X-Zync-Key': API_KEY, 'X-Zync-User': submission.username})
+            try:
+                uploader.upload(changed, progress, state['task'].isCancelled,
+                                details)
+                HASH_MANIFEST.mark_sent(changed)
+            finally:
+                HASH_MANIFEST.save()
+            # what each job's script went up as, for submit_job to point at
+            # instead of sending it again, with how to decode a payload
+            state['uploaded'] = dict()
+            for path in [x[2] for x in submission.jobs]:
+                sent = payloads.get(path, path)
+                state['uploaded'][path] = ('%s/%s' % (
+                    UPLOAD_URL.rstrip('/'), HASH_MANIFEST.digest(sent)),
+                    details.get(sent))
+            # the next version of each script can be sent as a delta
+            # against this one
+            for path, payload_path in payloads.items():
+                SCRIPT_BASES.set(_script_family(path), dict(
+                    path=path, sha1=details[payload_path]['script_sha1']))
+
+        def submit():
+            parent_id = submission.params.get('parent_id')
+            if parent_id is None and len(submission.jobs) > 1:
+                parent_id = create_parent_job(submission.username,
+                                              submission.params)
+            submission.parent_id = parent_id
+            submission.results = []
+            for write_names, view, script_path, params in submission.jobs:
+                params = dict(params)
+                if parent_id is not None:
+                    params['parent_id'] = parent_id
+                script_ref = script_path
+                if script_path in state.get('uploaded', ()):
+                    # the script and its files are already up, so ZYNC is
+                    # given the upload and told not to send them again
+                    script_ref, payload = state['uploaded'][script_path]
+                    params['files_uploaded'] = 1
+                    if payload is not None:
+                        params['script_payload'] = payload
+                submission.result = ZYNC_SESSION.call(submission.username,
+                    'submit_job', 'nuke', script_ref, ','.join(write_names),
+                    params)
+                submission.results.append((write_names, view,
+                                           submission.result))
+                job_id = _job_id(submission.result)
+                if job_id is not None and not params.get('upload_only'):
+                    name = '%s: %s' % (submission, ', '.join(write_names))
+                    if view:
+                        name += ' (%s)' % (view,)
+                    if script_path in submission.frame_outputs:
+                        outputs, frames = submission.frame_outputs[script_path]
+                        # a script may go out as more than one job
+                        frames = set(frames) & set(expand_frames(
+                            params['frange'], params.get('step') or 1))
+                        record_frames(job_id, outputs, frames)
+                    JOB_MONITOR.add(job_id, name, submission.username,
+                                    params, submission.estimate)
+
+        stages = (('Connecting to ZYNC', 0, login),
+                  ('Uploading files', 10, upload),
+                  ('Submitting', 90, submit))
+        profiler = submission.profiler
+        try:
+            for msg, progress, stage in stages:
+                if task.isCancelled():
+                    self._report('ZYNC submission of %s cancelled.' % (submission,))
+                    return
+                waiting = self.pending.qsize()
+                if waiting:
+                    msg = '%s (%d more queued)' % (msg, waiting)
+                task.setMessage(msg)
+                task.setProgress(progress)
+                with profiler.span(stage.__name__):
+                    stage()
+            task.setProgress(100)
+        except zync.ZyncAuthenticationError as e:
+            nuke.executeInMainThread(_clear_credentials)
+            self._report('ZYNC Login Failed:\n\n%s' % (str(e),))
+        except zync.ZyncPreflightError as e:
+            self._report('Preflight Check Failed:\n\n%s' % (str(e),))
+        except UploadCancelled:
+            self._report('ZYNC submission of %s cancelled.' % (submission,))
+        except Exception as e:
+            self._report('ZYNC submission of %s failed:\n\n%s' % (submission, e))
+        else:
+            if len(submission.jobs) > 1:
+                msg = '%d jobs submitted to ZYNC:\n\n%s' % (
+                    len(submission.jobs), '\n'.join(
+                        ', '.join(x[0]) + (' (%s)' % (x[1],) if x[1] else '')
+                        for x in submission.jobs))
+                if submission.parent_id is None:
+                    msg += '\n\nThey went in as separate jobs, since this' \
+                           ' version of the ZYNC API can\'t create a parent' \
+                           ' job (create_parent_job). Give a Parent ID to' \
+                           ' group them.'
+                self._report(msg)
+            else:
+                self._report('Job submitted to ZYNC.')
+        finally:
+            # the progress task closes when it's deleted
+            state.clear()
+            del task
+            try:
+                profiler.save()
+            except (IOError, OSError):
+                pass
 
-def select_deps(nodes):
+def create_parent_job(username, params):
     """
-    Selects all of the dependent nodes for the given list of nodes.
+    Creates an empty parent job to hold a group of sibling jobs, on the
+    logged in session, and returns its ID. Returns None if the ZYNC API
+    can't create one, in which case the jobs are sent without a parent.
     """
-    for node in nodes:
-        for node in get_dependent_nodes(node):
-            node.setSelected(True)
+    client = ZYNC_SESSION.client
+    if client is None or \
+       not callable(getattr(client, 'create_parent_job', None)):
+        return None
+    return _job_id(ZYNC_SESSION.call(username, 'create_parent_job',
+                                     params.get('proj_name')))
 
-def freeze_stereo_node(node, view=None):
+def _job_id(result):
     """
-    Freezes the given stereo node, removes any expressions and creates a L/R
+    Returns the job ID from a submit_job() response, or None.
     """
-    freeze_node(node)
-
-    if view:
-        file_name = node.knob('file').value()
-        file_name = file_name.replace('%v', view.lower())
-        file_name = file_name.replace('%V', view.upper())
+    if isinstance(result, dict):
+        result = result.get('id', result.get('response'))
+    try:
+        return int(result)
+    except (TypeError, ValueError):
+        return None
 
-        node.knob('file').setValue(file_name)
+# job states that won't change again
+JOB_DONE_STATES = ('done', 'complete', 'completed')
+JOB_FAILED_STATES = ('error', 'failed', 'killed', 'cancelled', 'canceled')
 
-def freeze_node(node, view=None):
+class MonitoredJob(object):
     """
-    If the node has an expression, evaluate it so that the ZYNC can
-    parse it. Also accounts for and retains frame number expressions.
-    Should be idempotent.
+    A job submitted from this session, as last seen by the JobMonitor.
     """
-    knob_names = ['file', 'font']
-    for knob_name in knob_names:
-        file_knob = node.knob(knob_name)
-        if file_knob == None:
-            continue
-        knob_value = file_knob.value()
+    def __init__(self, job_id, name, username, params=None, estimate=None,
+                 on_done=None):
+        self.job_id = job_id
+        self.name = name
+        self.username = username
+        self.params = params or dict()
+        self.estimate = estimate
+        self.on_done = on_done
+        self.status = 'submitted'
+        self.info = dict()
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
 
-        # if the file param has an open bracket, let's assume that it's an
-        # expression:
-        if '[' in knob_value:
-            if node.Class() == 'Write':
-                file_knob.setValue(nuke.filename(node))
-            else:
-                frozen_path = file_knob.evaluate()
-                frozen_dir = os.path.split(frozen_path)[0]
-                file_expr = os.path.split(knob_value)[-1]
+    def done(self):
+        return self.status in JOB_DONE_STATES
 
-                # sets the read node to be
-                file_knob.setValue(os.path.join(frozen_dir, file_expr))
+    def failed(self):
+        return self.status in JOB_FAILED_STATES
 
-        if view:
-            knob_value = knob_value.replace('%v', view.lower())
-            knob_value = knob_value.replace('%V', view.upper())
+    def active(self):
+        return not (self.done() or self.failed())
 
-            node.knob(knob_name).setValue(knob_value)
+    def frames(self):
+        try:
+            return len(expand_frames(self.params.get('frange', ''),
+                                     self.params.get('step', 1)))
+        except ValueError:
+            return 0
 
-def gizmos_to_groups(nodes):
-    """
-    If the node is a Gizmo, use makeGroup() to turn it into a Group.
-    """
-    # deselect all nodes. catch errors for nuke versons that don't
-    # support the recurseGroups option.
-    try:
-        node_list = nuke.allNodes(recurseGroups=True)
-    except:
-        node_list = nuke.allNodes()
-    for node in node_list: 
-        node.setSelected(False)
-    for node in nodes:
-        if hasattr(node, 'makeGroup') and callable(getattr(node, 'makeGroup')):
-            node.setSelected(True)
-            node.makeGroup()
-            nuke.delete(node)
+    def render_seconds(self):
+        """
+        Returns the render time ZYNC reported for the job, or else its wall
+        time times its slots, or None if it never started.
+        """
+        if self.info.get('render_seconds'):
+            return float(self.info['render_seconds'])
+        if self.started is None or self.finished is None:
+            return None
+        return (self.finished - self.started) * \
+            max(1, int(self.params.get('num_instances') or 1))
 
-def clear_nodes_by_name(names):
-    """
-    Removes nodes that match any of the names given.
-    """
-    nodes = (x for x in nuke.allNodes())
-    for node in nodes:
-        for name in names:
-            if name in node.name():
-                nuke.delete(node)
+    def __str__(self):
+        elapsed = (self.finished or time.time()) - self.submitted
+        return '%-8s %-10s %6s  %s' % (self.job_id, self.status,
+                                       format_duration(elapsed), self.name)
 
-def clear_callbacks(node):
+def job_status_supported():
     """
-    Call and clear the callbacks on the given node
-
-    WARNING: only supports the create_write_dirs callback
+    Returns whether the logged in ZYNC client can fetch the status of many
+    jobs in one call. Older versions of the API can't, in which case jobs
+    aren't followed at all.
     """
-    names = ('beforeRender', 'beforeFrameRender', 'afterFrameRender', 'afterRender')
-    knobs = (node.knob(x) for x in names)
-    for knob in knobs:
-        knob_val = knob.value()
-        if 'create_write_dirs' in knob_val:
-            try:
-                create_write_dirs(node)
-            except NameError:
-                nuke.callbacks.create_write_dirs(node)
-            knob.setValue('')
+    client = ZYNC_SESSION.client
+    return client is not None and \
+        callable(getattr(client, 'get_job_status', None))
 
-def clear_view(node):
+def fetch_job_statuses(username, job_ids):
     """
-    Sets the node's 'views' knob to left, for maximum ZYNC compatibility.
+    Asks ZYNC for the status of all of the given jobs in a single call, on
+    the logged in session. Returns {job id: status dict}, where each dict
+    has at least a 'status'.
     """
-    if 'views' in node.knobs():
-        node.knob('views').setValue('left')
+    response = ZYNC_SESSION.call(username, 'get_job_status', job_ids)
+    if isinstance(response, dict) and 'response' in response:
+        response = response['response']
+    if isinstance(response, dict):
+        response = [dict(x, id=key) if isinstance(x, dict) else
+                    dict(id=key, status=x) for key, x in response.items()]
+    statuses = dict()
+    for entry in response or ():
+        job_id = _job_id(entry)
+        if job_id is not None:
+            statuses[job_id] = entry
+    return statuses
 
-def is_stereo(node):
-    """
-    If the node is stereo (i.e. has %v or %V in the path)
+class JobMonitor(object):
     """
-    path = node.knob('file').value()
-    return '%v' in path or '%V' in path
+    Follows the jobs submitted from this session on a background thread,
+    fetching the status of every active job in one call per round. Rounds
+    start interval seconds apart and the gap doubles, up to max_interval,
+    while nothing changes; a change or a new job brings it back down.
+    Listeners are called on the main thread with each MonitoredJob whose
+    status changed, and the timings of finished jobs go into the render
+    history to calibrate future estimates. Errors fetching statuses are
+    printed and kept in error until a later round succeeds.
 
-def is_valid(node):
-    """
-    Checks if the readnode is valid: if it has spaces or apostrophes in the
-    name, it's invalid.
+    clock returns the current time, and wait(seconds) blocks until the next
+    round is due or wake() is called. They default to time.time and the
+    wake event.
     """
-    path = node.knob('file').value()
-    return ' ' in path or "'" in path
+    def __init__(self, fetch=None, interval=None, max_interval=None,
+                 main_thread=None, supported=None, clock=None, wait=None):
+        self.fetch = fetch or fetch_job_statuses
+        if supported is None:
+            supported = job_status_supported if fetch is None else \
+                (lambda: True)
+        self.supported = supported
+        self.interval = interval or MONITOR_INTERVAL
+        self.max_interval = max_interval or MONITOR_MAX_INTERVAL
+        self.main_thread = main_thread or nuke.executeInMainThread
+        self.jobs = []
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.clock = clock or time.time
+        self.wait = wait or self.wake_event.wait
+        self.thread = None
+        self.delay = self.interval
+        self.requests = 0
+        self.error = None
+        self.unsupported = False
 
-def stereo_script():
-    for read in (x for x in nuke.allNodes() if x.Class() == 'Read'):
-        if is_stereo(read):
-            return True
-    for write in (x for x in nuke.allNodes() if x.Class() == 'Write'):
-        if is_stereo(write):
-            return True
-        if 'left right' == write.knob('views').value():
-            return True
+    def add_listener(self, listener):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
 
-    return False
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
 
-def preflight(view=None):
-    """
-    Runs a preflight pass on the current nuke scene. Modify as needed.
-    Returning True = success, False = failure
-    """
-    return True
-        
-class PasswordPrompt(nukescripts.panels.PythonPanel):
-    """
-    A hacked-in username/password prompt ui.
-    """
-    def __init__( self, title=None, user_default=None ):
+    def add(self, job_id, name, username, params=None, estimate=None,
+            on_done=None):
         """
-        Initialize the password prompt.
+        Starts following a job, starting the monitor thread if needed.
+        on_done is called with the MonitoredJob, on the monitor thread, if
+        the job finishes successfully. Returns the MonitoredJob, or None if
+        the ZYNC API can't report job statuses.
         """
-        if not title:
-            title = ''
-        super(PasswordPrompt, self).__init__(title)
-
-        self.__password = None
+        if not self.supported():
+            if not self.unsupported:
+                sys.stderr.write('This version of the ZYNC API can\'t report'
+                                 ' job statuses, so jobs won\'t be followed'
+                                 ' from Nuke.\n')
+            self.unsupported = True
+            return None
+        job = MonitoredJob(job_id, name, username, params, estimate, on_done)
+        job.submitted = self.clock()
+        with self.lock:
+            self.jobs.append(job)
+            self.delay = self.interval
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run,
+                                               name='zync-monitor')
+                self.thread.daemon = True
+                self.thread.start()
+        self._notify([job])
+        return job
 
-        self.username = nuke.String_Knob('username', 'Username: ')
-        if user_default != None:
-            self.username.setValue( user_default )
-        try:
-            self.password = nuke.Password_Knob('password', 'Password: ')
-        except Exception:
-            self.password = nuke.String_Knob('password', 'Password: ')
-        self.addKnob(self.username)
-        self.addKnob(self.password)
+    def active(self):
+        with self.lock:
+            return [x for x in self.jobs if x.active()]
 
-    def knobChanged(self, knob):
-        if knob == self.password:
-            self.__password = knob.value()
-            knob.setValue(len(knob.value()) * '*')
+    def clear_finished(self):
+        with self.lock:
+            self.jobs = [x for x in self.jobs if x.active()]
 
-    def get_password(self):
+    def wake(self):
         """
-        Function alias for showModalDialog
+        Checks on the jobs now instead of waiting for the next round.
         """
-        return self.showModalDialog()
+        self.delay = self.interval
+        self.wake_event.set()
 
-    def showModalDialog(self):
+    def poll(self):
         """
-        Puts the PasswordPrompt in a modal dialog box and returns the inputs
+        Fetches the status of every active job, one call per user, and
+        returns the jobs that changed.
         """
-        result = super(PasswordPrompt, self).showModalDialog()
-        if result:
-            return (self.username.value(), self.__password)
-
-class WriteChanges(object):
-    """
-    Given a script to save to, will save all of the changes made in the
-    with block to the script, then undoes those changes in the current
-    script. For example:
-
-    with WriteChanges('/Volumes/af/show/omg/script.nk'):
-        for node in nuke.allNodes():
-            node.setYpos(100)
+        by_user = dict()
+        for job in self.active():
+            by_user.setdefault(job.username, []).append(job)
+        changed = []
+        for username, jobs in by_user.items():
+            self.requests += 1
+            statuses = self.fetch(username, [x.job_id for x in jobs])
+            now = self.clock()
+            for job in jobs:
+                entry = statuses.get(job.job_id)
+                if entry is None:
+                    continue
+                status = str(entry.get('status', job.status)).lower()
+                job.info = entry
+                if status == job.status:
+                    continue
+                job.status = status
+                if status == 'running' and job.started is None:
+                    job.started = now
+                if not job.active():
+                    job.finished = now
+                    if job.started is None:
+                        job.started = job.submitted
+                    self._record(job)
+                changed.append(job)
+        return changed
 
-    FIXME: need to come up with a better name?
-    """
-    def __init__(self, script, save_func=None):
-        """
-        Initialize a WriteChanges context manager.
-        Must provide a script to write to.
+    def _record(self, job):
+        seconds = job.render_seconds()
+        if job.done() and job.estimate and seconds:
+            record_job_timing(job.estimate, job.params.get('instance_type'),
+                              job.frames(), seconds)
+        if job.done() and job.on_done is not None:
+            try:
+                job.on_done(job)
+            except Exception:
+                traceback.print_exc()
 
-        If you provide a save_func, it will be called instead of the default
-        `nuke.scriptSave`. The function must have the same interface as
-        `nuke.scriptSave`. A possible alternative is `nuke.nodeCopy`.
-        """
-        self.undo = nuke.Undo
-        self.__disabled = self.undo.disabled()
-        self.script = script
-        if save_func:
-            self.save_func = save_func
-        else:
-            self.save_func = nuke.scriptSave
+    def _notify(self, jobs):
+        for listener in list(self.listeners):
+            for job in jobs:
+                self.main_thread(listener, args=(job,))
 
-    def __enter__(self):
-        """
-        Enters the with block.
-        NOTE: does not return an object, so assigment using 'as' doesn't work:
-            `with WriteChanges('foo') as wc:`
-        """
-        if self.__disabled:
-            self.undo.enable()
+    def _run(self):
+        while True:
+            with self.lock:
+                if not [x for x in self.jobs if x.active()]:
+                    self.thread = None
+                    return
+            self.wait(self.delay)
+            self.wake_event.clear()
+            try:
+                changed = self.poll()
+            except zync.ZyncAuthenticationError:
+                # the login expired, pick up again from the next submission
+                with self.lock:
+                    self.thread = None
+                return
+            except Exception:
+                # keep trying, backing off, but don't hide it
+                self.error = str(sys.exc_info()[1]) or 'unknown error'
+                sys.stderr.write('Couldn\'t fetch ZYNC job statuses:\n')
+                traceback.print_exc()
+                changed = []
+            else:
+                self.error = None
+            if changed:
+                self.delay = self.interval
+                self._notify(changed)
+            else:
+                self.delay = min(self.delay * 2, self.max_interval)
 
-        self.undo.begin()
+JOB_MONITOR = JobMonitor()
 
-    def __exit__(self, type, value, traceback):
-        """
-        Exits the with block.
+def _clear_credentials():
+    if hasattr(nuke, 'zync_creds'):
+        nuke.zync_creds['user'] = None
+    ZYNC_SESSION.logout()
 
-        First it calls the save_func, then undoes all actions in the with
-        context, leaving the state of the current script untouched.
-        """
-        self.save_func(self.script)
-        self.undo.cancel()
-        if self.__disabled:
-            self.undo.disable()
+SUBMIT_QUEUE = SubmitQueue()
 
 class ZyncRenderPanel(nukescripts.panels.PythonPanel):
     """
@@ -376,11 +4580,12 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
         self.update_write_dict()
 
         # CREATE KNOBS
-        proj_response = ZYNC.get_project_list()
-        if proj_response['code'] != 0:
-            nuke.message(proj_response['response'])
+        try:
+            self.metadata = get_metadata(self.metadata_refreshed)
+        except Exception as e:
+            nuke.message(str(e))
             return
-        self.existing_project = nuke.Enumeration_Knob('existing_project', 'Existing Project:', [' ']+proj_response['response'])
+        self.existing_project = nuke.Enumeration_Knob('existing_project', 'Existing Project:', [' ']+self.metadata['projects'])
 
         self.new_project = nuke.String_Knob('project', ' New Project:')
         self.new_project.clearFlag(nuke.STARTLINE)
@@ -390,6 +4595,12 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
 
         self.parent_id = nuke.String_Knob('parent_id', 'Parent ID:')
         self.parent_id.setValue("")
+        self.parent_id.setTooltip('The ID of a job to submit this one under.'
+                                  ' Jobs split by Write or view go under it'
+                                  ' as siblings. Left empty, they go under a'
+                                  ' new parent job, which needs a version of'
+                                  ' the ZYNC API with create_parent_job, or'
+                                  ' in as separate jobs without one.')
 
         # create shotgun controls - they'll only be added if shotgun integration
         # is enabled.
@@ -416,15 +4627,7 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
 
         self.only_running = nuke.Boolean_Knob('only_running', 'Only Use Running Slots')
 
-        type_list = []
-        non_default = []
-        for inst_type in ZYNC.INSTANCE_TYPES:
-            if inst_type == zync.DEFAULT_INSTANCE_TYPE:
-                type_list.append( '%s (%s)' % ( inst_type, ZYNC.INSTANCE_TYPES[inst_type]["description"] ) )
-            else:
-                non_default.append( '%s (%s)' % ( inst_type, ZYNC.INSTANCE_TYPES[inst_type]["description"] ) )
-        for label in non_default:
-            type_list.append( label ) 
+        type_list = instance_type_labels(self.metadata['instance_types'])
         self.instance_type = nuke.Enumeration_Knob( 'instance_type', 'Type:', type_list )
 
         self.skip_check = nuke.Boolean_Knob('skip_check', 'Skip File Check')
@@ -461,17 +4664,47 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
                 colNum = 1
             else:
                 colNum += 1
-            knob.setTooltip( self.writeDict[writeName].knob("file").value() )
+            knob.setTooltip( WRITE_REGISTRY.file(writeName) )
             self.writeNodes.append( knob )
 
         self.chunk_size = nuke.Int_Knob('chunk_size', 'Chunk Size:')
         self.chunk_size.setDefaultValue((10,))
 
+        self.chunk_order = nuke.Enumeration_Knob('chunk_order', 'Chunk Order:',
+                                                 list(CHUNK_ORDERS))
+        self.chunk_order.setTooltip('feedback renders the first, last and '
+                                    'middle frames a frame per chunk, as a '
+                                    'job of their own before the rest. '
+                                    'Chunks are made smaller if needed to '
+                                    'give every slot one.')
+
+        self.split_writes = nuke.Boolean_Knob('split_writes',
+                                              'Separate Job per Write')
+        self.split_writes.setFlag(nuke.STARTLINE)
+        self.split_writes.setTooltip('submit each Write as its own job. '
+                                     'Writes with the same zync_job knob '
+                                     'share a job, and zync_chunk_size, '
+                                     'zync_priority and zync_num_slots knobs '
+                                     'override the job settings.')
+        self.skip_unchanged = nuke.Boolean_Knob('skip_unchanged',
+                                                'Skip Unchanged Frames')
+        self.skip_unchanged.setFlag(nuke.STARTLINE)
+        self.skip_unchanged.setTooltip('only render frames whose upstream '
+                                       'nodes or input files changed since '
+                                       'they were last rendered on ZYNC, or '
+                                       'whose output is missing')
+
+        self.suggest = nuke.PyScript_Knob('suggest', 'Suggest')
+        self.suggest.setTooltip('estimate the render cost of the selected '
+                                'Write nodes and suggest slots, chunk size '
+                                'and instance type')
+        self.estimate = nuke.Text_Knob('estimate', '', '')
+
         # ADD KNOBS
         self.addKnob(self.existing_project)
         self.addKnob(self.new_project)
         self.addKnob(self.parent_id)
-        if "shotgun" in ZYNC.FEATURES and ZYNC.FEATURES["shotgun"] == 1: 
+        if "shotgun" in self.metadata['features'] and self.metadata['features']["shotgun"] == 1: 
             self.addKnob(self.sg_create_version)
             self.addKnob(self.sg_user)
             self.addKnob(self.sg_project)
@@ -489,30 +4722,85 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
         for k in self.writeNodes:
             self.addKnob( k )
         self.addKnob(self.chunk_size)
+        self.addKnob(self.chunk_order)
+        self.addKnob(self.split_writes)
+        self.addKnob(self.skip_unchanged)
+        self.addKnob(self.suggest)
+        self.addKnob(self.estimate)
 
         # collect render-specific knobs for iterating on later
         self.render_knobs = (self.num_slots, self.instance_type,
                              self.frange, self.fstep, self.chunk_size,
+                             self.chunk_order, self.split_writes,
+                             self.skip_unchanged, self.suggest,
                              self.skip_check, self.only_running, self.priority,
                              self.parent_id)
 
-        if "shotgun" in ZYNC.FEATURES and ZYNC.FEATURES["shotgun"] == 1: 
+        if "shotgun" in self.metadata['features'] and self.metadata['features']["shotgun"] == 1: 
             height = 450
         else:
             height = 350
         self.setMinimumSize( 400, height )
 
+    def suggest_settings(self):
+        """
+        Estimates the per-frame cost of the graph upstream of the selected
+        Write nodes and fills in the suggested slots, chunk size and
+        instance type.
+        """
+        write_nodes = [WRITE_REGISTRY.get(k.label()) for k in self.writeNodes
+                       if k.value()]
+        if not write_nodes:
+            nuke.message('Select at least one Write node.')
+            return
+        try:
+            frames = expand_frames(self.frange.value(), self.fstep.value())
+        except ValueError as e:
+            nuke.message(str(e))
+            return
+        graph = DependencyGraph()
+        estimate = CostEstimate(graph.upstream(graph.upstream_names(write_nodes)))
+        suggestion = suggest_render_settings(estimate.per_frame, len(frames),
+                                             self.metadata['instance_types'])
+
+        self.num_slots.setValue(suggestion['num_slots'])
+        self.chunk_size.setValue(suggestion['chunk_size'])
+        for label in instance_type_labels(self.metadata['instance_types']):
+            if label.startswith(suggestion['instance_type'] + ' '):
+                self.instance_type.setValue(label)
+        self.estimate.setValue('~%s per frame, %s in total (%s)' % (
+            format_duration(suggestion['frame_seconds']),
+            format_duration(suggestion['total_seconds']),
+            ', '.join(estimate.heaviest()) or 'no heavy nodes'))
+
     def update_write_dict(self):
         """ updates self.writeDict """
-        wd = dict()
-        for node in (x for x in nuke.allNodes() if x.Class() == 'Write'):
-            # only put nodes that are not disabled in the write dict
-            if not node.knob('disable').value():
-                wd[node.name()] = node
+        # only nodes that are not disabled are in the write dict
+        self.writeDict = WRITE_REGISTRY.enabled()
+        self.writeListNames = WRITE_REGISTRY.enabled_names()
+
+    def metadata_refreshed(self, metadata):
+        """
+        Called from a background thread with freshly fetched metadata.
+        """
+        nuke.executeInMainThread(self.update_metadata, args=(metadata,))
+
+    def update_metadata(self, metadata):
+        """
+        Updates the project and instance type menus with new metadata,
+        keeping the current selections where they still exist.
+        """
+        self.metadata = metadata
+        project = self.existing_project.value()
+        self.existing_project.setValues([' '] + metadata['projects'])
+        if project in metadata['projects']:
+            self.existing_project.setValue(project)
 
-        self.writeDict.update(wd)
-        self.writeListNames = self.writeDict.keys()
-        self.writeListNames.sort()
+        instance_type = self.instance_type.value()
+        type_list = instance_type_labels(metadata['instance_types'])
+        self.instance_type.setValues(type_list)
+        if instance_type in type_list:
+            self.instance_type.setValue(instance_type)
 
     def get_params(self):
         """
@@ -521,7 +4809,7 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
         params = dict()
         params['num_instances'] = self.num_slots.value()
 
-        for inst_type in ZYNC.INSTANCE_TYPES:
+        for inst_type in self.metadata['instance_types']:
             if self.instance_type.value().startswith( inst_type ):
                 params['instance_type'] = inst_type
 
@@ -534,6 +4822,12 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
         params['frange'] = self.frange.value()
         params['step'] = self.fstep.value()
         params['chunk_size'] = self.chunk_size.value()
+        try:
+            # only checked here, it's split into jobs once they're known
+            plan_frames(params, self.chunk_order.value())
+        except ValueError as e:
+            nuke.message(str(e))
+            return None
         params['upload_only'] = int(self.upload_only.value())
         params['priority'] = int(self.priority.value())
         parent = self.parent_id.value()
@@ -546,7 +4840,7 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
         params['skip_check'] = self.skip_check.value()
         params['notify_complete'] = self.notify_complete.value()
 
-        if "shotgun" in ZYNC.FEATURES and ZYNC.FEATURES["shotgun"] == 1 and self.sg_create_version.value():
+        if "shotgun" in self.metadata['features'] and self.metadata['features']["shotgun"] == 1 and self.sg_create_version.value():
             params['sg_user'] = self.sg_user.value()
             params['sg_project'] = self.sg_project.value()
             params['sg_shot'] = self.sg_shot.value()
@@ -571,109 +4865,209 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
             if not skip_answer:
                 return
 
+        # the cloud script is written from the file on disk, so anything
+        # edited since the panel was opened has to be saved first
+        if nuke.modified():
+            if not nuke.ask('This script has unsaved changes, and ZYNC'
+                            ' renders the version saved on disk. Save it'
+                            ' now and continue?'):
+                return
+            nuke.scriptSave()
+
+        #selected_write = self.writeListNames[int(self.writeNode.getValue())]
+        selected_write_names = [k.label() for k in self.writeNodes if k.value()]
+        # scripts can rename, disable or repoint Writes without the registry
+        # hearing of it, so check the selection against the nodes themselves
+        stale = WRITE_REGISTRY.verify(selected_write_names)
+        if stale:
+            nuke.message('These Write nodes have been renamed, disabled or'
+                         ' deleted since the panel was opened:\n\n%s\n\n'
+                         'Please reopen the panel and submit again.' % (
+                             '\n'.join(stale),))
+            return
+        selected_write_nodes = [WRITE_REGISTRY.get(x)
+                                for x in selected_write_names]
+
         if not username and not password:
-            if hasattr(nuke, 'zync_creds') and nuke.zync_creds.get('user'):
-                # get username and password
-                user = nuke.zync_creds.get('user')
-                pw = nuke.zync_creds.get('pw')
+            user = getattr(nuke, 'zync_creds', dict()).get('user')
+            if user and ZYNC_SESSION.valid(user):
+                # still logged in, so the password isn't needed
+                pw = None
             else:
                 # prompt username and password:
                 msg = 'Enter your ZYNC Render Username/Password'
-                pw_prompt = PasswordPrompt( title=msg, user_default=self.usernameDefault )
+                pw_prompt = PasswordPrompt( title=msg, user_default=user or self.usernameDefault )
                 try:
                     user, pw = pw_prompt.get_password()
                 except Exception:
                     msg = 'You must have a ZYNC account to submit!'
                     raise Exception(msg)
                 else:
-                    nuke.zync_creds = dict(user=user, pw=pw)
+                    nuke.zync_creds = dict(user=user)
+        else:
+            user, pw = username, password
 
-        #selected_write = self.writeListNames[int(self.writeNode.getValue())]
-        selected_write_names = []
-        selected_write_nodes = []
-        for k in self.writeNodes:
-            if k.value():
-                selected_write_names.append( k.label() )
-                selected_write_nodes.append( nuke.toNode( k.label() ) )
-
-        active_viewer = nuke.activeViewer()
-        if active_viewer:
-            viewer_input = active_viewer.activeInput()
-            if viewer_input == None:
-                viewed_node = None
-            else:
-                viewed_node = active_viewer.node().input(viewer_input)
+        profiler = Profiler(os.path.basename(nuke.root().knob('name').getValue()),
+                            enabled=PROFILE_SUBMIT)
+        try:
+            frames = expand_frames(self.frange.value(), self.fstep.value())
+        except ValueError as e:
+            nuke.message(str(e))
+            return
+
+        #
+        #   The script is read from disk, and the current session is left
+        #   untouched. If it was prepared for the same Write nodes before,
+        #   only the parts that changed since are worked out again.
+        #
+        with profiler.span('parse_script'):
+            script = NukeScript(nuke.root().knob('name').getValue())
+        # split jobs are written once per Write, all from the same freeze.
+        # They're sent as sibling jobs.
+        splits = [(selected_write_names, dict())]
+        if self.split_writes.value() and not self.upload_only.value():
+            splits = split_writes(selected_write_nodes)
+        groups = [x[0] for x in splits]
+        prepared = PREP_CACHE.get(script, groups)
+        graph = None
+        with profiler.span('dependency_graph') as span:
+            masks = prepared.masks
+            if masks is None:
+                graph = DependencyGraph()
+                masks = graph.upstream_masks(groups)
+                prepared.masks = masks
+            keep = set(masks)
+            span.set(kept=len(keep), cached=graph is None)
+        if graph is not None:
+            upstream = graph.upstream(keep)
         else:
-            viewer_input, viewed_node = None, None
-
-        new_script = generate_script_path()
-        with WriteChanges(new_script):
-            # The WriteChanges context manager allows us to save the
-            # changes to the current session to the given script, leaving
-            # the current session unchanged once the context manager is
-            # exited.
-            preflight_result = preflight()
-
-            #
-            #   Nuke 7.0v1 through 7.0v8 broke its own undo() functionality, so this will only
-            #   run on versions other than those.
-            #
-            if nuke.NUKE_VERSION_MAJOR != 7 or nuke.NUKE_VERSION_MINOR > 0 or nuke.NUKE_VERSION_RELEASE > 8:
-                #
-                #   Remove all nodes that aren't connected to the Write
-                #   nodes being rendered.
-                #
-                select_deps(selected_write_nodes)
-                for node in nuke.allNodes():
-                    if node.isSelected():
-                        node.setSelected(False)
-                    else:
-                        node.setSelected(True)
-                nuke.nodeDelete()
-                #
-                #   Freeze expressions on all nodes. Catch errors for Nuke
-                #   versions that don't support the recurseGroups option.
-                #
-                try:
-                    node_list = nuke.allNodes(recurseGroups=True)
-                except:
-                    node_list = nuke.allNodes()
-                for node in node_list: 
-                    freeze_node(node)
-            
+            upstream = [x for x in (nuke.toNode(y) for y in keep)
+                        if x is not None]
+        with profiler.span('read_sequences', frames=len(frames)) as span:
+            # the exact files each Read needs on each frame, plus the whole
+            # range of any Read that's only linked by expression
+            table = FramePathTable.build(selected_write_nodes, frames,
+                                         nuke.views())
+            sequences = table.sequences() + read_sequences(
+                [x for x in upstream if _node_key(x) not in table.reached],
+                frames, nuke.views())
+            span.set(files=len(table.paths), unmapped=len(table.unmapped))
+        # includes the time spent answering the preflight dialog, if any
+        with profiler.span('preflight', sequences=len(sequences)):
+            preflight_result = preflight(sequences=sequences)
         if not preflight_result:
             return
+        with profiler.span('check_outputs') as span:
+            outputs = check_outputs(write_sequences(selected_write_nodes,
+                                                    frames, nuke.views()),
+                                    sequences)
+            span.set(directories=len(outputs.directories))
+        if not outputs.ok() and not nuke.ask(
+                'Some Write nodes would overwrite each other\'s files, or '
+                'files the script reads:\n\n%s\n\nSubmit anyway?' % (
+                    outputs.summary(),)):
+            return
+        with profiler.span('create_directories'):
+            try:
+                create_directories(outputs.directories)
+            except OSError as e:
+                if not nuke.ask('Couldn\'t create the output directories:'
+                                '\n\n%s\n\nSubmit anyway?' % (e,)):
+                    return
 
-        # reconnect the viewer
-        if viewer_input != None and viewed_node != None:
-            nuke.connectViewer(viewer_input, viewed_node)
+        #
+        #   Write out only the nodes connected to the Write nodes being
+        #   rendered, with their expressions frozen.
+        #
+        freezer = ExpressionFreezer(_live_freeze)
+        gizmos = GIZMO_LIBRARY if EXPAND_GIZMOS else None
+        # stereo scripts are written once per view, from the same freeze
+        views = nuke.views()
+        if len(views) < 2 or not script.is_stereo(keep):
+            views = None
+        if len(splits) > 1:
+            scripts = prepare_split_scripts(script, groups, freezer, views,
+                                            masks=masks, gizmos=gizmos,
+                                            profiler=profiler,
+                                            prepared=prepared)
+        elif views:
+            scripts = [(selected_write_names, view, path) for view, path in
+                       prepare_view_scripts(script, selected_write_names,
+                                            freezer, views, keep=keep,
+                                            gizmos=gizmos, profiler=profiler,
+                                            prepared=prepared)]
+        else:
+            scripts = [(selected_write_names, None,
+                        prepare_script(script, selected_write_names, freezer,
+                                       keep=keep, gizmos=gizmos,
+                                       profiler=profiler, prepared=prepared))]
+        PREP_CACHE.save(prepared)
+        profiler.count('expressions', freezer.expressions)
+        profiler.count('evaluations', freezer.evaluations)
 
         # exec before render
         #nuke.callbacks.beforeRenders
 
-        try:
-            ZYNC.login( username=user, password=pw )
-        except zync.ZyncAuthenticationError as e:
-            nuke.zync_creds['user'] = None
-            nuke.zync_creds['pw'] = None
-            raise Exception('ZYNC Login Failed:\n\n%s' % (str(e),))
+        render_params = self.get_params()
+        if render_params == None:
+            return
 
-        try:
-            render_params = self.get_params()
-            if render_params == None:
+        jobs = []
+        overrides = dict((tuple(x[0]), x[1]) for x in splits)
+        for write_names, view, path in scripts:
+            params = dict(render_params)
+            params.update(overrides.get(tuple(write_names), dict()))
+            jobs.append((write_names, view, path, params))
+
+        # only render the frames whose fingerprint changed since they were
+        # last rendered, dropping jobs with nothing left to do
+        frame_outputs = dict()
+        if self.skip_unchanged.value() and not self.upload_only.value():
+            with profiler.span('skip_unchanged') as span:
+                script_graph = script.graph()
+                all_views = nuke.views()
+                changed_jobs = []
+                for write_names, view, path, params in jobs:
+                    job_frames = expand_frames(params['frange'],
+                                               params.get('step') or 1)
+                    outputs = []
+                    for name in write_names:
+                        outputs.extend(frame_fingerprints(
+                            script, WRITE_REGISTRY.get(name), job_frames,
+                            [view] if view else all_views, script_graph))
+                    changed = changed_frames(outputs)
+                    if not changed:
+                        continue
+                    if len(changed) < len(job_frames):
+                        params['frange'] = compact_frames(changed)
+                        params['step'] = 1
+                    frame_outputs[path] = (outputs, changed)
+                    changed_jobs.append((write_names, view, path, params))
+                span.set(frames=sum(len(x[1]) for x in frame_outputs.values()))
+            if not changed_jobs:
+                nuke.message('Every frame is up to date, nothing to render.')
                 return
-            ZYNC.submit_job('nuke', new_script, ','.join( selected_write_names ), render_params)
-        except zync.ZyncPreflightError as e:
-            raise Exception('Preflight Check Failed:\n\n%s' % (str(e),))
+            jobs = changed_jobs
+
+        # each job's frames are planned into chunks sized to its slots, sent
+        # as however many jobs the plan takes
+        jobs = [(write_names, view, path, x)
+                for write_names, view, path, params in jobs
+                for x in plan_frames(params, self.chunk_order.value())]
 
-        nuke.message('Job submitted to ZYNC.')
+        # login and upload happen on a worker thread, so the artist can keep
+        # working while the job is sent.
+        SUBMIT_QUEUE.add(Submission(jobs[0][2], selected_write_names,
+                                    render_params, user, pw, sequences,
+                                    CostEstimate(upstream).per_frame,
+                                    profiler, jobs, frame_outputs))
 
     def addToPane(self):
         """
         Does some work to make the ZyncRenderPanel work as a persistent pane:
             * adds persistent Username/Password fields
             * adds a submit button
-            * adds an update UI callback to update the Write node Enum knob
+            * listens to the Write node registry to update the Write node list
         """
         self.user = nuke.String_Knob('user', 'Username')
         self.password = nuke.Password_Knob('password', 'Password')
@@ -686,7 +5080,7 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
         self.addKnob(self.submit)
         super(ZyncRenderPanel, self).addToPane()
 
-        nuke.callbacks.addUpdateUI(self.update_write_dict, nodeClass='Write')
+        WRITE_REGISTRY.add_listener(self.update_write_dict)
 
     def knobChanged(self, knob):
         """
@@ -699,6 +5093,8 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
             if not user or not pw:
                 return None
             self.submit(user, pw)
+        elif knob is self.suggest:
+            self.suggest_settings()
         elif knob is self.upload_only:
             checked = self.upload_only.value()
             for rk in self.render_knobs:
@@ -733,11 +5129,305 @@ class ZyncRenderPanel(nukescripts.panels.PythonPanel):
     
 
 def submit_dialog():
-    global ZYNC
-    if ZYNC == None:
-        try:
-            ZYNC = zync.Zync('nuke_plugin', API_KEY)
-        except Exception as e:
-            nuke.message('Couldn\'t connect to ZYNC. Are you connected to the internet?')
-            return
+    # the panel opens from cached data where it can, so only start the
+    # connection here. It's waited for if the panel or submit needs it.
+    warm_zync()
     ZyncRenderPanel().showModalDialog()
+
+class JobMonitorPanel(nukescripts.panels.PythonPanel):
+    """
+    A pane listing the jobs submitted from this session, kept up to date by
+    JOB_MONITOR.
+
+    Usage as a panel:
+        def addZyncJobs():
+            return zync_nuke.JobMonitorPanel().addToPane()
+        pane.addCommand('ZYNC Jobs', addZyncJobs)
+        nukescripts.registerPanel('com.atomicfiction.zyncJobs', addZyncJobs)
+    """
+    def __init__(self, monitor=None):
+        nukescripts.panels.PythonPanel.__init__(self, 'ZYNC Jobs',
+                                                'com.atomicfiction.zyncJobs')
+        self.monitor = monitor or JOB_MONITOR
+        self.jobs = nuke.Text_Knob('jobs', '', '')
+        self.refresh = nuke.PyScript_Knob('refresh', 'Refresh')
+        self.refresh.setFlag(nuke.STARTLINE)
+        self.clear = nuke.PyScript_Knob('clear', 'Clear Finished')
+        self.addKnob(self.jobs)
+        self.addKnob(self.refresh)
+        self.addKnob(self.clear)
+        self.update_jobs()
+        self.monitor.add_listener(self.job_changed)
+
+    def job_changed(self, job):
+        self.update_jobs()
+
+    def update_jobs(self):
+        with self.monitor.lock:
+            jobs = list(self.monitor.jobs)
+        if self.monitor.unsupported:
+            self.jobs.setValue('This version of the ZYNC API can\'t report'
+                               ' job statuses. Follow your jobs on the'
+                               ' ZYNC web site.')
+            return
+        if not jobs:
+            self.jobs.setValue('No jobs submitted from this session.')
+            return
+        lines = ['%-8s %-10s %6s  %s' % ('job', 'status', 'time', 'name')]
+        lines.extend(str(x) for x in reversed(jobs))
+        if self.monitor.error:
+            lines.append('')
+            lines.append('Couldn\'t check on the jobs: %s' % (
+                self.monitor.error,))
+        self.jobs.setValue('<pre>%s</pre>' % ('\n'.join(lines),))
+
+    def knobChanged(self, knob):
+        if knob is self.refresh:
+            self.monitor.wake()
+            self.update_jobs()
+        elif knob is self.clear:
+            self.monitor.clear_finished()
+            self.update_jobs()
+
+def job_monitor_pane():
+    """
+    Opens the job list as a floating pane that can be docked.
+    """
+    return JobMonitorPanel().addToPane()
+
+#
+#   Batch submission from the command line, for resubmitting many scripts
+#   without the Nuke UI:
+#
+#       nuke -t zync_nuke.py --project myproj /shows/omg/*/comp/*.nk
+#
+
+class BatchJob(object):
+    """
+    A script queued for batch submission and the timings of its stages.
+    """
+    def __init__(self, script_path):
+        self.script_path = script_path
+        self.new_script = None
+        self.write_names = []
+        self.prep_time = 0.0
+        self.submit_time = 0.0
+        self.attempts = 0
+        self.error = None
+        self.warnings = []
+        self.freeze_summary = None
+
+def retry(func, retries=3, backoff=2.0, fatal=()):
+    """
+    Calls func until it succeeds, sleeping with exponential backoff between
+    attempts. Exceptions in fatal are raised straight away. Returns the
+    result and the number of attempts made.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return func(), attempt
+        except fatal:
+            raise
+        except Exception:
+            if attempt > retries:
+                raise
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+def batch_submit(script_paths, params, username, password, write_names=None,
+                 workers=4, retries=3, backoff=2.0, dry_run=False, log=None,
+                 gizmos=None, chunk_order='linear'):
+    """
+    Prunes, freezes and submits each of the given scripts through a pool of
+    worker threads, each with its own ZYNC connection. params are the same
+    job parameters ZyncRenderPanel.get_params() produces; frange defaults to
+    each script's own frame range, and is planned into chunks in the given
+    chunk_order. Gizmos are expanded into Groups if a GizmoLibrary is given.
+    Returns a list of BatchJob.
+    """
+    jobs = [BatchJob(x) for x in script_paths]
+    pending = queue.Queue()
+    for job in jobs:
+        pending.put(job)
+    log_lock = threading.Lock()
+    fatal = (zync.ZyncAuthenticationError, zync.ZyncPreflightError)
+
+    def report(msg):
+        if log is not None:
+            with log_lock:
+                log(msg)
+
+    def connect():
+        client = zync.Zync('nuke_plugin', API_KEY)
+        client.login(username=username, password=password)
+        return client
+
+    def work():
+        client = None
+        while True:
+            try:
+                job = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                start = time.time()
+                script = NukeScript(job.script_path)
+                job.write_names = write_names or \
+                    [x.full_name for x in script.writes()]
+                if not job.write_names:
+                    raise Exception('No enabled Write nodes.')
+                evaluator = ScriptEvaluator(script)
+                freezer = ExpressionFreezer(evaluator.freeze)
+                job.new_script = prepare_script(script, job.write_names,
+                                                freezer, gizmos=gizmos)
+                job.warnings = evaluator.unsupported
+                job.freeze_summary = freezer.summary()
+                job.prep_time = time.time() - start
+
+                job_params = dict(params)
+                if not job_params.get('frange'):
+                    root = script.root
+                    job_params['frange'] = '%s-%s' % (
+                        root.value('first_frame', '1') if root else '1',
+                        root.value('last_frame', '100') if root else '100')
+                planned = plan_frames(job_params, chunk_order)
+
+                start = time.time()
+                if not dry_run:
+                    if client is None:
+                        client = retry(connect, retries, backoff, fatal)[0]
+                    for planned_params in planned:
+                        def submit():
+                            return client.submit_job('nuke', job.new_script,
+                                                     ','.join(job.write_names),
+                                                     planned_params)
+                        job.attempts += retry(submit, retries, backoff,
+                                              fatal)[1]
+                job.submit_time = time.time() - start
+                report('%s %s' % ('Prepared' if dry_run else 'Submitted',
+                                  job.script_path))
+            except Exception as e:
+                job.error = str(e) or e.__class__.__name__
+                report('Failed %s: %s' % (job.script_path, job.error))
+
+    threads = [threading.Thread(target=work)
+               for x in range(max(1, min(workers, len(jobs))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return jobs
+
+def format_batch_summary(jobs):
+    """
+    Returns a table of per-script timings for a batch submission.
+    """
+    lines = ['%-48s %8s %8s %8s  %s' % ('script', 'prep', 'submit',
+                                        'attempts', 'status')]
+    for job in jobs:
+        name = job.script_path
+        if len(name) > 48:
+            name = '...' + name[-45:]
+        status = 'FAILED: %s' % (job.error,) if job.error else 'ok'
+        lines.append('%-48s %7.2fs %7.2fs %8d  %s' % (
+            name, job.prep_time, job.submit_time, job.attempts, status))
+        if job.freeze_summary:
+            lines.append('    %s' % (job.freeze_summary,))
+        for warning in job.warnings:
+            lines.append('    not frozen: %s' % (warning,))
+    total = sum(x.prep_time + x.submit_time for x in jobs)
+    failed = len([x for x in jobs if x.error])
+    lines.append('%d scripts, %d failed, %.2fs total' % (len(jobs), failed, total))
+    return '\n'.join(lines)
+
+def main(argv):
+    """
+    Command line entry point for batch submission.
+    """
+    usage = 'nuke -t %prog [options] script.nk [script.nk ...]'
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option('--project', help='ZYNC project name (required)')
+    parser.add_option('--user', default=os.environ.get('USER') or
+                      os.environ.get('USERNAME'), help='ZYNC username')
+    parser.add_option('--writes', help='comma separated Write nodes to '
+                      'render; defaults to every enabled Write')
+    parser.add_option('--frange', help='frame range; defaults to the '
+                      'range of each script')
+    parser.add_option('--step', type='int', default=1)
+    parser.add_option('--chunk-size', type='int', default=10)
+    parser.add_option('--chunk-order', type='choice', choices=CHUNK_ORDERS,
+                      default='linear', help='order to render chunks in: '
+                      'linear, or feedback (the first, last and middle '
+                      'frames a frame per chunk, ahead of the rest)')
+    parser.add_option('--num-slots', type='int', default=1)
+    parser.add_option('--instance-type', default=zync.DEFAULT_INSTANCE_TYPE)
+    parser.add_option('--priority', type='int', default=50)
+    parser.add_option('--parent-id', type='int',
+                      help='job to submit under. Split jobs otherwise go '
+                      'under a new parent job, if the ZYNC API has '
+                      'create_parent_job, or in separately')
+    parser.add_option('--upload-only', action='store_true', default=False)
+    parser.add_option('--only-running', action='store_true', default=False)
+    parser.add_option('--skip-check', action='store_true', default=False)
+    parser.add_option('--notify-complete', action='store_true', default=False)
+    parser.add_option('--jobs', type='int', default=4,
+                      help='number of scripts to submit at once')
+    parser.add_option('--retries', type='int', default=3)
+    parser.add_option('--backoff', type='float', default=2.0,
+                      help='seconds to wait before the first retry')
+    parser.add_option('--expand-gizmos', action='store_true',
+                      default=EXPAND_GIZMOS, help='write top-level gizmos as Groups')
+    parser.add_option('--dry-run', action='store_true', default=False,
+                      help='write the cloud scripts but don\'t submit them')
+    options, args = parser.parse_args(argv)
+
+    script_paths = []
+    for arg in args:
+        for path in sorted(glob.glob(arg)) or [arg]:
+            path = os.path.abspath(path)
+            if path not in script_paths:
+                script_paths.append(path)
+    if not script_paths:
+        parser.error('no scripts given')
+    if not options.project:
+        parser.error('--project is required')
+
+    params = dict()
+    params['num_instances'] = options.num_slots
+    params['instance_type'] = options.instance_type
+    params['proj_name'] = options.project
+    params['frange'] = options.frange
+    params['step'] = options.step
+    params['chunk_size'] = options.chunk_size
+    params['upload_only'] = int(options.upload_only)
+    params['priority'] = options.priority
+    if options.parent_id is not None:
+        params['parent_id'] = options.parent_id
+    params['start_new_slots'] = int(not options.only_running)
+    params['skip_check'] = int(options.skip_check)
+    params['notify_complete'] = int(options.notify_complete)
+
+    password = None
+    if not options.dry_run:
+        password = os.environ.get('ZYNC_PASSWORD') or \
+            getpass.getpass('ZYNC password for %s: ' % (options.user,))
+
+    write_names = None
+    if options.writes:
+        write_names = [x.strip() for x in options.writes.split(',')]
+
+    def log(msg):
+        print(msg)
+
+    jobs = batch_submit(script_paths, params, options.user, password,
+                        write_names=write_names, workers=options.jobs,
+                        retries=options.retries, backoff=options.backoff,
+                        dry_run=options.dry_run, log=log,
+                        gizmos=GIZMO_LIBRARY if options.expand_gizmos else None,
+                        chunk_order=options.chunk_order)
+    print(format_batch_summary(jobs))
+    return 1 if [x for x in jobs if x.error] else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))